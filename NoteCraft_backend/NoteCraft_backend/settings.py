@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
+import sys
+import tempfile
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
@@ -110,20 +112,77 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'pdf-preview-cache',
         'TIMEOUT': 86400, 
+    },
+    # Shared between web and celery processes (query embeddings, answer cache, ...)
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(BASE_DIR / 'local_data' / 'shared_cache'),
+        'TIMEOUT': 7 * 86400,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('SHARED_CACHE_MAX_ENTRIES', '20000')),
+        },
+    },
+}
+# With Redis configured, web and worker containers share it instead of a local directory
+if os.getenv('SHARED_CACHE_REDIS_URL') or os.getenv('REDIS_URL'):
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('SHARED_CACHE_REDIS_URL') or os.getenv('REDIS_URL'),
+        'TIMEOUT': 7 * 86400,
+        'KEY_PREFIX': 'shared',
     }
+# Tests keep the shared cache in memory, so they never see or leave entries in local_data
+if 'test' in sys.argv:
+    CACHES['shared'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared-test-cache'}
+# Celery: Redis broker + result backend, one queue per workload
+#   interactive - chat side work (conversation summaries), short and latency sensitive
+#   notes       - note generation (topic extraction, section fan-out, merge)
+#   ingest      - bulk PDF / knowledge-base ingestion
+# Each queue gets its own worker profile (concurrency, prefetch), see docker-compose.yaml.
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', REDIS_URL)
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', REDIS_URL)
+CELERY_RESULT_EXPIRES = 24 * 3600
+
+# Eager mode (tasks run inline in the caller, no broker) is for tests only;
+# CELERY_EAGER=True also allows a local run without Redis.
+CELERY_TASK_ALWAYS_EAGER = 'test' in sys.argv or os.getenv('CELERY_EAGER', 'False') == 'True'
+if CELERY_TASK_ALWAYS_EAGER:
+    CELERY_TASK_EAGER_PROPAGATES = True
+    CELERY_TASK_STORE_EAGER_RESULT = True
+    CELERY_BROKER_URL = 'memory://'
+    # Eager results go to a temporary directory so test runs never write into the tree
+    CELERY_EAGER_RESULTS_DIR = Path(os.getenv('CELERY_EAGER_RESULTS_DIR', Path(tempfile.gettempdir()) / 'notecraft_celery_results'))
+    CELERY_EAGER_RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    CELERY_RESULT_BACKEND = 'file:///' + str(CELERY_EAGER_RESULTS_DIR).replace('\\', '/')
+
+CELERY_TASK_DEFAULT_QUEUE = 'interactive'
+CELERY_TASK_ROUTES = {
+    'NoteMaker.tasks.summarize_conversation_task': {'queue': 'interactive'},
+    'NoteMaker.tasks.generate_notes_task': {'queue': 'notes'},
+    'NoteMaker.tasks.generate_section_task': {'queue': 'notes'},
+    'NoteMaker.tasks.merge_notes_task': {'queue': 'notes'},
+    'UserData.tasks.*': {'queue': 'ingest'},
 }
-# CELERY_BROKER_URL = os.getenv('REDIS_URL')
-# CELERY_RESULT_BACKEND = CELERY_BROKER_URL
 
-# Local development settings (No Docker/Redis)
-CELERY_TASK_ALWAYS_EAGER = True
-CELERY_TASK_EAGER_PROPAGATES = True
-CELERY_TASK_STORE_EAGER_RESULT = True
-CELERY_BROKER_URL = 'memory://'
-CELERY_RESULT_BACKEND = 'file:///' + str(BASE_DIR / 'celery_results').replace('\\', '/')
+# Long tasks are acknowledged after they finish, so a killed worker hands them
+# to another one instead of losing them; the interactive queue keeps early acks.
+# ingest_document_task gives up after INGEST_MAX_DELIVERIES, so a PDF that kills
+# its worker isn't redelivered forever.
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+CELERY_TASK_ANNOTATIONS = {
+    'NoteMaker.tasks.summarize_conversation_task': {'acks_late': False},
+}
+# One task at a time per worker process by default; the interactive worker raises it on its command line
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Must exceed the longest acks_late task, or Redis redelivers it while it still runs
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 2 * 3600}
+CELERY_TASK_TRACK_STARTED = True
 
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
+CELERY_RESULT_SERIALIZER = 'json'
 
 
 # Cloudinary configuration
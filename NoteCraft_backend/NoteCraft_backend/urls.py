@@ -18,11 +18,13 @@ from django.contrib import admin
 from django.urls import path
 from NoteMaker.views import *
 from UserData.views import *
+from NoteMaker.async_views import AsyncAskAIView, AsyncModifyTextView, AsyncModifyImageView
 from rest_framework_simplejwt.views import TokenRefreshView
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('hello/', HelloWorldView.as_view()),
     path('generate_note/', GenerateNoteView.as_view()),
+    path('generate_note/stream/', GenerateNoteStreamView.as_view(), name='generate_note_stream'),
     path('modify_image/', ModifyImageView.as_view()),
     path('modify_text/', ModifyTextView.as_view()),
     path('proxy-image/',ProxyImageView.as_view()),
@@ -31,6 +33,7 @@ urlpatterns = [
     path('api/login/', LoginView.as_view(), name='login'),
     path('search_pdfs/',ListDocumentView.as_view()),
     path('ask_ai/', AskAIView.as_view(), name='ask_ai'),
+    path('ask_ai/stream/', AskAIStreamView.as_view(), name='ask_ai_stream'),
     path('conversations/', ConversationListCreateView.as_view(), name='conversation-list-create'),
     path('conversations/<int:id>/', ConversationDetailView.as_view(), name='conversation-detail'),
     path('conversations/<int:conversation_id>/messages/', MessageListView.as_view(), name='message-list'),
@@ -40,4 +43,8 @@ urlpatterns = [
     path('auth-status/', AuthStatusView.as_view(), name="auth-status"),
     path('task_status/<str:task_id>/', TaskStatusView.as_view(), name='task_status'),
     path('cancel_task/', CancelTaskView.as_view(), name='cancel_task'),
+    # Async variants, meant to be served through NoteCraft_backend.asgi
+    path('async/ask_ai/', AsyncAskAIView.as_view(), name='async_ask_ai'),
+    path('async/modify_text/', AsyncModifyTextView.as_view(), name='async_modify_text'),
+    path('async/modify_image/', AsyncModifyImageView.as_view(), name='async_modify_image'),
 ]
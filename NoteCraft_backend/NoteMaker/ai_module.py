@@ -1,20 +1,34 @@
 import os
 import tempfile
 import requests
-import uuid
 from dotenv import load_dotenv
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import ChatOpenAI
 from pinecone import Pinecone
-from django.conf import settings
+from asgiref.sync import sync_to_async
 #from langchain.schema import HumanMessage, SystemMessage
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from .embedding_cache import embed_query, query_embedding_cache
+from .answer_cache import answer_cache
+from .vector_store import get_vector_store
+from .llm_gateway import gateway
+from .retrieval import fan_out_search, hybrid_search, lexical_fast_path, upsert_chunks
+from .namespaces import UPLOAD_NAMESPACE, parse_namespaces
+from .context_packing import pack_context
+from .cancellation import checkpoint
+from .pdf_parsing import ParsedPDF, parse_pdf
+from .embedding_executor import EmbeddingExecutor
+from .chunk_ids import chunk_id, doc_prefix, file_sha256
 load_dotenv()
 
+# Namespaces /ask_ai/ retrieves from ("default" = the default namespace). With more
+# than one, retrieval fans out over all of them in parallel with one shared embedding.
+ASK_AI_NAMESPACES = parse_namespaces(os.getenv("ASK_AI_NAMESPACES", "default"))
+# Uploaded documents are only indexed in UPLOAD_NAMESPACE, the chat must always see them
+if UPLOAD_NAMESPACE not in ASK_AI_NAMESPACES:
+    ASK_AI_NAMESPACES.append(UPLOAD_NAMESPACE)
+ASK_AI_NAMESPACE_QUOTA = int(os.getenv("ASK_AI_NAMESPACE_QUOTA", "3"))
+
 # Initialize Pinecone
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-INDEX_NAME = "teamfight-tactics-knowledges"
 
 if not PINECONE_API_KEY:
     print("Warning: PINECONE_API_KEY not found.")
@@ -26,10 +40,14 @@ else:
         print(f"Error initializing Pinecone: {e}")
         pc = None
 
+# Batched, rate-limited passage embedding shared by both ingestion paths
+embedding_executor = EmbeddingExecutor(pc)
+
 def get_index():
-    if not pc:
-        raise ValueError("Pinecone not initialized")
-    return pc.Index(INDEX_NAME)
+    """
+    Returns the configured VectorStore (Pinecone, local or hybrid, see vector_store.py)
+    """
+    return get_vector_store()
 
 def process_pdf_from_url(pdf_url: str):
     """
@@ -52,144 +70,246 @@ def process_pdf_from_url(pdf_url: str):
         print(f"Error processing PDF from URL: {e}")
         return False
 
-def process_pdf_to_vector_db(pdf_path: str):
+def _fully_indexed(store, doc_hash: str) -> bool:
+    """
+    True when every chunk of the file is stored. Chunks record ``total_chunks``,
+    so this needs only the ids (and one fetch), not a parse.
+    """
+    prefix = doc_prefix(doc_hash)
+    stored = store.list_ids(prefix)
+    if not stored:
+        return False
+    first = store.fetch(stored[:1])
+    total = first[0]["metadata"].get("total_chunks") if first else None
+    if total is None:
+        return False
+    indices = {cid[len(prefix):].split("-", 1)[0] for cid in stored}
+    return all(str(i) in indices for i in range(int(total)))
+
+def process_pdf_to_vector_db(pdf_path: str, cancel_id: str = None, parsed: ParsedPDF = None, on_progress=None):
     """
-    Reads PDF, splits text, and stores in Pinecone
+    Reads PDF, splits text, and stores in Pinecone. ``parsed`` is the output of
+    parse_pdf when the caller already parsed the file. Stops between batches
+    once the task ``cancel_id`` is cancelled; ``on_progress(done, total)`` is
+    called as embedding batches finish.
     """
     if not pc:
         raise ValueError("Pinecone not initialized")
 
     try:
-        # 1. Load PDF
-        loader = PyPDFLoader(pdf_path)
-        documents = loader.load()
-
-        # 2. Split Text
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
+        # Same file already indexed in full: skip the parse, like the upload task does by content_hash
+        doc_hash = file_sha256(pdf_path)
+        store = get_index()
+        if _fully_indexed(store, doc_hash):
+            print(f"{pdf_path} is already in the knowledge base")
+            return True
+
+        # 1. Load PDF and split it into page-aware chunks (one pass)
+        texts = (parsed or parse_pdf(pdf_path)).chunks
+
+        # Content-addressed ids: re-processing the same file overwrites instead of duplicating,
+        # and chunks left over from an interrupted run aren't embedded again
+        ids = [chunk_id(doc_hash, chunk.index, chunk.text) for chunk in texts]
+        stored = store.existing_ids(ids)
+        todo = [i for i, cid in enumerate(ids) if cid not in stored]
+        if not todo:
+            print(f"{pdf_path} is already in the knowledge base")
+            return True
+
+        # 2. Vectorize: full batches embedded concurrently, results in chunk order
+        print(f"Processing {len(todo)} of {len(texts)} chunks for Pinecone...")
+        embeddings = embedding_executor.embed(
+            [texts[i].text for i in todo], "passage",
+            before_batch=lambda: checkpoint(cancel_id), on_progress=on_progress
         )
-        texts = text_splitter.split_documents(documents)
+        checkpoint(cancel_id)
 
-        # 3. Vectorize and Store in Pinecone
-        index = get_index()
-        
-        # Batch process to avoid hitting limits
-        batch_size = 96 
-        print(f"Processing {len(texts)} chunks for Pinecone...")
-        
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i+batch_size]
-            batch_texts = [t.page_content for t in batch]
-            
-            # Generate embeddings using Pinecone Inference API
-            # Using llama-text-embed-v2 as in myutils.py
-            embeddings_response = pc.inference.embed(
-                model="llama-text-embed-v2",
-                inputs=batch_texts,
-                parameters={"input_type": "passage"}
-            )
-            
+        # 3. Store in Pinecone, batched to stay under the upsert request size
+        batch_size = 96
+        for start in range(0, len(todo), batch_size):
             vectors = []
-            for j, embedding_data in enumerate(embeddings_response):
-                doc_id = str(uuid.uuid4())
-                
-                # Prepare metadata
-                metadata = {
-                    "text": batch_texts[j],
-                    "source": batch[j].metadata.get("source", pdf_path),
-                    "page": batch[j].metadata.get("page", 0)
-                }
-                
+            for i, values in zip(todo[start:start+batch_size], embeddings[start:start+batch_size]):
+                # parent_id/chunk_index let context packing merge neighbours
                 vectors.append({
-                    "id": doc_id,
-                    "values": embedding_data['values'],
-                    "metadata": metadata
+                    "id": ids[i],
+                    "values": values,
+                    "metadata": {
+                        "text": texts[i].text,
+                        "source": pdf_path,
+                        "page": texts[i].page,
+                        "parent_id": doc_hash,
+                        "chunk_index": i,
+                        "total_chunks": len(texts)
+                    }
                 })
-            
-            # Upsert to Pinecone (default namespace)
-            index.upsert(vectors=vectors)
-            
+
+            # Upsert to the vector store + lexical index (default namespace), bumps the kb version
+            upsert_chunks(vectors)
+
         print(f"Successfully added {pdf_path} to Pinecone knowledge base")
         return True
     except Exception as e:
         print(f"Error processing PDF: {e}")
         raise e
 
-def query_ai(query: str):
+def _embed_or_fast_path(query: str, top_k: int = 5):
+    """
+    Returns ``(query_embedding, lexical_matches)``. Queries naming a TFT entity are
+    served from the lexical index without an embedding round trip; for those the
+    embedding is only returned if it is already cached.
+    """
+    for namespace in ASK_AI_NAMESPACES:
+        matches = lexical_fast_path(query, namespace=namespace, top_k=top_k)
+        if matches is not None:
+            return query_embedding_cache.get(query), matches
+    if not pc:
+        raise ValueError("Pinecone not initialized")
+    return embed_query(pc, query), None
+
+def _has_history(history) -> bool:
+    return bool(history and (history["summary"] or history["turns"]))
+
+def _lookup_answer(query_embedding, history=None):
+    # Follow-up questions depend on the conversation, a cached answer to the same words may not fit
+    if query_embedding is None or _has_history(history):
+        return None
+    return answer_cache.lookup(query_embedding)
+
+def _store_answer(query_embedding, answer: str, retrieved: dict, history=None) -> None:
+    if query_embedding is not None and not _has_history(history):
+        answer_cache.store(query_embedding, answer, retrieved["sources"], retrieved["chunk_ids"])
+
+def _retrieve_context(query: str, query_embedding, matches=None, top_k: int = 5) -> dict:
+    """
+    Runs retrieval (unless the lexical fast path already produced ``matches``):
+    hybrid BM25 + vector search, fanned out in parallel when several namespaces
+    are configured. The matches are packed into a context block
+    under CONTEXT_TOKEN_BUDGET, with overlapping neighbours merged (context_packing.py)
+    """
+    if matches is None and len(ASK_AI_NAMESPACES) > 1:
+        matches = fan_out_search(query_embedding, ASK_AI_NAMESPACES, top_k=top_k,
+                                 per_namespace_quota=ASK_AI_NAMESPACE_QUOTA, query=query)
+    elif matches is None:
+        matches = hybrid_search(query, query_embedding, namespace=ASK_AI_NAMESPACES[0], top_k=top_k)
+
+    packed = pack_context(matches)
+    context_text = "\n\n".join(packed["blocks"])
+    if not context_text:
+        context_text = "No relevant context found in the knowledge base."
+
+    return {
+        "context_text": context_text,
+        "sources": list(set(packed["sources"])),
+        "chunk_ids": packed["chunk_ids"]
+    }
+
+def _build_messages(query: str, context_text: str, history=None) -> list:
+    """
+    ``history`` is memory.get_history()'s rolling summary + recent turns; both are
+    bounded, so the prompt size doesn't grow with the conversation.
+    """
+    system_prompt = """
+    你是一个《金铲铲之战》（Teamfight Tactics）的高手教练和智能助手。
+    请根据下方的【参考资料】回答用户的问题。
+    如果资料里没有提到，就诚实地说不知道，不要编造羁绊或装备数据。
+    """
+    if history and history["summary"]:
+        system_prompt += f"""
+    【之前的对话摘要】：
+    {history["summary"]}
+    """
+
+    user_prompt = f"""
+    【参考资料】：
+    {context_text}
+    
+    用户问题：{query}
+    """
+
+    messages = [SystemMessage(content=system_prompt)]
+    for role, content in (history["turns"] if history else []):
+        messages.append(HumanMessage(content=content) if role == 'user' else AIMessage(content=content))
+    messages.append(HumanMessage(content=user_prompt))
+    return messages
+
+def query_ai(query: str, history=None):
     """
     Queries the AI with the given question using RAG (Pinecone + OpenRouter)
     """
     try:
-        if not pc:
-            raise ValueError("Pinecone not initialized")
-            
-        # 1. Embed Query
-        query_embedding = pc.inference.embed(
-            model="llama-text-embed-v2",
-            inputs=[query],
-            parameters={"input_type": "query"}
-        )[0]['values']
-        
-        # 2. Search Pinecone
-        index = get_index()
-        results = index.query(
-            vector=query_embedding,
-            top_k=5,
-            include_metadata=True
-        )
-        
-        context_text = ""
-        sources = []
-        if results.matches:
-            for match in results.matches:
-                if match.metadata and "text" in match.metadata:
-                    context_text += match.metadata["text"] + "\n\n"
-                    sources.append(match.metadata.get("source", "unknown"))
-        
-        if not context_text:
-            context_text = "No relevant context found in the knowledge base."
+        # 1. Embed Query (cached for repeat questions, skipped for exact entity lookups)
+        query_embedding, matches = _embed_or_fast_path(query)
 
-        # 3. Initialize LLM with DeepSeek (using the key stored in OPEN_ROUTER_API_KEY)
-        open_router_key = os.getenv("OPEN_ROUTER_API_KEY")
-        if not open_router_key:
-            raise ValueError("OPEN_ROUTER_API_KEY not found in environment variables")
-
-        print(f"Initializing ChatOpenAI with model: deepseek-chat")
+        # Serve a previous answer if an almost identical question was asked
+        cached = _lookup_answer(query_embedding, history)
+        if cached:
+            return {
+                "answer": cached["answer"],
+                "sources": cached["sources"],
+                "cached": True
+            }
         
-        llm = ChatOpenAI(
-            model="deepseek-chat", 
-            api_key=open_router_key,
-            base_url="https://api.deepseek.com",
-            temperature=0
-        )
+        # 2. Hybrid search (BM25 + vector store)
+        retrieved = _retrieve_context(query, query_embedding, matches)
 
-        # 4. Construct Prompt
-        system_prompt = """
-        你是一个《金铲铲之战》（Teamfight Tactics）的高手教练和智能助手。
-        请根据下方的【参考资料】回答用户的问题。
-        如果资料里没有提到，就诚实地说不知道，不要编造羁绊或装备数据。
-        """
-        
-        user_prompt = f"""
-        【参考资料】：
-        {context_text}
+        # 3. Construct Prompt
+        messages = _build_messages(query, retrieved["context_text"], history)
         
-        用户问题：{query}
-        """
-        
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt)
-        ]
-        
-        # 5. Invoke LLM
-        response = llm.invoke(messages)
+        # 4. Invoke LLM through the shared gateway (pooled, bounded, retried)
+        answer = gateway.invoke(messages)
+        _store_answer(query_embedding, answer, retrieved, history)
         
         return {
-            "answer": response.content,
-            "sources": list(set(sources))
+            "answer": answer,
+            "sources": retrieved["sources"],
+            "cached": False
         }
     except Exception as e:
         print(f"AI Query Error: {e}")
         raise e
+
+async def aquery_ai(query: str, history=None):
+    """
+    Async variant of query_ai for the ASGI views. The LLM call is awaited on the
+    gateway's async client; the (mostly cached) embedding and the vector search
+    run in the default thread pool so they don't block the event loop.
+    """
+    query_embedding, matches = await sync_to_async(_embed_or_fast_path, thread_sensitive=False)(query)
+
+    cached = _lookup_answer(query_embedding, history)
+    if cached:
+        return {"answer": cached["answer"], "sources": cached["sources"], "cached": True}
+
+    retrieved = await sync_to_async(_retrieve_context, thread_sensitive=False)(query, query_embedding, matches)
+    answer = await gateway.ainvoke(_build_messages(query, retrieved["context_text"], history))
+    _store_answer(query_embedding, answer, retrieved, history)
+
+    return {"answer": answer, "sources": retrieved["sources"], "cached": False}
+
+def stream_query_ai(query: str, history=None):
+    """
+    Streaming variant of query_ai. Yields ``(event, data)`` tuples:
+    ``("sources", [...])`` once retrieval is done, then ``("token", str)`` per
+    generated chunk and finally ``("done", {"answer", "sources", "cached"})``.
+    """
+    query_embedding, matches = _embed_or_fast_path(query)
+
+    cached = _lookup_answer(query_embedding, history)
+    if cached:
+        yield "sources", cached["sources"]
+        yield "token", cached["answer"]
+        yield "done", {"answer": cached["answer"], "sources": cached["sources"], "cached": True}
+        return
+
+    retrieved = _retrieve_context(query, query_embedding, matches)
+    # Sources are known before generation starts, send them right away
+    yield "sources", retrieved["sources"]
+
+    parts = []
+    for token in gateway.stream(_build_messages(query, retrieved["context_text"], history)):
+        parts.append(token)
+        yield "token", token
+
+    answer = "".join(parts)
+    _store_answer(query_embedding, answer, retrieved, history)
+    yield "done", {"answer": answer, "sources": retrieved["sources"], "cached": False}
@@ -0,0 +1,104 @@
+"""
+Semantic answer cache for /ask_ai/.
+
+Keeps (query embedding, retrieved chunk ids, answer, sources) for recent questions
+and serves the stored answer when a new query embedding is close enough. Lookup is
+a single matrix-vector product over a preallocated float32 ring buffer.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .kb_version import get_kb_version
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(6 * 3600)))
+
+
+def _normalize(vector) -> np.ndarray:
+    vec = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else vec
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl: int = ANSWER_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._entries: List[Optional[Dict]] = [None] * max_entries
+        self._size = 0
+        self._next = 0
+        self._kb_version = get_kb_version()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self) -> None:
+        # Must be called with the lock held.
+        version = get_kb_version()
+        if version != self._kb_version:
+            self._clear()
+            self._kb_version = version
+
+    def _clear(self) -> None:
+        self._vectors = None
+        self._expires[:] = 0
+        self._entries = [None] * self.max_entries
+        self._size = 0
+        self._next = 0
+
+    def lookup(self, query_embedding) -> Optional[Dict]:
+        """
+        Returns the cached entry most similar to ``query_embedding`` if its cosine
+        similarity reaches the threshold, else None.
+        """
+        query = _normalize(query_embedding)
+        with self._lock:
+            self._check_version()
+            if self._size == 0 or self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            scores = self._vectors[:self._size] @ query
+            scores[self._expires[:self._size] < time.time()] = -1.0
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(self._entries[best], similarity=float(scores[best]))
+
+    def store(self, query_embedding, answer: str, sources: List[str], chunk_ids: List[str]) -> None:
+        vector = _normalize(query_embedding)
+        with self._lock:
+            self._check_version()
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._clear()
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            slot = self._next
+            self._vectors[slot] = vector
+            self._expires[slot] = time.time() + self.ttl
+            self._entries[slot] = {
+                "answer": answer,
+                "sources": list(sources),
+                "chunk_ids": list(chunk_ids),
+            }
+            self._next = (slot + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": self._size}
+
+
+answer_cache = SemanticAnswerCache()
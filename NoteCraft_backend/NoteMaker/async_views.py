@@ -0,0 +1,111 @@
+"""
+Async (ASGI) versions of the RAG views.
+
+DRF's APIView is synchronous, so these are plain Django class-based views with
+``async def`` handlers. Served through ``NoteCraft_backend.asgi:application``
+(e.g. ``uvicorn NoteCraft_backend.asgi:application``) a single worker process can
+keep hundreds of LLM calls in flight. Under WSGI every request runs on its own
+event loop; they still work (the async HTTP clients are kept per loop) but gain nothing.
+Request and response bodies match the sync views in views.py.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from .ai_module import aquery_ai
+from .llm_gateway import LLMGatewayError
+from .memory import get_history, schedule_summary_update
+from .models import Conversation, Message
+from .myutils import anew_image, arequest_OpenRouter
+
+
+async def authenticate(request):
+    """
+    JWT authentication for async views; returns the user or None.
+    """
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    return result[0] if result else None
+
+
+def read_json(request) -> dict:
+    try:
+        return json.loads(request.body or b"{}")
+    except json.JSONDecodeError:
+        return {}
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAskAIView(View):
+    async def post(self, request):
+        user = await authenticate(request)
+        if user is None:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+        data = read_json(request)
+        query = data.get("query", "")
+        conversation_id = data.get("conversation_id")
+        if not query:
+            return JsonResponse({"error": "Query is required"}, status=400)
+
+        if conversation_id:
+            try:
+                conversation = await Conversation.objects.aget(id=conversation_id, user=user)
+            except Conversation.DoesNotExist:
+                return JsonResponse({"error": "Conversation not found"}, status=404)
+        else:
+            title = query[:30] + "..." if len(query) > 30 else query
+            conversation = await Conversation.objects.acreate(user=user, title=title)
+
+        history = await sync_to_async(get_history)(conversation)
+        await Message.objects.acreate(conversation=conversation, role='user', content=query)
+
+        try:
+            result = await aquery_ai(query, history)
+            ai_content = result.get('answer', '')
+            await Message.objects.acreate(conversation=conversation, role='assistant', content=ai_content)
+            await sync_to_async(schedule_summary_update)(conversation.id)
+            return JsonResponse({
+                "answer": ai_content,
+                "conversation_id": conversation.id,
+                "sources": result.get('sources', []),
+                "cached": result.get('cached', False)
+            })
+        except Exception as e:
+            return JsonResponse({
+                "error": str(e),
+                "conversation_id": conversation.id,
+                "answer": "抱歉，我现在无法连接到大脑，请稍后再试。"
+            }, status=500)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncModifyTextView(View):
+    async def post(self, request):
+        change_text = read_json(request).get("text")
+        try:
+            response = await arequest_OpenRouter(change_text+"rework this part of text to get more clarity and elaborate the ouput should be in ```text box the new content should not be more than 3 times original lenght")
+            start = response.find("```text") + len("```text")
+            end = response.find("```", start)
+            new_text = response[start:end].strip()
+            return JsonResponse({"message": "Text modified successfully", "modifiedContent": new_text})
+        except (TypeError, LLMGatewayError) as e:
+            return JsonResponse({"message": "Error in response from OpenRouter", "error": str(e)}, status=500)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncModifyImageView(View):
+    async def post(self, request):
+        change_image = read_json(request).get("imgText")
+        if not change_image:
+            return JsonResponse({"error": "imgText is required"}, status=400)
+        new_image_url = await anew_image(change_image)
+        return JsonResponse({"message": "Image modified successfully", "modifiedContent": f"![{change_image}]({new_image_url})"})
@@ -0,0 +1,56 @@
+"""
+Cooperative cancellation for long celery tasks.
+
+CancelTaskView sets a flag in the shared cache under the id the client holds
+(the root task id). Tasks call ``checkpoint`` between their LLM, retrieval and
+image stages, and poll it while streaming an LLM answer so the HTTP call is
+closed early. This works in eager mode too, where revoking does nothing.
+"""
+import time
+from contextlib import closing
+from typing import Iterable, Optional
+
+from django.core.cache import caches
+
+CANCEL_TTL = 24 * 3600
+# How often a streaming LLM call looks at the flag
+CANCEL_POLL_INTERVAL = 0.5
+
+cancel_cache = caches['shared']
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+def _key(task_id: str) -> str:
+    return f"task_cancel:{task_id}"
+
+
+def request_cancel(task_id: str) -> None:
+    cancel_cache.set(_key(task_id), True, CANCEL_TTL)
+
+
+def is_cancelled(task_id: Optional[str]) -> bool:
+    return bool(task_id) and bool(cancel_cache.get(_key(task_id)))
+
+
+def checkpoint(task_id: Optional[str]) -> None:
+    if is_cancelled(task_id):
+        raise TaskCancelled(f"Task {task_id} was cancelled")
+
+
+def consume_stream(tokens: Iterable[str], task_id: Optional[str]) -> str:
+    """
+    Joins a streamed LLM answer, checking the flag every CANCEL_POLL_INTERVAL
+    seconds; on cancellation the stream (and its HTTP response) is closed.
+    """
+    parts = []
+    last_check = time.monotonic()
+    with closing(iter(tokens)) as stream:
+        for token in stream:
+            parts.append(token)
+            if time.monotonic() - last_check >= CANCEL_POLL_INTERVAL:
+                last_check = time.monotonic()
+                checkpoint(task_id)
+    return "".join(parts)
@@ -0,0 +1,38 @@
+"""
+Content-addressed ids for indexed chunks.
+
+A chunk id is derived from the SHA-256 of the whole source document, the chunk
+index and the SHA-256 of the chunk text, so re-indexing the same file produces
+the same ids (an upsert overwrites instead of duplicating) and a chunk whose id
+is already in the index doesn't need to be embedded again. Like
+vector_store.py this module must stay importable without Django.
+"""
+import hashlib
+from pathlib import Path
+from typing import Union
+
+
+def file_sha256(path: Union[str, Path]) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def doc_prefix(doc_hash: str) -> str:
+    """
+    Prefix shared by every chunk id of a document, for listing them by id.
+    """
+    return f"{doc_hash[:16]}-"
+
+
+def chunk_id(doc_hash: str, index: int, text: str) -> str:
+    """
+    ``<doc hash>-<index>-<text hash>``, truncated hashes keep ids short and ASCII.
+    """
+    return f"{doc_prefix(doc_hash)}{index}-{text_hash(text)[:16]}"
@@ -0,0 +1,232 @@
+"""
+Packs retrieved chunks into the prompt context under a token budget.
+
+The chunkers overlap neighbouring chunks (200 characters for PDFs, 150 in
+ChunkedItemsScript.py), so hits from the same parent repeat text. Packing:
+
+1. walks the matches in score order,
+2. merges a chunk into an already packed neighbour from the same parent
+   (same ``parent_id``, or same ``source`` + ``page`` for PDFs), cutting the
+   overlapping span, then folds in other blocks of that parent the grown block
+   now touches (a chunk that bridges two blocks joins them),
+3. drops chunks that are contained in, or near-duplicates of, packed text,
+4. stops adding text once CONTEXT_TOKEN_BUDGET would be exceeded.
+
+Blocks keep the rank of their best chunk. Like vector_store.py this module must
+stay importable without Django.
+"""
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Set
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+# Share of a chunk's character shingles already in a packed block above which it counts as a near-duplicate
+CONTEXT_NEAR_DUP_THRESHOLD = float(os.getenv("CONTEXT_NEAR_DUP_THRESHOLD", "0.8"))
+# Overlaps shorter than this are treated as coincidence, not as a chunk boundary
+MIN_OVERLAP = 20
+MAX_OVERLAP = 400
+SHINGLE_SIZE = 5
+
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    DeepSeek's rule of thumb: ~0.6 tokens per CJK character, ~0.3 per other character.
+    """
+    cjk = len(_CJK_RE.findall(text))
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+
+def overlap_length(left: str, right: str) -> int:
+    """
+    Length of the longest suffix of ``left`` that is a prefix of ``right``.
+    """
+    head = right[:MIN_OVERLAP]
+    if len(head) < MIN_OVERLAP:
+        return 0
+    window_start = max(0, len(left) - MAX_OVERLAP)
+    pos = left.find(head, window_start)
+    while pos != -1:
+        if right.startswith(left[pos:]):
+            return len(left) - pos
+        pos = left.find(head, pos + 1)
+    return 0
+
+
+def _shingles(text: str) -> Set[str]:
+    text = _SPACE_RE.sub(" ", text.lower())
+    return {text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+
+
+def _parent_key(metadata: Dict) -> Optional[tuple]:
+    if metadata.get("parent_id"):
+        return ("parent", metadata["parent_id"])
+    if metadata.get("source") is not None:
+        return ("source", metadata["source"], metadata.get("page"))
+    return None
+
+
+class _Block:
+    def __init__(self, match, text: str):
+        self.text = text
+        self.parent = _parent_key(match.metadata)
+        index = match.metadata.get("chunk_index")
+        self.first = self.last = index if isinstance(index, (int, float)) else None
+        self.ids = [match.id]
+        self.sources = [match.metadata.get("source", "unknown")]
+        self.shingles = _shingles(text)
+
+    def merge(self, match, text: str) -> Optional[str]:
+        """
+        Joins an adjacent chunk of the same parent; returns the text actually
+        added (empty if it was already covered), or None if it isn't adjacent.
+        """
+        if self.parent is None or _parent_key(match.metadata) != self.parent:
+            return None
+        index = match.metadata.get("chunk_index")
+        has_index = isinstance(index, (int, float)) and self.first is not None
+        if match.id in self.ids or text in self.text:
+            return ""
+        elif (not has_index or index == self.last + 1) and overlap_length(self.text, text):
+            added = text[overlap_length(self.text, text):]
+            self.text += added
+        elif (not has_index or index == self.first - 1) and overlap_length(text, self.text):
+            added = text[:len(text) - overlap_length(text, self.text)]
+            self.text = added + self.text
+        elif has_index and index in (self.last + 1, self.first - 1):
+            # Neighbours without a detectable overlap (e.g. fixed-size splits)
+            added = text
+            self.text = self.text + "\n" + text if index > self.last else text + "\n" + self.text
+        else:
+            return None
+        if has_index:
+            self.first, self.last = min(self.first, index), max(self.last, index)
+        self.ids.append(match.id)
+        self.sources.append(match.metadata.get("source", "unknown"))
+        self.shingles = _shingles(self.text)
+        return added
+
+    def absorb(self, other: "_Block") -> bool:
+        """
+        Folds in another block of the same parent that overlaps or adjoins this
+        one; returns False (and changes nothing) if they don't touch.
+        """
+        if self.parent is None or other.parent != self.parent:
+            return False
+        has_index = self.first is not None and other.first is not None
+        after = not has_index or (other.first <= self.last + 1 and other.last > self.last)
+        before = not has_index or (other.last >= self.first - 1 and other.first < self.first)
+        if other.text in self.text:
+            text = self.text
+        elif self.text in other.text:
+            text = other.text
+        elif after and overlap_length(self.text, other.text):
+            text = self.text + other.text[overlap_length(self.text, other.text):]
+        elif before and overlap_length(other.text, self.text):
+            text = other.text + self.text[overlap_length(other.text, self.text):]
+        elif has_index and other.first == self.last + 1:
+            text = self.text + "\n" + other.text
+        elif has_index and other.last == self.first - 1:
+            text = other.text + "\n" + self.text
+        else:
+            return False
+        self.text = text
+        if has_index:
+            self.first, self.last = min(self.first, other.first), max(self.last, other.last)
+        self.ids += other.ids
+        self.sources += other.sources
+        self.shingles = _shingles(self.text)
+        return True
+
+    def similarity(self, shingles: Set[str]) -> float:
+        # Containment of the candidate in this block, so short chunks that only
+        # restate part of a long block also count as duplicates
+        return len(shingles & self.shingles) / len(shingles) if shingles else 1.0
+
+
+def _coalesce(blocks: List[_Block], block: _Block) -> int:
+    """
+    Folds every block ``block`` now touches into it, at the better rank of the
+    two; returns the change in estimated tokens (negative, overlaps are cut).
+    """
+    delta = 0
+    folded = True
+    while folded:
+        folded = False
+        for other in blocks:
+            if other is block:
+                continue
+            cost = estimate_tokens(block.text) + estimate_tokens(other.text)
+            if block.absorb(other):
+                delta += estimate_tokens(block.text) - cost
+                position = min(blocks.index(block), blocks.index(other))
+                blocks.remove(other)
+                blocks.remove(block)
+                blocks.insert(position, block)
+                folded = True
+                break
+    return delta
+
+
+def pack_context(matches: Sequence, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 near_dup_threshold: float = CONTEXT_NEAR_DUP_THRESHOLD) -> Dict:
+    """
+    Packs ``matches`` (QueryMatch-like, best first) into at most ``token_budget``
+    estimated tokens. Returns ``{"blocks", "chunk_ids", "sources", "tokens", "dropped"}``
+    where ``blocks`` are the packed texts in rank order.
+    """
+    blocks: List[_Block] = []
+    tokens = 0
+    dropped = 0
+    for match in matches:
+        text = ((match.metadata or {}).get("text") or "").strip()
+        if not text:
+            continue
+
+        merged = False
+        for block in blocks:
+            before = (block.text, block.first, block.last)
+            added = block.merge(match, text)
+            if added is None:
+                continue
+            if not added:
+                dropped += 1
+                merged = True
+                break
+            cost = estimate_tokens(block.text) - estimate_tokens(before[0])
+            if tokens + cost > token_budget:
+                # Roll back, the neighbour doesn't fit
+                block.text, block.first, block.last = before
+                block.ids.pop()
+                block.sources.pop()
+                block.shingles = _shingles(block.text)
+                dropped += 1
+            else:
+                tokens += cost + _coalesce(blocks, block)
+            merged = True
+            break
+        if merged:
+            continue
+
+        shingles = _shingles(text)
+        if any(block.similarity(shingles) >= near_dup_threshold for block in blocks):
+            dropped += 1
+            continue
+
+        cost = estimate_tokens(text)
+        if tokens + cost > token_budget:
+            # Smaller, lower-ranked chunks may still fit
+            dropped += 1
+            continue
+        blocks.append(_Block(match, text))
+        tokens += cost
+
+    return {
+        "blocks": [block.text for block in blocks],
+        "chunk_ids": [chunk_id for block in blocks for chunk_id in block.ids],
+        "sources": [source for block in blocks for source in block.sources],
+        "tokens": tokens,
+        "dropped": dropped,
+    }
@@ -0,0 +1,156 @@
+"""
+Two-tier cache for query embeddings.
+
+Tier 1 is an in-process LRU, tier 2 is the shared Django cache (``CACHES['shared']``
+in settings, file based) so that web workers and celery workers reuse each other's
+embeddings. Entries are keyed on normalized text + model + input_type.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+EMBED_MODEL = "llama-text-embed-v2"
+
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "2048"))
+EMBED_CACHE_TTL = int(os.getenv("EMBED_CACHE_TTL", str(7 * 86400)))
+EMBED_CACHE_ALIAS = os.getenv("EMBED_CACHE_ALIAS", "shared")
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes a query so trivially different spellings share one cache entry.
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    return _WHITESPACE_RE.sub(" ", text).strip().lower()
+
+
+def _get_shared_cache():
+    # The offline scripts import this module without Django configured,
+    # in that case only the in-process tier is used.
+    try:
+        from django.core.cache import caches
+        return caches[EMBED_CACHE_ALIAS]
+    except Exception:
+        return None
+
+
+class EmbeddingCache:
+    """
+    In-process LRU in front of the shared Django cache.
+    """
+
+    def __init__(self, max_entries: int = EMBED_CACHE_MAX_ENTRIES, ttl: int = EMBED_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text: str, model: str, input_type: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"emb:{model}:{input_type}:{digest}"
+
+    def _get_local(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            values, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return values
+
+    def _set_local(self, key: str, values: List[float]) -> None:
+        with self._lock:
+            self._local[key] = (values, time.monotonic() + self.ttl)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def get(self, text: str, model: str = EMBED_MODEL, input_type: str = "query") -> Optional[List[float]]:
+        key = self.make_key(text, model, input_type)
+        values = self._get_local(key)
+        if values is not None:
+            self.hits += 1
+            return values
+
+        shared = _get_shared_cache()
+        if shared is not None:
+            try:
+                values = shared.get(key)
+            except Exception as e:
+                print(f"Embedding cache read failed: {e}")
+                values = None
+            if values is not None:
+                self.shared_hits += 1
+                self._set_local(key, values)
+                return values
+
+        self.misses += 1
+        return None
+
+    def set(self, text: str, values: List[float], model: str = EMBED_MODEL, input_type: str = "query") -> None:
+        key = self.make_key(text, model, input_type)
+        values = [float(v) for v in values]
+        self._set_local(key, values)
+        shared = _get_shared_cache()
+        if shared is not None:
+            try:
+                shared.set(key, values, timeout=self.ttl)
+            except Exception as e:
+                print(f"Embedding cache write failed: {e}")
+
+    def get_or_embed(self, text: str, embed_fn: Callable[[str], List[float]],
+                     model: str = EMBED_MODEL, input_type: str = "query") -> List[float]:
+        values = self.get(text, model=model, input_type=input_type)
+        if values is None:
+            values = [float(v) for v in embed_fn(text)]
+            self.set(text, values, model=model, input_type=input_type)
+        return values
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            size = len(self._local)
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "local_entries": size,
+            "max_entries": self.max_entries,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._local.clear()
+        self.hits = self.shared_hits = self.misses = 0
+
+
+query_embedding_cache = EmbeddingCache()
+
+
+def embed_query(pc, text: str, model: str = EMBED_MODEL, input_type: str = "query") -> List[float]:
+    """
+    Returns the embedding for ``text``, calling Pinecone Inference only on a cache miss.
+    """
+    def _embed(t: str) -> List[float]:
+        if not pc:
+            raise ValueError("Pinecone not initialized")
+        return pc.inference.embed(
+            model=model,
+            inputs=[t],
+            parameters={"input_type": input_type}
+        )[0]['values']
+
+    return query_embedding_cache.get_or_embed(text, _embed, model=model, input_type=input_type)
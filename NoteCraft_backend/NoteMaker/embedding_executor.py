@@ -0,0 +1,211 @@
+"""
+Batched, concurrent passage embedding for ingestion.
+
+``EmbeddingExecutor.embed`` packs texts into the largest batches Pinecone
+Inference accepts (EMBED_MAX_BATCH inputs, EMBED_MAX_BATCH_TOKENS estimated
+tokens per request), runs up to EMBED_CONCURRENCY batches at once and returns
+the embeddings in input order. Every request first takes its estimated tokens
+from a process-wide token bucket (EMBED_TOKENS_PER_MINUTE), so concurrent
+ingestions share one budget instead of tripping the API's rate limit; 429/5xx
+answers are retried with backoff. Texts already in the embedding store are
+never sent.
+
+Used by process_pdf_to_vector_db, the upload ingestion task and
+scripts/Chunk-Embed-Upsert/EmbedItemsScript.py. Like
+vector_store.py this module must stay importable without Django.
+"""
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Sequence
+
+from .embedding_cache import EMBED_MODEL
+from .embedding_store import EmbeddingStore, get_embedding_store
+
+# Pinecone Inference limits for llama-text-embed-v2: 96 inputs per request, 2048 tokens per input
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "96"))
+EMBED_MAX_INPUT_TOKENS = int(os.getenv("EMBED_MAX_INPUT_TOKENS", "2048"))
+EMBED_MAX_BATCH_TOKENS = int(os.getenv("EMBED_MAX_BATCH_TOKENS", "50000"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_TOKENS_PER_MINUTE = int(os.getenv("EMBED_TOKENS_PER_MINUTE", "250000"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "4"))
+EMBED_BACKOFF_BASE = float(os.getenv("EMBED_BACKOFF_BASE", "1"))
+EMBED_BACKOFF_MAX = float(os.getenv("EMBED_BACKOFF_MAX", "20"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Conservative for the Llama tokenizer: a token per CJK character, one per
+    ~3.5 other characters.
+    """
+    cjk = len(_CJK_RE.findall(text))
+    return int(cjk + (len(text) - cjk) / 3.5) + 1
+
+
+class TokenBucket:
+    """
+    Blocking token bucket: ``rate`` tokens per second, bursts up to ``capacity``.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float) -> float:
+        """
+        Takes ``tokens`` (capped at the capacity), waiting as needed; returns the seconds waited.
+        """
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def pack_batches(texts: Sequence[str], max_batch: int = EMBED_MAX_BATCH,
+                 max_tokens: int = EMBED_MAX_BATCH_TOKENS) -> List[List[int]]:
+    """
+    Splits text indexes into consecutive batches under both limits. Inputs
+    longer than EMBED_MAX_INPUT_TOKENS are truncated by the API and counted as such.
+    """
+    batches, current, current_tokens = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = min(estimate_tokens(text), EMBED_MAX_INPUT_TOKENS)
+        if current and (len(current) >= max_batch or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+_bucket = TokenBucket(EMBED_TOKENS_PER_MINUTE / 60.0, EMBED_TOKENS_PER_MINUTE)
+_pool = ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY, thread_name_prefix="embed")
+
+
+class EmbeddingExecutor:
+    """
+    ``before_batch`` is called before every request (raise to abort, e.g. a
+    cancellation checkpoint); ``on_progress(done, total)`` after every batch.
+    Texts found in the embedding store (embedding_store.py) are not sent, and
+    new embeddings are written back to it as their batch finishes.
+    """
+
+    def __init__(self, pc, model: str = EMBED_MODEL, bucket: TokenBucket = _bucket,
+                 pool: ThreadPoolExecutor = _pool, store: Optional[EmbeddingStore] = None,
+                 use_store: bool = True):
+        self.pc = pc
+        self.model = model
+        self.bucket = bucket
+        self.pool = pool
+        self.use_store = use_store
+        self._store = store
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.embedded = 0
+        self.store_hits = 0
+
+    def _get_store(self) -> Optional[EmbeddingStore]:
+        if self.use_store and self._store is None:
+            try:
+                self._store = get_embedding_store()
+            except Exception as e:
+                print(f"Embedding store unavailable, embedding everything: {e}")
+                self.use_store = False
+        return self._store if self.use_store else None
+
+    def _record(self, **deltas) -> None:
+        with self._stats_lock:
+            for key, value in deltas.items():
+                setattr(self, key, getattr(self, key) + value)
+
+    def _embed_batch(self, texts: List[str], input_type: str,
+                     before_batch: Optional[Callable[[], None]]) -> List[List[float]]:
+        if before_batch is not None:
+            before_batch()
+        self.bucket.acquire(sum(min(estimate_tokens(t), EMBED_MAX_INPUT_TOKENS) for t in texts))
+        for attempt in range(EMBED_MAX_RETRIES + 1):
+            try:
+                self._record(requests=1)
+                response = self.pc.inference.embed(
+                    model=self.model,
+                    inputs=texts,
+                    parameters={"input_type": input_type, "truncate": "END"}
+                )
+                return [list(e['values']) for e in response]
+            except Exception as e:
+                if getattr(e, "status", None) not in RETRYABLE_STATUS or attempt == EMBED_MAX_RETRIES:
+                    raise
+                delay = random.uniform(0, min(EMBED_BACKOFF_MAX, EMBED_BACKOFF_BASE * 2 ** attempt))
+                print(f"Embedding batch failed ({getattr(e, 'status', '')}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def embed(self, texts: Sequence[str], input_type: str = "passage",
+              before_batch: Optional[Callable[[], None]] = None,
+              on_progress: Optional[Callable[[int, int], None]] = None) -> List[List[float]]:
+        """
+        One embedding per text, in input order. Only texts missing from the
+        store are embedded, each distinct text once. The first failing batch
+        cancels the ones not started yet and its exception is raised.
+        """
+        texts = list(texts)
+        store = self._get_store()
+        results: List[Optional[List[float]]] = (
+            store.get_many(texts, self.model, input_type) if store is not None else [None] * len(texts)
+        )
+        missing: Dict[str, List[int]] = {}
+        for i, text in enumerate(texts):
+            if results[i] is None:
+                missing.setdefault(text, []).append(i)
+        self._record(store_hits=len(texts) - sum(len(positions) for positions in missing.values()))
+        if not missing:
+            return results
+        if not self.pc:
+            raise ValueError("Pinecone not initialized")
+
+        unique = list(missing)
+        futures = {
+            self.pool.submit(self._embed_batch, [unique[j] for j in batch], input_type, before_batch): batch
+            for batch in pack_batches(unique)
+        }
+        done_count = 0
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = futures[future]
+                    values = future.result()
+                    for j, embedding in zip(batch, values):
+                        for i in missing[unique[j]]:
+                            results[i] = embedding
+                    if store is not None:
+                        store.put_many([unique[j] for j in batch], values, self.model, input_type)
+                    self._record(embedded=len(batch))
+                    done_count += len(batch)
+                if on_progress is not None and done:
+                    on_progress(done_count, len(unique))
+        finally:
+            for future in pending:
+                future.cancel()
+        return results
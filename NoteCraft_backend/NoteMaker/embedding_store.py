@@ -0,0 +1,94 @@
+"""
+Content-addressed store of passage embeddings, shared by the Django app and
+the offline scripts.
+
+Rows are keyed by sha256(text) + model + input_type and hold the vector as a
+float32 blob in one SQLite file under LOCAL_DATA_DIR (WAL mode, so the web,
+celery and script processes can use it at the same time). Identical text is
+embedded once, whichever document or scrape it came from; EmbeddingExecutor
+consults the store before calling Pinecone Inference.
+
+Unlike embedding_cache.py (query embeddings, with TTL) entries never expire:
+a passage embedding only changes with the model, which is part of the key.
+Like vector_store.py this module must stay importable without Django.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .kb_version import LOCAL_DATA_DIR
+
+EMBEDDING_STORE_PATH = Path(os.getenv("EMBEDDING_STORE_PATH", LOCAL_DATA_DIR / "embeddings.sqlite3"))
+# SQLite's default limit on host parameters is 999
+_LOOKUP_BATCH = 900
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, path: Path = EMBEDDING_STORE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " text_hash TEXT NOT NULL, model TEXT NOT NULL, input_type TEXT NOT NULL,"
+                " dim INTEGER NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL,"
+                " PRIMARY KEY (text_hash, model, input_type))"
+            )
+
+    def get_many(self, texts: Sequence[str], model: str, input_type: str) -> List[Optional[List[float]]]:
+        """
+        The stored embedding of every text, None where there is none.
+        """
+        keys = [text_key(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(unique), _LOOKUP_BATCH):
+                batch = unique[i:i + _LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND input_type = ?"
+                    f" AND text_hash IN ({','.join('?' * len(batch))})",
+                    [model, input_type, *batch],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return [found.get(key) for key in keys]
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]], model: str, input_type: str) -> None:
+        now = time.time()
+        rows = []
+        for text, values in zip(texts, vectors):
+            blob = np.asarray(values, dtype=np.float32)
+            rows.append((text_key(text), model, input_type, blob.shape[0], blob.tobytes(), now))
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+_embedding_store: Optional[EmbeddingStore] = None
+_store_lock = threading.Lock()
+
+
+def get_embedding_store() -> EmbeddingStore:
+    global _embedding_store
+    if _embedding_store is None:
+        with _store_lock:
+            if _embedding_store is None:
+                _embedding_store = EmbeddingStore()
+    return _embedding_store
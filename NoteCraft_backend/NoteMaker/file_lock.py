@@ -0,0 +1,74 @@
+"""
+Inter-process lock on a sidecar file.
+
+The local stores (lexical index, local vector store) persist each namespace as
+whole files and write by reload-modify-save; the web, Celery and script
+processes all write to them, so that cycle has to be serialized across
+processes, not only across threads.
+Like vector_store.py this module must stay importable without Django.
+"""
+from pathlib import Path
+from typing import Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    Exclusive lock held on ``path`` (created if missing) between acquire() and release().
+    Not reentrant: one holder per process and lock file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = None
+
+    def acquire(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(self.path, "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        except BaseException:
+            f.close()
+            raise
+        self._file = f
+
+    def release(self) -> None:
+        f, self._file = self._file, None
+        if f is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            f.close()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+def file_version(path: Path) -> Optional[Tuple[int, int]]:
+    """
+    Changes whenever the file is rewritten (saves are atomic replaces, so a new
+    inode), which mtime alone misses for two saves in the same clock tick.
+    """
+    try:
+        stat = Path(path).stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
@@ -0,0 +1,73 @@
+"""
+Persistent cache of image-search results (query -> list of image urls).
+
+Note topics repeat a lot ("TFT Kai'Sa positioning"), so every Custom Search
+result list is kept in the ImageSearchCache table for IMAGE_CACHE_TTL seconds
+(empty lists only for IMAGE_CACHE_EMPTY_TTL, the search may just have failed).
+Hits refresh ``last_used_at``. Every IMAGE_CACHE_EVICT_EVERY writes, expired
+rows and the least recently used ones above IMAGE_CACHE_MAX_ENTRIES are evicted.
+"""
+import itertools
+import os
+import re
+from datetime import timedelta
+from typing import List, Optional
+
+from django.utils import timezone
+
+from .models import ImageSearchCache
+
+IMAGE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", str(30 * 24 * 3600)))
+IMAGE_CACHE_EMPTY_TTL = int(os.getenv("IMAGE_CACHE_EMPTY_TTL", str(3600)))
+IMAGE_CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "5000"))
+# Eviction runs a delete and a COUNT(*), so only every this many writes (per process)
+IMAGE_CACHE_EVICT_EVERY = int(os.getenv("IMAGE_CACHE_EVICT_EVERY", "100"))
+
+_SPACE_RE = re.compile(r"\s+")
+_writes = itertools.count(1)
+
+
+def normalize_query(query: str) -> str:
+    return _SPACE_RE.sub(" ", query).strip().lower()[:255]
+
+
+def get_images(query: str) -> Optional[List[str]]:
+    """
+    Cached result list for the query, or None on a miss or an expired entry.
+    """
+    key = normalize_query(query)
+    now = timezone.now()
+    entry = ImageSearchCache.objects.filter(
+        query=key, created_at__gte=now - timedelta(seconds=IMAGE_CACHE_TTL)
+    ).first()
+    if entry is None:
+        return None
+    if not entry.results and entry.created_at < now - timedelta(seconds=IMAGE_CACHE_EMPTY_TTL):
+        return None
+    ImageSearchCache.objects.filter(pk=entry.pk).update(last_used_at=now)
+    return entry.results
+
+
+def store_images(query: str, urls: List[str]) -> None:
+    now = timezone.now()
+    ImageSearchCache.objects.update_or_create(
+        query=normalize_query(query),
+        defaults={"results": urls, "created_at": now, "last_used_at": now},
+    )
+    if next(_writes) % IMAGE_CACHE_EVICT_EVERY == 0:
+        evict()
+
+
+def evict() -> int:
+    """
+    Drops expired entries and the least recently used ones above the size limit.
+    """
+    deleted, _ = ImageSearchCache.objects.filter(
+        created_at__lt=timezone.now() - timedelta(seconds=IMAGE_CACHE_TTL)
+    ).delete()
+    overflow = ImageSearchCache.objects.count() - IMAGE_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        stale = ImageSearchCache.objects.order_by('last_used_at').values_list('pk', flat=True)[:overflow]
+        more, _ = ImageSearchCache.objects.filter(pk__in=list(stale)).delete()
+        deleted += more
+    return deleted
@@ -0,0 +1,182 @@
+"""
+Incremental re-indexing with chunk-level diffing.
+
+The manifest (one SQLite file under LOCAL_DATA_DIR) records, per namespace,
+every indexed chunk id with its parent id (the scraped item or the uploaded
+file it came from), the hash of its text and the hash of its metadata.
+``reindex`` compares a fresh set of chunks against it and only writes the
+difference: added and changed chunks are embedded (through EmbeddingExecutor,
+so unchanged text is an embedding-store hit) and upserted, chunks that
+disappeared are deleted by id, and the kb version is bumped once if anything
+changed. The cost follows the size of the change, not the size of the corpus.
+
+Chunks indexed before the manifest existed are unknown to it: the first
+incremental run re-upserts them (idempotent, ids are stable) and records them.
+Like vector_store.py this module must stay importable without Django.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .chunk_ids import text_hash
+from .kb_version import LOCAL_DATA_DIR, bump_kb_version
+from .lexical_index import get_lexical_index
+from .vector_store import get_vector_store
+
+INDEX_MANIFEST_PATH = Path(os.getenv("INDEX_MANIFEST_PATH", LOCAL_DATA_DIR / "index_manifest.sqlite3"))
+UPSERT_BATCH_SIZE = 100
+_QUERY_BATCH = 900
+
+
+def metadata_hash(metadata: Dict) -> str:
+    # Metadata without the text (hashed separately), so stat updates are upserted without re-embedding
+    rest = {key: value for key, value in metadata.items() if key != "text"}
+    return hashlib.sha256(json.dumps(rest, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def parent_of(vector: Dict) -> str:
+    return str((vector.get("metadata") or {}).get("parent_id", vector["id"]))
+
+
+@dataclass
+class IndexDiff:
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: int = 0
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+    def summary(self) -> str:
+        return (f"+{len(self.added)} added, ~{len(self.changed)} changed, "
+                f"-{len(self.removed)} removed, {self.unchanged} unchanged")
+
+
+class IndexManifest:
+    def __init__(self, path: Path = INDEX_MANIFEST_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " namespace TEXT NOT NULL, chunk_id TEXT NOT NULL, parent_id TEXT NOT NULL,"
+                " text_hash TEXT NOT NULL, meta_hash TEXT NOT NULL,"
+                " PRIMARY KEY (namespace, chunk_id))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_parent ON chunks (namespace, parent_id)")
+
+    def entries(self, namespace: str = "", parent_ids: Optional[Iterable[str]] = None) -> Dict[str, Tuple[str, str, str]]:
+        """
+        ``chunk id -> (parent id, text hash, metadata hash)`` for the namespace,
+        or only for the given parents.
+        """
+        query = "SELECT chunk_id, parent_id, text_hash, meta_hash FROM chunks WHERE namespace = ?"
+        with self._lock:
+            if parent_ids is None:
+                rows = self._conn.execute(query, [namespace]).fetchall()
+            else:
+                parents = list(dict.fromkeys(parent_ids))
+                rows = []
+                for i in range(0, len(parents), _QUERY_BATCH):
+                    batch = parents[i:i + _QUERY_BATCH]
+                    rows += self._conn.execute(
+                        f"{query} AND parent_id IN ({','.join('?' * len(batch))})", [namespace, *batch]
+                    ).fetchall()
+        return {chunk_id: (parent, th, mh) for chunk_id, parent, th, mh in rows}
+
+    def record(self, vectors: Iterable[Dict], namespace: str = "") -> None:
+        rows = [
+            (namespace, v["id"], parent_of(v), text_hash((v.get("metadata") or {}).get("text", "")),
+             metadata_hash(v.get("metadata") or {}))
+            for v in vectors
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?)", rows)
+
+    def forget(self, chunk_ids: Iterable[str], namespace: str = "") -> None:
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM chunks WHERE namespace = ? AND chunk_id = ?",
+                                   [(namespace, chunk_id) for chunk_id in chunk_ids])
+
+
+_manifest: Optional[IndexManifest] = None
+_manifest_lock = threading.Lock()
+
+
+def get_manifest() -> IndexManifest:
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                _manifest = IndexManifest()
+    return _manifest
+
+
+def diff_chunks(vectors: List[Dict], previous: Dict[str, Tuple[str, str, str]]) -> IndexDiff:
+    diff = IndexDiff()
+    current = set()
+    for v in vectors:
+        current.add(v["id"])
+        metadata = v.get("metadata") or {}
+        old = previous.get(v["id"])
+        if old is None:
+            diff.added.append(v["id"])
+        elif old[1:] != (text_hash(metadata.get("text", "")), metadata_hash(metadata)):
+            diff.changed.append(v["id"])
+        else:
+            diff.unchanged += 1
+    diff.removed = [chunk_id for chunk_id in previous if chunk_id not in current]
+    return diff
+
+
+def reindex(vectors: List[Dict], namespace: str = "", embedder=None,
+            parent_ids: Optional[Iterable[str]] = None, manifest: Optional[IndexManifest] = None,
+            before_batch: Optional[Callable[[], None]] = None,
+            on_progress: Optional[Callable[[int, int], None]] = None) -> IndexDiff:
+    """
+    Brings the namespace in line with ``vectors`` (``{"id", "metadata", ["values"]}``,
+    ``metadata["text"]`` is what gets embedded). With ``parent_ids`` only chunks
+    of those parents are compared, so other parents are never removed; without
+    it ``vectors`` is the whole content of the namespace. ``embedder`` (an
+    EmbeddingExecutor) is only needed for chunks without ``values``.
+    """
+    manifest = manifest or get_manifest()
+    diff = diff_chunks(vectors, manifest.entries(namespace, parent_ids))
+    if not diff.has_changes:
+        return diff
+
+    write_ids = set(diff.added) | set(diff.changed)
+    upserts = [dict(v) for v in vectors if v["id"] in write_ids]
+    to_embed = [v for v in upserts if not v.get("values")]
+    if to_embed:
+        if embedder is None:
+            raise ValueError("Chunks without values need an embedder")
+        embeddings = embedder.embed([(v.get("metadata") or {}).get("text", "") for v in to_embed], "passage",
+                                    before_batch=before_batch, on_progress=on_progress)
+        for v, values in zip(to_embed, embeddings):
+            v["values"] = values
+
+    store = get_vector_store()
+    lexical = get_lexical_index()
+    with store.deferred_save(), lexical.deferred_save():
+        for i in range(0, len(upserts), UPSERT_BATCH_SIZE):
+            store.upsert(upserts[i:i + UPSERT_BATCH_SIZE], namespace=namespace)
+        lexical.add_documents(upserts, namespace)
+        if diff.removed:
+            store.delete(ids=diff.removed, namespace=namespace)
+            lexical.delete(diff.removed, namespace)
+    manifest.record(upserts, namespace)
+    manifest.forget(diff.removed, namespace)
+    bump_kb_version()
+    return diff
+
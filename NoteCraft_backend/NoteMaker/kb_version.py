@@ -0,0 +1,32 @@
+"""
+Knowledge-base version counter.
+
+Every write to the vector index bumps the counter so caches that depend on the
+index contents (answer cache, ...) can tell their entries are stale. It lives in a
+small file instead of the Django cache so the offline scripts can bump it as well.
+"""
+import os
+from pathlib import Path
+
+LOCAL_DATA_DIR = Path(os.getenv("LOCAL_DATA_DIR", Path(__file__).resolve().parent.parent / "local_data"))
+KB_VERSION_FILE = Path(os.getenv("KB_VERSION_FILE", LOCAL_DATA_DIR / "kb_version"))
+
+
+def get_kb_version() -> int:
+    try:
+        return int(KB_VERSION_FILE.read_text().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def bump_kb_version() -> int:
+    """
+    Increments the version. Two concurrent bumps may collapse into one,
+    which is fine: readers only care that the value changed.
+    """
+    version = get_kb_version() + 1
+    KB_VERSION_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = KB_VERSION_FILE.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_text(str(version))
+    os.replace(tmp_path, KB_VERSION_FILE)
+    return version
@@ -0,0 +1,350 @@
+"""
+Local BM25 inverted index over the knowledge-base chunks.
+
+Mirrors the vector store namespaces and ids, so lexical and dense results can be
+fused by id. Besides BM25 it keeps a dictionary of TFT entity names (champions,
+items, comps, augments, ...) taken from the chunk metadata; a query that names
+an entity can be answered from the lexical index without an embedding call.
+
+Tokenization: latin words/numbers are kept whole, CJK runs are split into
+unigrams and bigrams (no segmenter dependency).
+
+Each namespace is one JSON file that several processes write (web, Celery
+workers, scripts): writes reload, modify and save it under an inter-process
+file lock, and bulk writers should use deferred_save() so the file is written
+once per batch.
+
+Like vector_store.py this module must stay importable without Django.
+"""
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .file_lock import FileLock, file_version
+from .kb_version import LOCAL_DATA_DIR
+from .vector_store import matches_filter
+
+LEXICAL_INDEX_DIR = Path(os.getenv("LEXICAL_INDEX_DIR", LOCAL_DATA_DIR / "lexical_index"))
+# Metadata fields that hold an entity name (see the scrapers under scripts/)
+ENTITY_FIELDS = ("champion_name", "item_name", "comp_name", "tactician_name")
+# Longest run of query words joined into one entity name ("kai sa" -> "kaisa")
+MAX_ENTITY_WORDS = 4
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_LATIN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_CJK_SPLIT_RE = re.compile(r"([\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+)")
+_NON_WORD_RE = re.compile(r"[\W_]+")
+_WORD_RE = re.compile(r"[^\W_]+")
+
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def tokenize(text: str) -> List[str]:
+    text = normalize(text)
+    tokens = _LATIN_RE.findall(text)
+    for run in _CJK_RE.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _compact(text: str) -> str:
+    # Entity matching ignores spaces and punctuation ("Kai'Sa" == "kaisa")
+    return _NON_WORD_RE.sub("", normalize(text))
+
+
+def _segments(text: str) -> List[List[str]]:
+    """
+    Groups of consecutive non-CJK words, and single CJK runs, in query order.
+    Latin entity names match whole words only ("class" doesn't fire inside
+    "classic"); CJK has no word boundaries, its runs are matched by substring.
+    """
+    groups: List[List[str]] = []
+    latin: List[str] = []
+    for word in _WORD_RE.findall(normalize(text)):
+        for i, piece in enumerate(_CJK_SPLIT_RE.split(word)):
+            if not piece:
+                continue
+            if i % 2:
+                if latin:
+                    groups.append(latin)
+                    latin = []
+                groups.append([piece])
+            else:
+                latin.append(piece)
+    if latin:
+        groups.append(latin)
+    return groups
+
+
+class _Namespace:
+    def __init__(self):
+        self.ids: List[str] = []
+        self.metadata: List[Dict] = []
+        self.lengths: List[int] = []
+        self.alive: List[bool] = []
+        self.row_of: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.entities: Dict[str, List[int]] = defaultdict(list)
+        self.total_length = 0
+        self.live = 0
+        self.dirty = False
+
+    def add(self, doc_id: str, metadata: Dict) -> None:
+        if doc_id in self.row_of:
+            self.remove(doc_id)
+        row = len(self.ids)
+        terms = Counter(tokenize(metadata.get("text", "")))
+        self.ids.append(doc_id)
+        self.metadata.append(metadata)
+        self.lengths.append(sum(terms.values()))
+        self.alive.append(True)
+        self.row_of[doc_id] = row
+        for term, tf in terms.items():
+            self.postings[term][row] = tf
+        for field in ENTITY_FIELDS:
+            name = metadata.get(field)
+            if isinstance(name, str) and len(_compact(name)) >= 2:
+                self.entities[_compact(name)].append(row)
+        self.total_length += self.lengths[row]
+        self.live += 1
+        self.dirty = True
+
+    def remove(self, doc_id: str) -> None:
+        row = self.row_of.pop(doc_id, None)
+        if row is None:
+            return
+        self.alive[row] = False
+        self.total_length -= self.lengths[row]
+        self.live -= 1
+        self.dirty = True
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        return sorted(self.scores(query).items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+
+    def scores(self, query: str) -> Dict[int, float]:
+        """
+        BM25 score of every live row that shares a term with the query.
+        """
+        if not self.live:
+            return {}
+        avg_length = self.total_length / self.live
+        scores: Dict[int, float] = defaultdict(float)
+        for term, qtf in Counter(tokenize(query)).items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            df = sum(1 for row in postings if self.alive[row])
+            if not df:
+                continue
+            idf = math.log(1 + (self.live - df + 0.5) / (df + 0.5))
+            for row, tf in postings.items():
+                if not self.alive[row]:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[row] / avg_length)
+                scores[row] += qtf * idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def entity_matches(self, query: str) -> Tuple[List[int], float]:
+        """
+        Rows of entities named in the query (longest names first, no overlaps),
+        ranked by BM25 against the query, and the share of the query's
+        characters those names cover.
+        """
+        groups = _segments(query)
+        total = sum(len(piece) for group in groups for piece in group)
+        if not total:
+            return [], 0.0
+        rows: Dict[int, None] = {}
+        covered = 0
+        for group in groups:
+            if len(group) == 1 and _CJK_RE.fullmatch(group[0]):
+                run = group[0]
+                # Substrings of the CJK run, longest first
+                spans = [(i, j, run[i:j]) for i in range(len(run)) for j in range(i + 2, len(run) + 1)]
+            else:
+                starts = [0]
+                for piece in group:
+                    starts.append(starts[-1] + len(piece))
+                spans = [(starts[i], starts[j], "".join(group[i:j]))
+                         for i in range(len(group)) for j in range(i + 1, min(i + MAX_ENTITY_WORDS, len(group)) + 1)]
+            taken: List[Tuple[int, int]] = []
+            for start, end, name in sorted(spans, key=lambda span: span[1] - span[0], reverse=True):
+                if any(start < t_end and t_start < end for t_start, t_end in taken):
+                    continue
+                live_rows = [r for r in self.entities.get(name, ()) if self.alive[r]]
+                if live_rows:
+                    rows.update(dict.fromkeys(live_rows))
+                    covered += end - start
+                    taken.append((start, end))
+        if not rows:
+            return [], 0.0
+        scores = self.scores(query)
+        ranked = sorted(rows, key=lambda row: scores.get(row, 0.0), reverse=True)
+        return ranked, covered / total
+
+    def to_json(self) -> Dict:
+        rows = [r for r, alive in enumerate(self.alive) if alive]
+        return {"ids": [self.ids[r] for r in rows], "metadata": [self.metadata[r] for r in rows]}
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "_Namespace":
+        ns = cls()
+        for doc_id, metadata in zip(data.get("ids", []), data.get("metadata", [])):
+            ns.add(doc_id, metadata)
+        ns.dirty = False
+        return ns
+
+
+class LexicalIndex:
+    def __init__(self, root: Path = LEXICAL_INDEX_DIR, autosave: bool = True):
+        self.root = Path(root)
+        self.autosave = autosave
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._loaded_version: Dict[str, Optional[Tuple[int, int]]] = {}
+        # File locks kept until the end of deferred_save()
+        self._held: Dict[str, FileLock] = {}
+        self._lock = threading.RLock()
+
+    def _path(self, namespace: str) -> Path:
+        return self.root / f"{namespace or '__default__'}.json"
+
+    def _get(self, namespace: str) -> _Namespace:
+        path = self._path(namespace)
+        version = file_version(path)
+        ns = self._namespaces.get(namespace)
+        if ns is None or (not ns.dirty and version != self._loaded_version.get(namespace)):
+            if version is not None:
+                with open(path, "r", encoding="utf-8") as f:
+                    ns = _Namespace.from_json(json.load(f))
+            else:
+                ns = _Namespace()
+            self._namespaces[namespace] = ns
+            self._loaded_version[namespace] = version
+        return ns
+
+    @contextmanager
+    def _writing(self, namespace: str):
+        """
+        Reload-modify-save of one namespace under its file lock, so concurrent
+        writers in other processes don't drop each other's chunks. Inside
+        deferred_save() the lock is kept until the final save.
+        """
+        with self._lock:
+            lock = self._held.get(namespace)
+            if lock is None:
+                lock = FileLock(self._path(namespace).with_suffix(".lock"))
+                lock.acquire()
+                if not self.autosave:
+                    self._held[namespace] = lock
+            try:
+                ns = self._get(namespace)
+                yield ns
+                if self.autosave:
+                    self._save(namespace)
+            finally:
+                if self._held.get(namespace) is not lock:
+                    lock.release()
+
+    def _save(self, namespace: str) -> None:
+        ns = self._namespaces[namespace]
+        path = self._path(namespace)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(ns.to_json(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        ns.dirty = False
+        self._loaded_version[namespace] = file_version(path)
+
+    def add_documents(self, vectors: Iterable[Dict], namespace: str = "") -> None:
+        """
+        Indexes ``{"id", "metadata": {"text", ...}}`` items (the vector upsert format).
+        """
+        with self._writing(namespace) as ns:
+            for item in vectors:
+                metadata = item.get("metadata") or {}
+                if metadata.get("text"):
+                    ns.add(item["id"], metadata)
+
+    def delete(self, ids: Iterable[str] = (), namespace: str = "", filter: Optional[Dict] = None) -> None:
+        """
+        Removes the given ids and, with ``filter``, every chunk whose metadata matches it.
+        """
+        with self._writing(namespace) as ns:
+            if filter:
+                ids = list(ids) + [
+                    ns.ids[row] for row, alive in enumerate(ns.alive)
+                    if alive and matches_filter(ns.metadata[row], filter)
+                ]
+            for doc_id in ids:
+                ns.remove(doc_id)
+
+    def search(self, query: str, namespace: str = "", top_k: int = 10) -> List[Tuple[str, float, Dict]]:
+        with self._lock:
+            ns = self._get(namespace)
+            return [(ns.ids[row], score, ns.metadata[row]) for row, score in ns.search(query, top_k)]
+
+    def exact_match(self, query: str, namespace: str = "") -> Tuple[List[Tuple[str, float, Dict]], float]:
+        """
+        Chunks of the entities named in ``query``, best BM25 match first, with
+        their scores, and how much of the query the names cover.
+        """
+        with self._lock:
+            ns = self._get(namespace)
+            rows, coverage = ns.entity_matches(query)
+            scores = ns.scores(query) if rows else {}
+            return [(ns.ids[row], scores.get(row, 0.0), ns.metadata[row]) for row in rows], coverage
+
+    def save(self) -> None:
+        with self._lock:
+            try:
+                for namespace, ns in self._namespaces.items():
+                    if ns.dirty:
+                        self._save(namespace)
+            finally:
+                held, self._held = self._held, {}
+                for lock in held.values():
+                    lock.release()
+
+    @contextmanager
+    def deferred_save(self):
+        autosave = self.autosave
+        self.autosave = False
+        try:
+            yield self
+        finally:
+            self.autosave = autosave
+            self.save()
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuses several ranked id lists: score(id) = sum(1 / (k + rank)).
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+
+
+_lexical_index: Optional[LexicalIndex] = None
+
+
+def get_lexical_index() -> LexicalIndex:
+    global _lexical_index
+    if _lexical_index is None:
+        _lexical_index = LexicalIndex()
+    return _lexical_index
@@ -0,0 +1,277 @@
+"""
+Shared gateway for every DeepSeek chat call.
+
+One ChatOpenAI client per process for sync callers (WSGI views / celery), backed
+by a keep-alive httpx connection pool. Async callers get a client and semaphore
+per event loop: pooled asyncio connections are bound to the loop that opened
+them, and under WSGI every request to an async view runs on a fresh loop.
+Calls go through a bounded semaphore (callers queue for up to LLM_QUEUE_TIMEOUT
+seconds), get a per-call timeout, are retried with jittered exponential backoff
+on 429/5xx/timeouts, and their latency and token usage are accounted in ``stats()``.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+import openai
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_openai import ChatOpenAI
+
+LLM_MODEL = os.getenv("LLM_MODEL", "deepseek-chat")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.deepseek.com")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+)
+
+
+class LLMGatewayError(Exception):
+    pass
+
+
+class LLMQueueTimeout(LLMGatewayError):
+    pass
+
+
+class LLMStreamInterrupted(LLMGatewayError):
+    """
+    A retryable failure after part of the answer was streamed; callers that
+    only need the complete answer can replay the call.
+    """
+
+
+def backoff_delay(attempt: int) -> float:
+    # "Full jitter": uniform in [0, min(cap, base * 2^attempt)]
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+
+class LLMGateway:
+    def __init__(self, model: str = LLM_MODEL, base_url: str = LLM_BASE_URL,
+                 timeout: float = LLM_TIMEOUT, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT, max_retries: int = LLM_MAX_RETRIES):
+        self.model = model
+        self.base_url = base_url
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # event loop -> (ChatOpenAI on an AsyncClient of that loop, semaphore), dropped with the loop
+        self._loop_state: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, tuple]" = weakref.WeakKeyDictionary()
+        self._llm: Optional[ChatOpenAI] = None
+        self._init_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            "errors": 0,
+            "retries": 0,
+            "queue_timeouts": 0,
+            "in_flight": 0,
+            "total_latency": 0.0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+        }
+
+    def _make_llm(self, async_pool: bool) -> ChatOpenAI:
+        api_key = os.getenv("OPEN_ROUTER_API_KEY")
+        if not api_key:
+            raise ValueError("OPEN_ROUTER_API_KEY not found in environment variables")
+        limits = httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE)
+        timeout = httpx.Timeout(self.timeout, connect=LLM_CONNECT_TIMEOUT)
+        clients = (
+            {"http_async_client": httpx.AsyncClient(limits=limits, timeout=timeout)} if async_pool
+            else {"http_client": httpx.Client(limits=limits, timeout=timeout)}
+        )
+        return ChatOpenAI(
+            model=self.model,
+            api_key=api_key,
+            base_url=self.base_url,
+            temperature=0,
+            timeout=timeout,
+            # Retries are done here, with jitter, not inside the openai client
+            max_retries=0,
+            stream_usage=True,
+            **clients,
+        )
+
+    @property
+    def llm(self) -> ChatOpenAI:
+        if self._llm is None:
+            with self._init_lock:
+                if self._llm is None:
+                    self._llm = self._make_llm(async_pool=False)
+        return self._llm
+
+    def _loop_state_for(self, loop: asyncio.AbstractEventLoop) -> tuple:
+        state = self._loop_state.get(loop)
+        if state is None:
+            with self._init_lock:
+                state = self._loop_state.get(loop)
+                if state is None:
+                    state = (self._make_llm(async_pool=True), asyncio.Semaphore(self.max_concurrency))
+                    self._loop_state[loop] = state
+        return state
+
+    @property
+    def async_llm(self) -> ChatOpenAI:
+        """
+        The ChatOpenAI whose AsyncClient belongs to the running event loop.
+        """
+        return self._loop_state_for(asyncio.get_running_loop())[0]
+
+    @contextmanager
+    def _slot(self):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._record(queue_timeouts=1)
+            raise LLMQueueTimeout(f"No free LLM slot after {self.queue_timeout}s")
+        self._record(in_flight=1)
+        try:
+            yield
+        finally:
+            self._record(in_flight=-1)
+            self._slots.release()
+
+    @asynccontextmanager
+    async def _async_slot(self):
+        # asyncio primitives belong to one event loop, like the async connection pool
+        slots = self._loop_state_for(asyncio.get_running_loop())[1]
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._record(queue_timeouts=1)
+            raise LLMQueueTimeout(f"No free LLM slot after {self.queue_timeout}s")
+        self._record(in_flight=1)
+        try:
+            yield
+        finally:
+            self._record(in_flight=-1)
+            slots.release()
+
+    def _record(self, **deltas) -> None:
+        with self._stats_lock:
+            for key, value in deltas.items():
+                self._stats[key] += value
+
+    def _record_usage(self, message, started: float) -> None:
+        usage = getattr(message, "usage_metadata", None) or {}
+        self._record(
+            calls=1,
+            total_latency=time.monotonic() - started,
+            input_tokens=usage.get("input_tokens", 0),
+            output_tokens=usage.get("output_tokens", 0),
+        )
+
+    def invoke(self, messages: List[BaseMessage], timeout: Optional[float] = None, **kwargs) -> str:
+        """
+        Runs one chat completion and returns the answer text.
+        """
+        with self._slot():
+            for attempt in range(self.max_retries + 1):
+                started = time.monotonic()
+                try:
+                    response = self.llm.invoke(messages, timeout=timeout or self.timeout, **kwargs)
+                    self._record_usage(response, started)
+                    return response.content
+                except RETRYABLE_ERRORS as e:
+                    if attempt == self.max_retries:
+                        self._record(errors=1)
+                        raise LLMGatewayError(f"LLM call failed after {attempt + 1} attempts: {e}") from e
+                    delay = backoff_delay(attempt)
+                    print(f"LLM call failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+                    self._record(retries=1)
+                    time.sleep(delay)
+                except openai.OpenAIError as e:
+                    self._record(errors=1)
+                    raise LLMGatewayError(str(e)) from e
+
+    async def ainvoke(self, messages: List[BaseMessage], timeout: Optional[float] = None, **kwargs) -> str:
+        """
+        Async twin of invoke() for the ASGI views; waits on the network without holding a thread.
+        """
+        async with self._async_slot():
+            for attempt in range(self.max_retries + 1):
+                started = time.monotonic()
+                try:
+                    response = await self.async_llm.ainvoke(messages, timeout=timeout or self.timeout, **kwargs)
+                    self._record_usage(response, started)
+                    return response.content
+                except RETRYABLE_ERRORS as e:
+                    if attempt == self.max_retries:
+                        self._record(errors=1)
+                        raise LLMGatewayError(f"LLM call failed after {attempt + 1} attempts: {e}") from e
+                    delay = backoff_delay(attempt)
+                    print(f"LLM call failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+                    self._record(retries=1)
+                    await asyncio.sleep(delay)
+                except openai.OpenAIError as e:
+                    self._record(errors=1)
+                    raise LLMGatewayError(str(e)) from e
+
+    def stream(self, messages: List[BaseMessage], timeout: Optional[float] = None, **kwargs) -> Iterator[str]:
+        """
+        Yields answer text as it is generated. Only failures before the
+        first token are retried, a half-sent answer can't be replayed.
+        """
+        with self._slot():
+            for attempt in range(self.max_retries + 1):
+                started = time.monotonic()
+                sent_any = False
+                usage_chunk = None
+                try:
+                    for chunk in self.llm.stream(messages, timeout=timeout or self.timeout, **kwargs):
+                        if getattr(chunk, "usage_metadata", None):
+                            usage_chunk = chunk
+                        if chunk.content:
+                            sent_any = True
+                            yield chunk.content
+                    self._record_usage(usage_chunk, started)
+                    return
+                except RETRYABLE_ERRORS as e:
+                    if sent_any:
+                        self._record(errors=1)
+                        raise LLMStreamInterrupted(f"LLM stream failed mid-answer: {e}") from e
+                    if attempt == self.max_retries:
+                        self._record(errors=1)
+                        raise LLMGatewayError(f"LLM stream failed: {e}") from e
+                    delay = backoff_delay(attempt)
+                    print(f"LLM stream failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+                    self._record(retries=1)
+                    time.sleep(delay)
+                except openai.OpenAIError as e:
+                    self._record(errors=1)
+                    raise LLMGatewayError(str(e)) from e
+
+    def complete(self, prompt: str, **kwargs) -> str:
+        """
+        Single user-message prompt, the shape request_OpenRouter callers use.
+        """
+        return self.invoke([HumanMessage(content=prompt)], **kwargs)
+
+    async def acomplete(self, prompt: str, **kwargs) -> str:
+        return await self.ainvoke([HumanMessage(content=prompt)], **kwargs)
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["avg_latency"] = stats["total_latency"] / stats["calls"] if stats["calls"] else 0.0
+        return stats
+
+
+gateway = LLMGateway()
@@ -0,0 +1,100 @@
+"""
+Bounded conversation memory for /ask_ai/.
+
+The prompt gets the last MEMORY_TURNS question/answer pairs (each message cut to
+MEMORY_MESSAGE_MAX_CHARS) plus ``Conversation.summary``, a rolling summary of
+everything older. After each assistant message the messages that slid out of the
+window are folded into the summary by a celery task, so the prompt stays the
+same size however long the thread gets and the request never waits on it.
+"""
+import os
+from typing import Dict
+
+from django.db import transaction
+
+from .llm_gateway import gateway
+from .models import Conversation, Message
+
+MEMORY_TURNS = int(os.getenv("MEMORY_TURNS", "3"))
+MEMORY_MESSAGE_MAX_CHARS = int(os.getenv("MEMORY_MESSAGE_MAX_CHARS", "800"))
+SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_CHARS", "1000"))
+
+
+def _clip(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def get_history(conversation: Conversation) -> Dict:
+    """
+    ``{"summary": str, "turns": [(role, content), ...]}`` for the conversation as
+    it is now; call it before saving the new user message.
+    """
+    recent = list(conversation.messages.order_by('-id')[:MEMORY_TURNS * 2])
+    recent.reverse()
+    return {
+        "summary": conversation.summary,
+        "turns": [(m.role, _clip(m.content, MEMORY_MESSAGE_MAX_CHARS)) for m in recent],
+    }
+
+
+def summary_update_pending(conversation_id: int) -> bool:
+    """
+    True if messages have left the recent-turns window without being summarized.
+    """
+    conversation = Conversation.objects.get(id=conversation_id)
+    return (
+        Message.objects.filter(conversation_id=conversation_id, id__gt=conversation.summarized_message_id)
+        .count() > MEMORY_TURNS * 2
+    )
+
+
+def schedule_summary_update(conversation_id: int) -> None:
+    """
+    Queues the summary update once the assistant message is committed.
+    """
+    from .tasks import summarize_conversation_task
+
+    if summary_update_pending(conversation_id):
+        transaction.on_commit(lambda: summarize_conversation_task.delay(conversation_id))
+
+
+def update_summary(conversation_id: int) -> bool:
+    """
+    Folds the messages older than the recent-turns window into the rolling summary.
+    Only the new messages are sent to the model, together with the old summary.
+    """
+    conversation = Conversation.objects.get(id=conversation_id)
+    window = list(
+        Message.objects.filter(conversation_id=conversation_id)
+        .order_by('-id').values_list('id', flat=True)[:MEMORY_TURNS * 2]
+    )
+    if len(window) < MEMORY_TURNS * 2:
+        return False
+    new_messages = list(
+        Message.objects.filter(
+            conversation_id=conversation_id,
+            id__gt=conversation.summarized_message_id,
+            id__lt=min(window),
+        ).order_by('id')
+    )
+    if not new_messages:
+        return False
+
+    transcript = "\n".join(
+        f"{'用户' if m.role == 'user' else '助手'}：{_clip(m.content, MEMORY_MESSAGE_MAX_CHARS)}"
+        for m in new_messages
+    )
+    prompt = (
+        "你在为一段《金铲铲之战》问答对话维护摘要。\n"
+        f"【已有摘要】：\n{conversation.summary or '（无）'}\n\n"
+        f"【新增对话】：\n{transcript}\n\n"
+        f"请把新增对话合并进摘要，保留用户的目标、提到的阵容/英雄/装备和已经得出的结论，"
+        f"不超过{SUMMARY_MAX_CHARS}字，只输出摘要本身。"
+    )
+    summary = _clip(gateway.complete(prompt).strip(), SUMMARY_MAX_CHARS)
+
+    # Compare-and-set, so a slower concurrent update can't overwrite a newer summary
+    updated = Conversation.objects.filter(
+        id=conversation_id, summarized_message_id=conversation.summarized_message_id
+    ).update(summary=summary, summarized_message_id=new_messages[-1].id)
+    return bool(updated)
@@ -5,6 +5,9 @@ class Conversation(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='conversations', null=True, blank=True)
     title = models.CharField(max_length=255, default="New Conversation")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Rolling summary of the messages older than the recent-turns window (see memory.py)
+    summary = models.TextField(blank=True, default="")
+    summarized_message_id = models.BigIntegerField(default=0)
 
     def __str__(self):
         return self.title
@@ -24,3 +27,16 @@ class Message(models.Model):
 
     def __str__(self):
         return f"{self.role}: {self.content[:50]}..."
+
+
+class ImageSearchCache(models.Model):
+    """
+    Image search results per normalized query (see image_cache.py).
+    """
+    query = models.CharField(max_length=255, unique=True)
+    results = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.query
@@ -1,31 +1,35 @@
-from typing import Dict, List, Any
+from typing import Dict, Iterable, List, Any
 import os
-import requests
-import json
+import asyncio
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
 from pinecone import Pinecone
-try:
-    from google_images_search import GoogleImagesSearch
-except ImportError:
-    GoogleImagesSearch = None
-    print("Warning: google_images_search not found or curses missing. Image search will be disabled.")
-
-from requests.exceptions import RequestException
+from asgiref.sync import sync_to_async
 from django.core.cache import cache
+from django.db import DatabaseError, close_old_connections
 import random
+import time
+import httpx
+from .embedding_cache import EMBED_MODEL, embed_query
+from .namespace_router import NamespaceRouter, RouteDecision
+from .vector_store import get_vector_store
+from .retrieval import hybrid_search, lexical_fast_path
+from .context_packing import pack_context
+from .llm_gateway import LLMStreamInterrupted, backoff_delay, gateway
+from .image_cache import get_images, store_images
+from .cancellation import CANCEL_POLL_INTERVAL, checkpoint, consume_stream, is_cancelled
+from langchain_core.messages import HumanMessage
 load_dotenv()
-global gis
-if GoogleImagesSearch:
-    gis = GoogleImagesSearch(developer_key=os.getenv("GOOGLE_API_KEY"), custom_search_cx=os.getenv("CX"))
-else:
-    gis = None
-
-OR_API_KEY=os.getenv("OPEN_ROUTER_API_KEY")
 try:
     pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-    index = pc.Index("teamfight-tactics-knowledges")
 except Exception as e:
     print(f"Warning: Pinecone initialization failed: {e}")
+    pc = None
+try:
+    index = get_vector_store()
+except Exception as e:
+    print(f"Warning: vector store initialization failed: {e}")
     index = None
 
 topics_query:str="Generate key gameplay aspects for Teamfight Tactics (Golden Spatula) related to this topic. " \
@@ -36,50 +40,176 @@ topics_query:str="Generate key gameplay aspects for Teamfight Tactics (Golden Sp
     "eg-{'namespace': 'compositions', 'topics': ['level_8_board', 'carry_items', ....]}"\
     "namespace list-compositions,items,champions,traits,augments,economy_leveling,positioning,patch_notes,game_mechanics"
 
-def request_OpenRouter(query:str)->str:
-    response = requests.post(
-        url="https://api.deepseek.com/chat/completions",
-        headers={
-            "Authorization": f"Bearer {OR_API_KEY}",
-            "Content-Type": "application/json",
-        },
-        data=json.dumps({
-            "model": "deepseek-chat",
-            "messages": [
-            {
-                "role": "user",
-                "content": f"{query}"
-            }
-            ],
-            "parameters": {
-        "language": "en"  # Specify language preference
+def _router_embed(texts:List[str], input_type:str)->List[List[float]]:
+    if input_type == "query":
+        # Cached, and reused when the same text is embedded for retrieval
+        return [embed_query(pc, text) for text in texts]
+    if not pc:
+        raise ValueError("Pinecone not initialized")
+    response = pc.inference.embed(model=EMBED_MODEL, inputs=texts, parameters={"input_type": input_type})
+    return [item['values'] for item in response]
+
+namespace_router = NamespaceRouter(_router_embed, EMBED_MODEL)
+
+def route_query(query:str)->RouteDecision:
+    """
+    Local namespace + topics decision for a note query; ``decision.confident`` is
+    False when the caller should fall back to the topics_query LLM call.
+    """
+    return namespace_router.route(query)
+
+def request_OpenRouter(query:str, cancel_id:str=None)->str:
+    # Goes through the shared LLM gateway: pooled connections, timeouts, retries
+    if cancel_id is None:
+        return gateway.complete(query)
+    # Streamed so a cancelled task can drop the HTTP response mid-answer
+    for attempt in range(gateway.max_retries + 1):
+        checkpoint(cancel_id)
+        try:
+            return consume_stream(gateway.stream([HumanMessage(content=query)]), cancel_id)
+        except LLMStreamInterrupted as e:
+            # Only the complete answer is used, so a cut-off stream is replayed like complete() retries
+            if attempt == gateway.max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"LLM stream interrupted ({e}), replaying in {delay:.2f}s")
+            time.sleep(delay)
+
+
+
+async def arequest_OpenRouter(query:str)->str:
+    return await gateway.acomplete(query)
+
+GOOGLE_SEARCH_URL = "https://www.googleapis.com/customsearch/v1"
+PLACEHOLDER_IMAGE = "https://via.placeholder.com/150"
+IMAGE_SEARCH_WORKERS = int(os.getenv("IMAGE_SEARCH_WORKERS", "6"))
+# One AsyncClient per event loop: its pooled connections can't be reused from another loop
+_async_http: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_http: httpx.Client | None = None
+_image_pool = ThreadPoolExecutor(max_workers=IMAGE_SEARCH_WORKERS, thread_name_prefix="image-search")
+
+def _image_search_params(query:str, num:int)->Dict:
+    return {
+        "key": os.getenv("GOOGLE_API_KEY"),
+        "cx": os.getenv("CX"),
+        "q": query,
+        "searchType": "image",
+        "num": num,
     }
 
-        })
-        )
-    return response.json()['choices'][0]['message']['content']
+def search_images(query:str, num:int=5)->List[str]:
+    """
+    Blocking Google Custom Search image lookup on a shared httpx.Client.
+    Safe to call from several threads; the connection pool is sized to the
+    image-search thread pool.
+    """
+    global _http
+    if _http is None:
+        limits = httpx.Limits(max_connections=IMAGE_SEARCH_WORKERS, max_keepalive_connections=IMAGE_SEARCH_WORKERS)
+        _http = httpx.Client(timeout=httpx.Timeout(10.0), limits=limits)
+    response = _http.get(GOOGLE_SEARCH_URL, params=_image_search_params(query, num))
+    response.raise_for_status()
+    return [item["link"] for item in response.json().get("items", [])]
+
+async def async_search_images(query:str, num:int=5)->List[str]:
+    """
+    Google Custom Search image lookup for the async views, on an httpx.AsyncClient
+    shared by the requests of the running event loop (one per request under WSGI).
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_http.get(loop)
+    if client is None:
+        client = _async_http[loop] = httpx.AsyncClient(timeout=httpx.Timeout(10.0))
+    response = await client.get(GOOGLE_SEARCH_URL, params=_image_search_params(query, num))
+    response.raise_for_status()
+    return [item["link"] for item in response.json().get("items", [])]
+
+def cached_search_images(query:str)->List[str]:
+    """
+    Image urls for the query from the persistent cache (image_cache.py),
+    searching and caching them on a miss. A cache that can't be read or
+    written (DB down or locked) only costs a live search.
+    """
+    try:
+        urls = get_images(query)
+    except DatabaseError as e:
+        print(f"Image cache unavailable, searching live: {e}")
+        urls = None
+    if urls is None:
+        urls = search_images(query)
+        try:
+            store_images(query, urls)
+        except DatabaseError as e:
+            print(f"Could not cache images for '{query}': {e}")
+    return urls
+
+async def acached_search_images(query:str)->List[str]:
+    try:
+        urls = await sync_to_async(get_images)(query)
+    except DatabaseError as e:
+        print(f"Image cache unavailable, searching live: {e}")
+        urls = None
+    if urls is None:
+        urls = await async_search_images(query)
+        try:
+            await sync_to_async(store_images)(query, urls)
+        except DatabaseError as e:
+            print(f"Could not cache images for '{query}': {e}")
+    return urls
+
+def resolve_images(queries:Iterable[str], cancel_id:str=None)->Dict[str, str]:
+    """
+    Looks up the first image for every query concurrently on the bounded
+    image-search pool; repeated queries are searched once. Returns query -> url,
+    so the caller waits only for the slowest lookup. If the task ``cancel_id``
+    is cancelled meanwhile, lookups not started yet are dropped.
+    """
+    futures = {query: submit_image_lookup(query) for query in dict.fromkeys(queries)}
+    pending = set(futures.values())
+    while cancel_id and pending:
+        _, pending = wait(pending, timeout=CANCEL_POLL_INTERVAL)
+        if pending and is_cancelled(cancel_id):
+            for future in pending:
+                future.cancel()
+            checkpoint(cancel_id)
+    return {query: future.result() for query, future in futures.items()}
+
+def submit_image_lookup(query:str)->Future:
+    """
+    Starts a google_search_image lookup on the image-search pool.
+    """
+    return _image_pool.submit(_pooled_image_lookup, query)
 
+def _pooled_image_lookup(query:str)->str:
+    # Pool threads live outside the request cycle, release their DB connection like a request would
+    close_old_connections()
+    try:
+        return google_search_image(query)
+    finally:
+        close_old_connections()
 
+async def anew_image(query:str)->str:
+    # Same as new_image: without a key the search would only fail, and cache that empty result
+    if not os.getenv("GOOGLE_API_KEY"):
+        return PLACEHOLDER_IMAGE
+    try:
+        urls = await acached_search_images(query)
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"Image search failed for '{query}': {e}")
+        return PLACEHOLDER_IMAGE
+    return random.choice(urls) if urls else PLACEHOLDER_IMAGE
 
 def get_context(topic:str,namespace:str)->Dict:
 
     try:
-        query_embedding=pc.inference.embed(
-                model="llama-text-embed-v2",
-                inputs=[topic],
-                parameters={"input_type": "query"},
-            )[0].values
-        results = index.query(
-                namespace=namespace,
-                vector=query_embedding,
-                top_k=3,
-                include_metadata=True
-            )
-        if results.matches: # type: ignore
-                # Fetch relevant documents from Pinecone
-                relevant_docs = [
-                    match.metadata["text"] for match in results.matches # type: ignore
-                ]
+        # Exact entity lookups skip the embedding call, everything else is BM25 + vector
+        matches = lexical_fast_path(topic, namespace=namespace, top_k=3)
+        if matches is None:
+            query_embedding=embed_query(pc, topic)
+            matches = hybrid_search(topic, query_embedding, namespace=namespace, top_k=3)
+        if matches:
+                # Overlapping neighbours are merged, near-duplicates dropped
+                relevant_docs = pack_context(matches)["blocks"]
                 return {"message": "Relevant documents found", "documents": relevant_docs}
         else:
             return{"message":"No relevant documents found"}
@@ -89,21 +219,24 @@ def get_context(topic:str,namespace:str)->Dict:
 
 
 def google_search_image(query: str) -> str:
-    if not gis:
-        return "https://via.placeholder.com/150"
+    if not os.getenv("GOOGLE_API_KEY"):
+        return PLACEHOLDER_IMAGE
     try:
-        gis.search(search_params={'q': query, 'num': 1})
-        image_url = gis.results()[0].url if gis.results() else "https://via.placeholder.com/150"
-
-        return image_url
-    except (IndexError, RequestException, Exception):
-        return "https://via.placeholder.com/150"
+        urls = cached_search_images(query)
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"Image search failed for '{query}': {e}")
+        return PLACEHOLDER_IMAGE
+    return urls[0] if urls else PLACEHOLDER_IMAGE
 
 def new_image(query:str)->str:
-    if not gis:
-        return "https://via.placeholder.com/150"
-    gis.search(search_params={'q': query, 'num': 5})
-    image_url = gis.results()[random.randint(0,5)].url if gis.results() else "https://via.placeholder.com/150"
-    return image_url
+    # A different pick from the cached result list, no new search
+    if not os.getenv("GOOGLE_API_KEY"):
+        return PLACEHOLDER_IMAGE
+    try:
+        urls = cached_search_images(query)
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"Image search failed for '{query}': {e}")
+        return PLACEHOLDER_IMAGE
+    return random.choice(urls) if urls else PLACEHOLDER_IMAGE
 if __name__ == "__main__":
     print(google_search_image("Eiffel Tower"))
@@ -0,0 +1,220 @@
+"""
+Local namespace router for note generation.
+
+Classifies a query into one of the namespaces in namespaces.py by nearest
+centroid: every namespace has a few seed phrases (its description, subtopics and
+typical questions, in English and Chinese) whose normalized embeddings are
+averaged into a centroid. The centroids are computed once per embedding model
+and cached in LOCAL_DATA_DIR. The note topics are the ROUTER_TOPICS subtopics
+of the chosen namespace that are most similar to the query.
+
+When embeddings are unavailable a keyword match is used instead. Callers fall
+back to the LLM (``myutils.topics_query``) only when neither is confident.
+Like vector_store.py this module must stay importable without Django.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from .kb_version import LOCAL_DATA_DIR
+from .namespaces import NAMESPACES
+
+ROUTER_CENTROIDS_FILE = Path(os.getenv("ROUTER_CENTROIDS_FILE", LOCAL_DATA_DIR / "namespace_centroids.npz"))
+# Cosine similarity of the best centroid, and its lead over the runner-up, needed to skip the LLM.
+# Centroid accuracy against the LLM has not been measured yet (benchmarks/bench_namespace_router.py),
+# so these stay strict and only clear-cut queries skip the LLM; lower them once the benchmark backs it.
+ROUTER_MIN_SCORE = float(os.getenv("ROUTER_MIN_SCORE", "0.5"))
+ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", "0.08"))
+ROUTER_TOPICS = int(os.getenv("ROUTER_TOPICS", "4"))
+# Share of the keyword hits the best namespace needs over the runner-up (1 hit vs 0, 2 vs 1 pass; 3 vs 2 doesn't)
+ROUTER_KEYWORD_MIN_CONFIDENCE = float(os.getenv("ROUTER_KEYWORD_MIN_CONFIDENCE", "0.65"))
+
+NAMESPACE_SEEDS = {
+    "compositions": [
+        "team compositions and boards", "meta comps tier list", "reroll comp", "fast 8 comp",
+        "how to play this comp", "阵容", "阵容推荐", "上分阵容", "阵容怎么玩", "站位",
+    ],
+    "items": [
+        "item combinations and recipes", "best items for a champion", "radiant items", "artifacts",
+        "装备", "装备合成", "出什么装备", "神器装备", "光明装备",
+    ],
+    "champions": [
+        "champion abilities and stats", "which units to carry", "5 cost champions",
+        "英雄", "棋子", "英雄技能", "主C", "几费卡",
+    ],
+    "traits": [
+        "trait synergies and breakpoints", "origins and classes", "spatula emblems",
+        "羁绊", "羁绊效果", "转职", "金铲铲转职",
+    ],
+    "augments": [
+        "augment choices", "prismatic augments", "gold augments", "silver augments",
+        "海克斯", "海克斯强化", "强化符文", "选什么海克斯",
+    ],
+    "game_mechanics": [
+        "leveling and economy", "rolling odds", "interest and streaks", "damage calculation",
+        "运营", "经济", "升级节奏", "D牌概率", "连胜连败",
+    ],
+    "patch_notes": [
+        "patch notes buffs and nerfs", "what changed this patch", "balance changes",
+        "版本更新", "补丁", "加强", "削弱", "版本改动",
+    ],
+}
+
+ROUTER_KEYWORDS = {
+    "compositions": ["comp", "composition", "board", "reroll", "阵容", "站位", "运营阵容"],
+    "items": ["item", "artifact", "radiant", "装备", "神器", "光明"],
+    "champions": ["champion", "unit", "carry", "英雄", "棋子", "主c"],
+    "traits": ["trait", "synergy", "emblem", "origin", "class", "羁绊", "转职"],
+    "augments": ["augment", "海克斯", "强化"],
+    "game_mechanics": ["econ", "economy", "level", "leveling", "roll", "odds", "interest", "经济", "升级", "概率", "利息"],
+    "patch_notes": ["patch", "buff", "nerf", "update", "版本", "补丁", "加强", "削弱"],
+}
+
+
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+
+
+def _keyword_pattern(keyword: str) -> "re.Pattern":
+    # CJK has no word boundaries; latin keywords match whole words, plurals included ("class" not in "classic")
+    if _CJK_RE.search(keyword):
+        return re.compile(re.escape(keyword))
+    return re.compile(rf"(?<![a-z0-9]){re.escape(keyword)}(?:s|es)?(?![a-z0-9])")
+
+
+# Longest keywords first so "运营阵容" isn't also counted as "阵容"
+_KEYWORD_PATTERNS = {
+    ns: [_keyword_pattern(kw) for kw in sorted(kws, key=len, reverse=True)] for ns, kws in ROUTER_KEYWORDS.items()
+}
+
+
+@dataclass
+class RouteDecision:
+    namespace: Optional[str]
+    topics: List[str] = field(default_factory=list)
+    confidence: float = 0.0
+    method: str = "none"  # "centroid", "keyword" or "none" (caller should ask the LLM)
+
+    @property
+    def confident(self) -> bool:
+        return self.method != "none"
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def _humanize(topic: str) -> str:
+    return topic.replace("_", " ")
+
+
+def _keyword_hits(text: str, patterns: List["re.Pattern"]) -> int:
+    hits = 0
+    for pattern in patterns:
+        text, count = pattern.subn(" ", text)
+        hits += count
+    return hits
+
+
+def keyword_route(query: str) -> RouteDecision:
+    """
+    Namespace whose keywords occur in the query, if it clearly leads the runner-up
+    (ROUTER_KEYWORD_MIN_CONFIDENCE).
+    """
+    text = query.lower()
+    hits = {ns: _keyword_hits(text, patterns) for ns, patterns in _KEYWORD_PATTERNS.items()}
+    ranked = sorted(hits.items(), key=lambda kv: kv[1], reverse=True)
+    (best, best_hits), (_, second_hits) = ranked[0], ranked[1]
+    if best_hits == 0:
+        return RouteDecision(namespace=None)
+    confidence = best_hits / (best_hits + second_hits)
+    if confidence < ROUTER_KEYWORD_MIN_CONFIDENCE:
+        return RouteDecision(namespace=None)
+    return RouteDecision(best, NAMESPACES[best][:ROUTER_TOPICS], confidence, "keyword")
+
+
+class NamespaceRouter:
+    """
+    ``embed(texts, input_type)`` returns one embedding per text (e.g. Pinecone Inference).
+    """
+
+    def __init__(self, embed: Callable[[List[str], str], List[List[float]]], model: str,
+                 path: Path = ROUTER_CENTROIDS_FILE):
+        self.embed = embed
+        self.model = model
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._labels: List[str] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._topic_vectors: Dict[str, np.ndarray] = {}
+
+    def _fingerprint(self) -> str:
+        payload = json.dumps([self.model, NAMESPACE_SEEDS, NAMESPACES], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load_or_build(self) -> None:
+        if self._centroids is not None:
+            return
+        with self._lock:
+            if self._centroids is not None:
+                return
+            fingerprint = self._fingerprint()
+            if self.path.exists():
+                with np.load(self.path, allow_pickle=False) as data:
+                    if str(data["fingerprint"]) == fingerprint:
+                        labels = [str(label) for label in data["labels"]]
+                        self._topic_vectors = {ns: data[f"topics_{ns}"] for ns in labels}
+                        self._labels, self._centroids = labels, data["centroids"]
+                        return
+            self._build(fingerprint)
+
+    def _build(self, fingerprint: str) -> None:
+        labels = list(NAMESPACES)
+        centroids = []
+        arrays = {}
+        for ns in labels:
+            topics = [_humanize(topic) for topic in NAMESPACES[ns]]
+            vectors = _normalize(np.asarray(self.embed(NAMESPACE_SEEDS.get(ns, []) + topics, "passage"), dtype=np.float32))
+            centroids.append(_normalize(vectors.mean(axis=0)))
+            arrays[f"topics_{ns}"] = vectors[-len(topics):]
+        centroids = np.stack(centroids)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.stem}.{os.getpid()}.tmp.npz")
+        np.savez(tmp_path, fingerprint=np.array(fingerprint), labels=np.array(labels),
+                 centroids=centroids, **arrays)
+        os.replace(tmp_path, self.path)
+        self._topic_vectors = {ns: arrays[f"topics_{ns}"] for ns in labels}
+        self._labels, self._centroids = labels, centroids
+
+    def route(self, query: str, query_embedding: Optional[List[float]] = None) -> RouteDecision:
+        """
+        Centroid decision if confident, else the keyword decision (which may be "none").
+        """
+        try:
+            self._load_or_build()
+            if query_embedding is None:
+                query_embedding = self.embed([query], "query")[0]
+        except Exception as e:
+            print(f"Namespace router: embeddings unavailable ({e}), using keywords")
+            return keyword_route(query)
+
+        vector = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        scores = self._centroids @ vector
+        order = np.argsort(-scores)
+        best, second = int(order[0]), int(order[1])
+        score, margin = float(scores[best]), float(scores[best] - scores[second])
+        if score < ROUTER_MIN_SCORE or margin < ROUTER_MIN_MARGIN:
+            return keyword_route(query)
+
+        namespace = self._labels[best]
+        topic_scores = self._topic_vectors[namespace] @ vector
+        # The most relevant subtopics, kept in outline order
+        chosen = sorted(np.argsort(-topic_scores)[:ROUTER_TOPICS])
+        return RouteDecision(namespace, [NAMESPACES[namespace][i] for i in chosen], score, "centroid")
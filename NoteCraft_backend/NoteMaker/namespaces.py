@@ -0,0 +1,68 @@
+"""
+Golden Spatula (TFT) knowledge-base namespaces and their subtopics.
+"""
+
+# "" is Pinecone's default namespace, where the scraped data lives
+DEFAULT_NAMESPACE = ""
+# Uploaded PDFs are indexed only here (UserData.tasks.ingest_document_task)
+UPLOAD_NAMESPACE = "patch_notes"
+
+NAMESPACES = {
+    "compositions": [
+        "meta_comps",
+        "reroll_comps",
+        "fast_8_comps",
+        "level_9_comps",
+        "early_game_boards"
+    ],
+    "items": [
+        "item_combinations",
+        "radiant_items",
+        "artifact_items",
+        "support_items",
+        "best_in_slot"
+    ],
+    "champions": [
+        "1_cost_units",
+        "2_cost_units",
+        "3_cost_units",
+        "4_cost_units",
+        "5_cost_units",
+        "hero_augments"
+    ],
+    "traits": [
+        "origin_traits",
+        "class_traits",
+        "trait_breakpoints",
+        "spatula_emblems"
+    ],
+    "augments": [
+        "silver_augments",
+        "gold_augments",
+        "prismatic_augments",
+        "hero_augments"
+    ],
+    "game_mechanics": [
+        "leveling_guide",
+        "economy_management",
+        "rolling_odds",
+        "pool_sizes",
+        "damage_calculation"
+    ],
+    "patch_notes": [
+        "buffs",
+        "nerfs",
+        "system_changes",
+        "reworks"
+    ]
+}
+
+
+def parse_namespaces(value: str) -> list:
+    """
+    Parses a comma separated env value; "default" stands for the default namespace.
+    """
+    return [
+        DEFAULT_NAMESPACE if name.strip() == "default" else name.strip()
+        for name in value.split(",") if name.strip()
+    ]
@@ -0,0 +1,78 @@
+"""
+Cache of generated notes: normalized query -> task id of the note task.
+
+Entries remember the knowledge-base version they were generated against and go
+stale as soon as it changes (any upsert or delete bumps it). A repeat request
+gets the task id of the finished (or still running) generation, whose result is
+read as usual through TaskStatusView. Entries live no longer than celery keeps
+task results, so the id always resolves.
+"""
+import hashlib
+import os
+import re
+import time
+import unicodedata
+from typing import Optional
+
+from celery.result import AsyncResult
+from django.conf import settings
+from django.core.cache import caches
+
+from .cancellation import is_cancelled
+from .kb_version import get_kb_version
+
+NOTE_CACHE_TTL = int(os.getenv("NOTE_CACHE_TTL", str(getattr(settings, "CELERY_RESULT_EXPIRES", 24 * 3600))))
+# A generation that hasn't finished after this long is assumed lost and redone
+NOTE_INFLIGHT_TIMEOUT = int(os.getenv("NOTE_INFLIGHT_TIMEOUT", "600"))
+
+note_cache = caches['shared']
+
+_SPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?？!！.。,，]+$")
+
+
+def normalize_query(query: str) -> str:
+    query = unicodedata.normalize("NFKC", query).lower()
+    return _TRAILING_PUNCT_RE.sub("", _SPACE_RE.sub(" ", query).strip())
+
+
+def _key(query: str) -> str:
+    return "note:" + hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+def lookup(query: str) -> Optional[str]:
+    """
+    Task id of a reusable generation for the query, or None.
+    """
+    entry = note_cache.get(_key(query))
+    if entry is None or entry["kb_version"] != get_kb_version() or is_cancelled(entry["task_id"]):
+        return None
+    if not entry["done"]:
+        # Identical request while the first one is still running: share it
+        return entry["task_id"] if time.time() - entry["started"] < NOTE_INFLIGHT_TIMEOUT else None
+    result = AsyncResult(entry["task_id"])
+    if result.state != "SUCCESS" or not (result.result or {}).get("success"):
+        return None
+    return entry["task_id"]
+
+
+def reserve(query: str, task_id: str) -> None:
+    """
+    Records a generation about to start, before the task is queued.
+    """
+    note_cache.set(_key(query), {
+        "task_id": task_id,
+        "kb_version": get_kb_version(),
+        "started": time.time(),
+        "done": False,
+    }, NOTE_CACHE_TTL)
+
+
+def mark_done(query: str, task_id: str, success: bool) -> None:
+    entry = note_cache.get(_key(query))
+    if entry is None or entry["task_id"] != task_id:
+        return
+    if success:
+        note_cache.set(_key(query), {**entry, "done": True}, NOTE_CACHE_TTL)
+    else:
+        note_cache.delete(_key(query))
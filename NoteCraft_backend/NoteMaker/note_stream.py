@@ -0,0 +1,247 @@
+"""
+Streaming note generation for /generate_note/stream/.
+
+Same topics and section prompts as generate_notes_task, but every section is
+streamed from DeepSeek. Up to NOTE_STREAM_FANOUT sections run at once on a
+thread pool and each finished one starts the next, so a single note never takes
+all of the gateway's LLM_MAX_CONCURRENCY slots (every streamed section holds one
+for its whole answer) and concurrent notes don't time out queueing for them.
+The first section is forwarded live and the others are buffered and flushed in
+order as soon as their predecessor ends, so the first heading arrives after one
+round trip.
+
+``NoteStreamParser`` strips the ```markdown fence and cuts
+``&&&image:(...)&&&`` markers out of the token stream as soon as they are
+complete; each one starts an image lookup right away and is resolved in place
+(``image`` / ``image_resolved`` events) while text keeps flowing.
+"""
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Tuple
+
+from langchain_core.messages import HumanMessage
+
+from .llm_gateway import LLM_MAX_CONCURRENCY, gateway
+from .myutils import get_context, submit_image_lookup
+from .tasks import pick_topics, section_prompt
+
+NOTE_STREAM_WORKERS = int(os.getenv("NOTE_STREAM_WORKERS", "16"))
+# Sections of one note streamed at once, kept below the gateway limit
+NOTE_STREAM_FANOUT = max(1, min(int(os.getenv("NOTE_STREAM_FANOUT", "3")), LLM_MAX_CONCURRENCY - 1))
+# A marker longer than this is not an image marker, flush it as text
+MAX_MARKER_LENGTH = 300
+# Text before the opening fence is held up to this length; past it the model is taken not to use one
+PREAMBLE_LIMIT = 400
+
+_section_pool = ThreadPoolExecutor(max_workers=NOTE_STREAM_WORKERS, thread_name_prefix="note-stream")
+
+FENCE_OPEN = "```markdown"
+FENCE_CLOSE = "```"
+MARKER = "&&&"
+
+
+class NoteStreamParser:
+    """
+    Incremental parser for one section's raw LLM output. ``feed`` returns the
+    segments that are complete so far: ``("text", str)`` or ``("image", query)``.
+    Like _extract_block, text before the opening fence is a preamble and dropped.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.started = False
+        self.fenced = False
+        self.finished = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        if self.finished:
+            return []
+        self.buffer += chunk
+        if not self.started and not self._start(final=False):
+            return []
+        return self._drain(final=False)
+
+    def close(self) -> List[Tuple[str, str]]:
+        if self.finished:
+            return []
+        if not self.started:
+            self._start(final=True)
+        return self._drain(final=True)
+
+    def _start(self, final: bool) -> bool:
+        start = self.buffer.find(FENCE_OPEN)
+        if start != -1:
+            rest = self.buffer[start + len(FENCE_OPEN):]
+            if not final and not rest.strip("\n"):
+                # Keep the newline after the fence from leaking into the notes
+                return False
+            self.buffer = rest.lstrip("\n")
+            self.fenced = True
+        elif not final and len(self.buffer) < PREAMBLE_LIMIT and not self.buffer.lstrip().startswith("#"):
+            # Wait for the fence unless the section already started (it opens with a heading)
+            return False
+        else:
+            self.buffer = self.buffer.lstrip("\n")
+        self.started = True
+        return True
+
+    def _drain(self, final: bool) -> List[Tuple[str, str]]:
+        segments = []
+        while self.buffer:
+            fence = self.buffer.find(FENCE_CLOSE)
+            marker = self.buffer.find(MARKER)
+            if fence != -1 and (marker == -1 or fence < marker):
+                tail = self.buffer[fence:]
+                if not self.fenced and tail.startswith(FENCE_OPEN):
+                    # The fence came after a long preamble: drop what is left of it, the section starts here
+                    self.buffer = tail[len(FENCE_OPEN):].lstrip("\n")
+                    self.fenced = True
+                    continue
+                if not self.fenced and not final and FENCE_OPEN.startswith(tail):
+                    # Can't tell an opening from a closing fence yet
+                    segments.append(("text", self.buffer[:fence]))
+                    self.buffer = tail
+                    break
+                segments.append(("text", self.buffer[:fence]))
+                self.buffer = ""
+                self.finished = True
+                break
+            if marker == -1:
+                # Hold back a tail that could be the start of a marker or the closing fence
+                hold = 0 if final else max(_partial_suffix(self.buffer, MARKER), _partial_suffix(self.buffer, FENCE_CLOSE))
+                segments.append(("text", self.buffer[:len(self.buffer) - hold]))
+                self.buffer = self.buffer[len(self.buffer) - hold:]
+                break
+            end = self.buffer.find(MARKER, marker + len(MARKER))
+            if end == -1:
+                segments.append(("text", self.buffer[:marker]))
+                self.buffer = self.buffer[marker:]
+                if final or len(self.buffer) > MAX_MARKER_LENGTH:
+                    segments.append(("text", self.buffer[:len(MARKER)]))
+                    self.buffer = self.buffer[len(MARKER):]
+                    continue
+                break
+            segments.append(("text", self.buffer[:marker]))
+            body = self.buffer[marker + len(MARKER):end]
+            if body.startswith("image:"):
+                segments.append(("image", body.split("image:", 1)[1].strip()))
+            else:
+                segments.append(("text", self.buffer[marker:end + len(MARKER)]))
+            self.buffer = self.buffer[end + len(MARKER):]
+        return [(kind, value) for kind, value in segments if value]
+
+
+def _partial_suffix(text: str, token: str) -> int:
+    # Length of the longest proper prefix of ``token`` that ``text`` ends with
+    for size in range(len(token) - 1, 0, -1):
+        if text.endswith(token[:size]):
+            return size
+    return 0
+
+
+def _stream_section(query: str, topic: str, namespace: str, out: queue.Queue, stop: threading.Event) -> None:
+    try:
+        context = get_context(f"{query} {topic.replace('_', ' ')}", namespace=namespace)
+        for token in gateway.stream([HumanMessage(content=section_prompt(query, topic, context))]):
+            if stop.is_set():
+                break
+            out.put(("chunk", token))
+        out.put(("end", None))
+    except Exception as e:
+        print(f"Streamed section '{topic}' failed: {e}")
+        out.put(("error", str(e)))
+
+
+def _start_sections(query: str, namespace: str, sections: List[Tuple[str, queue.Queue]],
+                    stop: threading.Event, fanout: int = NOTE_STREAM_FANOUT) -> None:
+    # Starts the first ``fanout`` sections, then one more each time a section finishes
+    pending = iter(sections)
+    lock = threading.Lock()
+
+    def start_next(_=None):
+        if stop.is_set():
+            return
+        with lock:
+            section = next(pending, None)
+        if section is not None:
+            topic, out = section
+            _section_pool.submit(_stream_section, query, topic, namespace, out, stop).add_done_callback(start_next)
+
+    for _ in range(fanout):
+        start_next()
+
+
+def stream_notes(query: str) -> Iterator[Tuple[str, object]]:
+    """
+    Yields ``(event, data)``: ``("topics", {...})``, ``("token", markdown)``,
+    ``("image", {"id", "query"})`` when a marker is complete,
+    ``("image_resolved", {"id", "markdown"})`` when its lookup is done, and
+    finally ``("done", {"notes", "failed_topics"})`` with images substituted.
+    Closing the generator stops the remaining LLM streams.
+    """
+    fresponse, router = pick_topics(query)
+    topics, namespace = fresponse['topics'], fresponse['namespace']
+    yield "topics", {"namespace": namespace, "topics": topics, "router": router}
+
+    stop = threading.Event()
+    queues = [queue.Queue() for _ in topics]
+    _start_sections(query, namespace, list(zip(topics, queues)), stop)
+
+    parts: List[str] = []  # final markdown, images filled in at the end
+    images = []  # (id, query, future, part index)
+    pending = set()
+    failed = []
+
+    def resolved_images():
+        for image_id in sorted(pending):
+            _, image_query, future, _ = images[image_id]
+            if future.done():
+                pending.discard(image_id)
+                yield "image_resolved", {"id": image_id, "markdown": f"![{image_query}]({future.result()})"}
+
+    def emit(segments):
+        for kind, value in segments:
+            if kind == "text":
+                parts.append(value)
+                yield "token", value
+            else:
+                image_id = len(images)
+                images.append((image_id, value, submit_image_lookup(value), len(parts)))
+                parts.append("")
+                pending.add(image_id)
+                yield "image", {"id": image_id, "query": value}
+
+    try:
+        for index, (topic, out) in enumerate(zip(topics, queues)):
+            if index:
+                separator = "\n" if parts and parts[-1].endswith("\n") else "\n\n"
+                parts.append(separator)
+                yield "token", separator
+            parser = NoteStreamParser()
+            while True:
+                try:
+                    kind, value = out.get(timeout=0.2)
+                except queue.Empty:
+                    # Waiting on the model, send images that resolved meanwhile
+                    yield from resolved_images()
+                    continue
+                if kind == "chunk":
+                    yield from emit(parser.feed(value))
+                    yield from resolved_images()
+                    continue
+                if kind == "error":
+                    failed.append(topic)
+                yield from emit(parser.close())
+                break
+
+        for image_id, image_query, future, part in images:
+            parts[part] = f"![{image_query}]({future.result()})"
+            if image_id in pending:
+                pending.discard(image_id)
+                yield "image_resolved", {"id": image_id, "markdown": parts[part]}
+
+        yield "done", {"notes": "".join(parts).strip(), "failed_topics": failed}
+    finally:
+        stop.set()
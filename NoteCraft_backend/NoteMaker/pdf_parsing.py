@@ -0,0 +1,59 @@
+"""
+Single-pass PDF parsing for ingestion.
+
+``parse_pdf`` opens the file once with PyMuPDF and returns everything the
+upload and indexing paths need: the first-page thumbnail, the text of every
+page and page-aware chunks (split per page, so each chunk keeps its page
+number for citations and neighbour merging). Like vector_store.py this module
+must stay importable without Django.
+"""
+import base64
+from dataclasses import dataclass, field
+from typing import List, Union
+
+import fitz
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+@dataclass
+class PDFChunk:
+    text: str
+    page: int
+    index: int
+
+
+@dataclass
+class ParsedPDF:
+    thumbnail: str  # base64 PNG of the first page, "" for an empty document
+    pages: List[str] = field(default_factory=list)
+    chunks: List[PDFChunk] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "".join(self.pages)
+
+
+def parse_pdf(source: Union[str, bytes], chunk_size: int = CHUNK_SIZE,
+              chunk_overlap: int = CHUNK_OVERLAP) -> ParsedPDF:
+    """
+    ``source`` is a path or the raw bytes of the PDF.
+    """
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    if isinstance(source, bytes):
+        pdf = fitz.open(stream=source, filetype="pdf")
+    else:
+        pdf = fitz.open(source)
+    with pdf:
+        thumbnail = ""
+        pages, chunks = [], []
+        for number, page in enumerate(pdf):
+            if number == 0:
+                thumbnail = base64.b64encode(page.get_pixmap().tobytes("png")).decode("utf-8")  # type: ignore
+            text = page.get_text()
+            pages.append(text)
+            for piece in splitter.split_text(text):
+                chunks.append(PDFChunk(piece, number, len(chunks)))
+    return ParsedPDF(thumbnail, pages, chunks)
@@ -0,0 +1,95 @@
+"""
+Stage-level progress for long celery tasks (note generation, ingestion).
+
+Progress is kept in the shared cache under the id the client polls (the root
+task id), so subtasks of a chord can report into the same entry: the parent
+writes the stage and totals, every section writes its own key and
+``get_progress`` folds them together. TaskStatusView returns the result.
+"""
+from typing import Dict, Optional
+
+from celery import Task
+from django.core.cache import caches
+
+from .cancellation import checkpoint
+
+PROGRESS_TTL = 24 * 3600
+# Percent range covered by the section stage, the rest is topic extraction and merging
+SECTION_PERCENT = (10, 90)
+
+progress_cache = caches['shared']
+
+
+def _key(task_id: str, *parts) -> str:
+    return ":".join(["task_progress", task_id, *map(str, parts)])
+
+
+def set_progress(task_id: str, stage: str, percent: int, **partial) -> Dict:
+    info = progress_cache.get(_key(task_id)) or {}
+    info.update(partial, stage=stage, percent=percent)
+    progress_cache.set(_key(task_id), info, PROGRESS_TTL)
+    return info
+
+
+def set_section_progress(task_id: str, index: int, **section) -> None:
+    progress_cache.set(_key(task_id, "section", index), section, PROGRESS_TTL)
+
+
+def get_progress(task_id: str) -> Optional[Dict]:
+    """
+    ``{"stage", "percent", ...partial output}`` or None if the task never reported.
+    Finished sections are listed in order under ``sections`` and counted into
+    ``percent`` while the task is in its section stage.
+    """
+    info = progress_cache.get(_key(task_id))
+    if info is None:
+        return None
+    total = info.get("sections_total")
+    if total:
+        found = progress_cache.get_many([_key(task_id, "section", i) for i in range(total)])
+        sections = [found[_key(task_id, "section", i)] for i in range(total) if _key(task_id, "section", i) in found]
+        info["sections"] = sections
+        info["sections_done"] = len(sections)
+        info["images_resolved"] = sum(section.get("images", 0) for section in sections)
+        if info["stage"] == "generating_sections":
+            start, end = SECTION_PERCENT
+            info["percent"] = start + (end - start) * len(sections) // total
+    return info
+
+
+def mark_cancelled(task_id: str) -> Dict:
+    """
+    Moves the entry to the terminal "cancelled" stage, keeping the percent reached.
+    """
+    info = progress_cache.get(_key(task_id)) or {}
+    return set_progress(task_id, "cancelled", info.get("percent", 0))
+
+
+def clear_progress(task_id: str) -> None:
+    info = progress_cache.get(_key(task_id)) or {}
+    progress_cache.delete_many(
+        [_key(task_id)] + [_key(task_id, "section", i) for i in range(info.get("sections_total") or 0)]
+    )
+
+
+class ProgressTask(Task):
+    """
+    Base class for tasks that report progress. ``update_progress`` writes to the
+    entry of the root task (the id the client holds) and, when this task is that
+    root, also sets the celery state to PROGRESS with the same meta.
+    """
+
+    def progress_id(self) -> str:
+        return self.request.root_id or self.request.id
+
+    def update_progress(self, stage: str, percent: int, **partial) -> Dict:
+        info = set_progress(self.progress_id(), stage, percent, **partial)
+        if self.request.id == self.progress_id() and not self.request.is_eager:
+            self.update_state(state='PROGRESS', meta=info)
+        return info
+
+    def checkpoint(self) -> None:
+        """
+        Raises TaskCancelled if the client cancelled the root task.
+        """
+        checkpoint(self.progress_id())
@@ -0,0 +1,160 @@
+"""
+Hybrid retrieval over the knowledge base.
+
+Dense results from the vector store and BM25 results from the local lexical index
+are fused with reciprocal-rank fusion. Queries that name a TFT entity (champion,
+item, comp, augment, ...) with enough confidence take a lexical fast path and
+skip the embedding call altogether. ``fan_out_search`` queries several namespaces
+in parallel with one shared query embedding.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional
+
+from .kb_version import bump_kb_version
+from .lexical_index import get_lexical_index, reciprocal_rank_fusion
+from .vector_store import QueryMatch, get_vector_store, matches_filter
+
+# Share of the query (ignoring spaces/punctuation) that entity names must cover
+LEXICAL_EXACT_MIN_COVERAGE = float(os.getenv("LEXICAL_EXACT_MIN_COVERAGE", "0.6"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+FANOUT_MAX_WORKERS = int(os.getenv("FANOUT_MAX_WORKERS", "16"))
+# Namespaces slower than this are left out of the merged result instead of holding it up
+FANOUT_TIMEOUT = float(os.getenv("FANOUT_TIMEOUT", "5"))
+
+_fanout_pool = ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS, thread_name_prefix="fanout")
+
+
+def lexical_fast_path(query: str, namespace: str = "", top_k: int = 5) -> Optional[List[QueryMatch]]:
+    """
+    Returns the chunks of the entities named in ``query`` when the match is
+    confident enough to answer without dense retrieval, else None.
+    """
+    docs, coverage = get_lexical_index().exact_match(query, namespace)
+    if not docs or coverage < LEXICAL_EXACT_MIN_COVERAGE:
+        return None
+    return [QueryMatch(doc_id, score, metadata) for doc_id, score, metadata in docs[:top_k]]
+
+
+def hybrid_search(query: str, query_embedding: List[float], namespace: str = "",
+                  top_k: int = 5, filter: Optional[Dict] = None) -> List[QueryMatch]:
+    """
+    Dense + BM25 retrieval fused with RRF. Falls back to dense only results
+    when the lexical index has nothing for this namespace.
+    """
+    dense = get_vector_store().query(
+        vector=query_embedding,
+        top_k=top_k * 2,
+        namespace=namespace,
+        filter=filter,
+        include_metadata=True
+    ).matches
+    lexical = [
+        (doc_id, metadata)
+        for doc_id, _, metadata in get_lexical_index().search(query, namespace, top_k * 2)
+        if matches_filter(metadata, filter)
+    ]
+    if not lexical:
+        return dense[:top_k]
+
+    metadata_of = {doc_id: metadata for doc_id, metadata in lexical}
+    metadata_of.update({m.id: m.metadata for m in dense})
+    fused = reciprocal_rank_fusion([[m.id for m in dense], [doc_id for doc_id, _ in lexical]], k=RRF_K)
+    return [QueryMatch(doc_id, score, metadata_of[doc_id]) for doc_id, score in fused[:top_k]]
+
+
+def _dense_search(query_embedding: List[float], namespace: str, top_k: int,
+                  filter: Optional[Dict]) -> List[QueryMatch]:
+    return get_vector_store().query(
+        vector=query_embedding,
+        top_k=top_k,
+        namespace=namespace,
+        filter=filter,
+        include_metadata=True
+    ).matches
+
+
+def fan_out_search(query_embedding: List[float], namespaces: Iterable[str], top_k: int = 5,
+                   per_namespace_quota: Optional[int] = None, filter: Optional[Dict] = None,
+                   query: Optional[str] = None) -> List[QueryMatch]:
+    """
+    Queries every namespace concurrently with the same embedding and merges the
+    matches, taking at most ``per_namespace_quota`` from any namespace.
+    Wall-clock time is that of the slowest namespace (capped by FANOUT_TIMEOUT).
+    Without ``query`` each namespace gets a dense query and the matches are
+    merged by cosine similarity, which is comparable across namespaces. With it
+    each namespace runs hybrid_search; RRF scores of different namespaces are
+    not comparable, so those lists are merged by rank instead.
+    """
+    namespaces = list(dict.fromkeys(namespaces))
+    quota = per_namespace_quota or top_k
+    per_namespace = min(top_k, quota)
+    futures = {
+        (_fanout_pool.submit(hybrid_search, query, query_embedding, namespace, per_namespace, filter)
+         if query is not None else
+         _fanout_pool.submit(_dense_search, query_embedding, namespace, per_namespace, filter)): namespace
+        for namespace in namespaces
+    }
+    done, not_done = wait(futures, timeout=FANOUT_TIMEOUT)
+    for future in not_done:
+        future.cancel()
+        print(f"Fan-out: namespace '{futures[future]}' timed out, skipped")
+
+    matches: List[QueryMatch] = []
+    order = {namespace: position for position, namespace in enumerate(namespaces)}
+    for future in done:
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Fan-out: namespace '{futures[future]}' failed: {e}")
+            continue
+        for rank, match in enumerate(result, start=1):
+            match.namespace = futures[future]
+            if query is not None:
+                match.score = 1.0 / (RRF_K + rank)
+            matches.append(match)
+
+    # Equal rank scores keep the configured namespace order
+    matches.sort(key=lambda m: (-m.score, order[m.namespace]))
+    merged: List[QueryMatch] = []
+    taken: Dict[str, int] = {}
+    for match in matches:
+        if taken.get(match.namespace, 0) >= quota:
+            continue
+        taken[match.namespace] = taken.get(match.namespace, 0) + 1
+        merged.append(match)
+        if len(merged) == top_k:
+            break
+    return merged
+
+
+def upsert_chunks(vectors: List[Dict], namespace: str = "") -> int:
+    """
+    Writes chunks to the vector store and the lexical index together and bumps
+    the knowledge-base version so dependent caches (answers, notes) go stale.
+    """
+    count = get_vector_store().upsert(vectors=vectors, namespace=namespace)
+    get_lexical_index().add_documents(vectors, namespace)
+    bump_kb_version()
+    return count
+
+
+def delete_chunks(ids: Optional[List[str]] = None, namespace: str = "", filter: Optional[Dict] = None) -> None:
+    """
+    Deletes chunks by id or metadata filter from both indexes and bumps the
+    knowledge-base version.
+    """
+    get_vector_store().delete(ids=ids, filter=filter, namespace=namespace)
+    get_lexical_index().delete(ids or (), namespace, filter=filter)
+    bump_kb_version()
+
+
+def delete_chunks_by_prefix(prefix: str, namespace: str = "") -> int:
+    """
+    Deletes every chunk whose id starts with ``prefix``, by id: serverless
+    Pinecone indexes reject delete-by-filter. Returns the number deleted.
+    """
+    ids = get_vector_store().list_ids(prefix, namespace=namespace)
+    if ids:
+        delete_chunks(ids=ids, namespace=namespace)
+    return len(ids)
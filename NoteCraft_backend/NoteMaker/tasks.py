@@ -1,43 +1,150 @@
 # tasks.py
 import json
-from .myutils import get_context, google_search_image, request_OpenRouter
-from celery import shared_task
+from .myutils import get_context, request_OpenRouter, resolve_images, route_query, topics_query
+from celery import chord, group, shared_task
+from celery.result import allow_join_result
+from .memory import update_summary
+from . import note_cache
+from .progress import ProgressTask, SECTION_PERCENT, mark_cancelled, set_section_progress
+from .cancellation import TaskCancelled, checkpoint, is_cancelled
+
+CANCELLED_RESULT = {"success": False, "cancelled": True, "error": "Task cancelled"}
+
+def _extract_block(text: str, fence: str) -> str:
+    start = text.find(fence) + len(fence)
+    end = text.find("```", start)
+    return text[start:end].strip()
+
+def _resolve_image_placeholders(notes: str, cancel_id: str = None) -> tuple:
+    arr = notes.split("&&&")
+    # Resolve all image placeholders concurrently, duplicates only once
+    image_urls = resolve_images(
+        (line.split("image:", 1)[1].strip() for line in arr if line.startswith("image:")), cancel_id
+    )
+    processed_notes = []
+    for line in arr:
+        if line.startswith("image:"):
+            image_query = line.split("image:", 1)[1].strip()
+            processed_notes.append(f"![{image_query}]({image_urls[image_query]})")
+        else:
+            processed_notes.append(line)
+    return "".join(processed_notes), len(image_urls)
+
+def pick_topics(query: str, cancel_id: str = None) -> tuple:
+    """
+    ``({"namespace", "topics"}, router method)``: the local centroid/keyword router
+    first, the topics_query LLM call only when it isn't confident.
+    """
+    decision = route_query(query)
+    if decision.confident:
+        return {"namespace": decision.namespace, "topics": decision.topics}, decision.method
+    response_1 = request_OpenRouter(query + topics_query, cancel_id)
+    # Extract JSON
+    return json.loads(_extract_block(response_1, "```json")), "llm"
+
+def section_prompt(query: str, topic: str, context) -> str:
+    prompt_2:str= "Objective: Act as an expert Challenger-rank Teamfight Tactics (Golden Spatula) coach. " \
+    f"Write one section of a strategic guide about {query}. This section covers only: {topic.replace('_', ' ')}. " \
+    "Base it on the provided context. If context is irrelevant, ignore it.\
+    InstructionsStructure: Start with a ## heading for the section, use ### subheadings below it. Keep the content detailed and actionable.\
+    Focus on winning conditions, counters, and specific details. Do not add double new line or meta text ever.\
+    to include images write &&&image:(description of image)&&& at the place where you want to add the image this should be done in between the text\
+    example- &&&image:(TFT Kai'Sa positioning)&&& use 2-3 images in this section at max\
+    output should be in ```markdown box keep the markup syntax the section should have plenty text \
+    examples where applicable." f"Context: {context}"
+    return prompt_2
+
+@shared_task(bind=True, base=ProgressTask)
+def generate_notes_task(self, query:str) -> dict:
+    """
+    Fan-out/fan-in note generation: extracts the topics here, then replaces itself
+    with a chord of one generate_section_task per topic and merge_notes_task as
+    the body. The merge inherits this task's id, so polling it still works.
+    """
+    try:
+        self.update_progress("extracting_topics", 0)
+        self.checkpoint()
+        fresponse, router = pick_topics(query, self.progress_id())
+        topics = fresponse['topics']
+        if not topics:
+            note_cache.mark_done(query, self.request.id, success=False)
+            return {"success": False, "error": "No topics found"}
+        self.checkpoint()
+    except TaskCancelled:
+        note_cache.mark_done(query, self.request.id, success=False)
+        mark_cancelled(self.progress_id())
+        return CANCELLED_RESULT
+    except Exception as e:
+        note_cache.mark_done(query, self.request.id, success=False)
+        return {"success": False, "error": str(e)}
+
+    self.update_progress("generating_sections", SECTION_PERCENT[0], topics=topics, sections_total=len(topics),
+                         namespace=fresponse['namespace'], router=router)
+    canvas = chord(
+        group(generate_section_task.s(query, topic, fresponse['namespace'], self.progress_id(), index)
+              for index, topic in enumerate(topics)),
+        merge_notes_task.s(query)
+    )
+    if self.request.is_eager:
+        # Eager mode applies the chord inline and joins it, which celery forbids inside a task by default
+        with allow_join_result():
+            return self.replace(canvas)
+    return self.replace(canvas)
+
+@shared_task
+def generate_section_task(query:str, topic:str, namespace:str, progress_id:str=None, index:int=0) -> dict:
+    """
+    Retrieval + generation + image lookup for one topic of the note. The finished
+    section is published as partial output of the note task ``progress_id``.
+    Stops at the next stage boundary (or mid-answer) once that task is cancelled.
+    """
+    try:
+        checkpoint(progress_id)
+        context = get_context(f"{query} {topic.replace('_', ' ')}", namespace=namespace)
+
+        checkpoint(progress_id)
+        notes = _extract_block(request_OpenRouter(section_prompt(query, topic, context), progress_id), "```markdown")
+        checkpoint(progress_id)
+        notes, images = _resolve_image_placeholders(notes, progress_id)
+        if progress_id:
+            set_section_progress(progress_id, index, topic=topic, notes=notes, images=images)
+        return {"topic": topic, "notes": notes}
+    except TaskCancelled:
+        return {"topic": topic, "error": "Task cancelled", "cancelled": True}
+    except Exception as e:
+        print(f"Section '{topic}' failed: {e}")
+        if progress_id:
+            set_section_progress(progress_id, index, topic=topic, error=str(e))
+        return {"topic": topic, "error": str(e)}
+
+@shared_task(bind=True, base=ProgressTask)
+def merge_notes_task(self, sections:list, query:str="") -> dict:
+    """
+    Chord body: joins the sections in topic order (the order of the header group).
+    Runs under the id of the original note task, so it also settles its note cache entry.
+    """
+    if is_cancelled(self.progress_id()) or any(section.get("cancelled") for section in sections):
+        note_cache.mark_done(query, self.request.id, success=False)
+        mark_cancelled(self.progress_id())
+        return CANCELLED_RESULT
+    self.update_progress("merging", SECTION_PERCENT[1])
+    done = [section for section in sections if "notes" in section]
+    if not done:
+        note_cache.mark_done(query, self.request.id, success=False)
+        return {"success": False, "error": sections[0]["error"] if sections else "No sections generated"}
+    result = {"success": True, "notes": "\n\n".join(section["notes"] for section in done)}
+    failed = [section["topic"] for section in sections if "error" in section]
+    if failed:
+        result["failed_topics"] = failed
+    note_cache.mark_done(query, self.request.id, success=True)
+    self.update_progress("done", 100)
+    return result
+
 
 @shared_task
-def generate_notes_task(prompt_1:str) -> dict:
+def summarize_conversation_task(conversation_id: int) -> dict:
     try:
-        response_1 = request_OpenRouter(prompt_1)
-        # Extract JSON
-        start = response_1.find("```json") + len("```json")
-        end = response_1.find("```", start)
-        json_str = response_1[start:end].strip()
-        fresponse = json.loads(json_str)
-        
-        context = get_context(prompt_1, namespace=fresponse['namespace'])
-
-        prompt_2:str= "Objective: Act as an expert Challenger-rank Teamfight Tactics (Golden Spatula) coach. " \
-        f"Generate comprehensive, strategic guides on {fresponse['topics']} based on the provided context. If context is irrelevant, ignore it.\
-        InstructionsStructure: Organize notes hierarchically with headings (e.g., Early Game, Mid Game, Itemization, Positioning). Keep the content detailed and actionable.\
-        Focus on winning conditions, counters, and specific details. Do not add double new line or meta text ever.\
-        to include images write &&&image:(description of image)&&& at the place where you want to add the image this should be done in between the text\
-        example- &&&image:(TFT Kai'Sa positioning)&&& use 2-3 images per heading at max\
-        output should be in ```markdown box keep the markup syntax the notes should have plenty text \
-        examples where applicable.Context: {context}"
-        notes = request_OpenRouter(prompt_2)
-        start = notes.find("```markdown") + len("```markdown")
-        end = notes.find("```", start)
-        notes = notes[start:end].strip()
-
-        arr = notes.split("&&&")
-        processed_notes = []
-        for line in arr:
-            if line.startswith("image:"):
-                image_query = line.split("image:", 1)[1].strip()
-                image_url = google_search_image(image_query)
-                processed_notes.append(f"![{image_query}]({image_url})")
-            else:
-                processed_notes.append(line)
-
-        return {"success": True, "notes": "".join(processed_notes)}
+        return {"success": True, "updated": update_summary(conversation_id)}
     except Exception as e:
+        print(f"Conversation summary error: {e}")
         return {"success": False, "error": str(e)}
@@ -1,3 +1,759 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import itertools
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from django.urls import reverse
+
+from . import ai_module, cancellation, image_cache, incremental_index, myutils, note_cache, note_stream, tasks, views
+from .answer_cache import SemanticAnswerCache
+from .cancellation import TaskCancelled, checkpoint, consume_stream, is_cancelled, request_cancel
+from .chunk_ids import chunk_id, doc_prefix, file_sha256, text_hash
+from .context_packing import estimate_tokens, pack_context
+from .embedding_executor import EmbeddingExecutor, TokenBucket, pack_batches
+from .embedding_store import EmbeddingStore
+from .incremental_index import IndexManifest, reindex
+from .lexical_index import LexicalIndex
+from .models import ImageSearchCache
+from .note_stream import NOTE_STREAM_FANOUT, NoteStreamParser, stream_notes
+from .pdf_parsing import ParsedPDF, PDFChunk
+from .progress import get_progress, set_progress
+from .vector_store import HybridVectorStore, LocalVectorStore, QueryMatch, matches_filter
+
+
+def parse(*chunks):
+    parser = NoteStreamParser()
+    segments = []
+    for chunk in chunks:
+        segments += parser.feed(chunk)
+    segments += parser.close()
+    # Adjacent text segments are one piece of markdown for the client
+    merged = []
+    for kind, value in segments:
+        if kind == "text" and merged and merged[-1][0] == "text":
+            merged[-1] = ("text", merged[-1][1] + value)
+        else:
+            merged.append((kind, value))
+    return merged
+
+
+class NoteStreamParserTests(SimpleTestCase):
+    def test_fenced_section(self):
+        self.assertEqual(parse("```markdown\n## Items\nBuild Rageblade.\n```"),
+                         [("text", "## Items\nBuild Rageblade.\n")])
+
+    def test_split_fences(self):
+        self.assertEqual(parse("``", "`mark", "down", "\n", "## Items\nBuild", " Rageblade.\n`", "``", " trailing"),
+                         [("text", "## Items\nBuild Rageblade.\n")])
+
+    def test_split_markers(self):
+        self.assertEqual(
+            parse("```markdown\n## Positioning\nCorner &", "&&ima", "ge:(Kai'Sa corner)&", "&", "& then hold.\n```"),
+            [("text", "## Positioning\nCorner "), ("image", "(Kai'Sa corner)"), ("text", " then hold.\n")]
+        )
+
+    def test_other_markers_stay_text(self):
+        self.assertEqual(parse("```markdown\n## A\nx &&&bold&&& y\n```"), [("text", "## A\nx &&&bold&&& y\n")])
+
+    def test_preamble_before_fence(self):
+        self.assertEqual(
+            parse("Sure, here is the section on positioning for you to read:\n", "```markdown\n## Positioning\nFront line",
+                  " first.\n```"),
+            [("text", "## Positioning\nFront line first.\n")]
+        )
+
+    def test_long_preamble_keeps_section(self):
+        segments = parse("Sure. " * 80 + "\n", "```markdown\n## Positioning\nFront line first.\n```")
+        self.assertTrue(segments[-1][1].endswith("## Positioning\nFront line first.\n"))
+        self.assertNotIn("```", "".join(value for _, value in segments))
+
+    def test_no_fence(self):
+        self.assertEqual(parse("## Positioning\nStand in the corner ", "&&&image:(corner)&&& now."),
+                         [("text", "## Positioning\nStand in the corner "), ("image", "(corner)"), ("text", " now.")])
+
+    def test_short_output_without_fence(self):
+        self.assertEqual(parse("Nothing to add."), [("text", "Nothing to add.")])
+
+
+class StreamNotesTests(SimpleTestCase):
+    TOPICS = {"namespace": "items", "topics": [f"topic_{i}" for i in range(6)]}
+
+    def test_sections_fan_out_below_gateway_limit(self):
+        lock = threading.Lock()
+        running, peak = [0], [0]
+
+        def stream(messages):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            topic = messages[0].content.split("This section covers only: ")[1].split(".")[0]
+            yield f"```markdown\n## {topic}\n```"
+            with lock:
+                running[0] -= 1
+
+        with mock.patch.object(note_stream, "pick_topics", return_value=(self.TOPICS, "keyword")), \
+                mock.patch.object(note_stream, "get_context", return_value=""), \
+                mock.patch.object(note_stream.gateway, "stream", side_effect=stream):
+            events = list(stream_notes("reroll comps"))
+        self.assertEqual(peak[0], NOTE_STREAM_FANOUT)
+        done = events[-1][1]
+        self.assertEqual(done["failed_topics"], [])
+        self.assertEqual(done["notes"], "\n\n".join(f"## topic {i}" for i in range(6)))
+
+
+def _write_chunks(root, tag, count):
+    index = LexicalIndex(root=root)
+    for i in range(count):
+        index.add_documents([{"id": f"{tag}{i}", "metadata": {"text": f"rageblade {i}"}}], "patch_notes")
+
+
+class LexicalIndexWriteTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.root = Path(root)
+
+    def search_ids(self):
+        return {doc_id for doc_id, _, _ in LexicalIndex(root=self.root).search("rageblade", "patch_notes", 200)}
+
+    def test_writers_keep_each_others_chunks(self):
+        # Two instances stand in for two processes sharing the index files
+        first, second = LexicalIndex(root=self.root), LexicalIndex(root=self.root)
+        for i in range(5):
+            first.add_documents([{"id": f"a{i}", "metadata": {"text": f"rageblade {i}"}}], "patch_notes")
+            second.add_documents([{"id": f"b{i}", "metadata": {"text": f"rageblade {i}"}}], "patch_notes")
+        with second.deferred_save():
+            second.add_documents([{"id": "c0", "metadata": {"text": "rageblade"}}], "patch_notes")
+        first.delete(["a0"], "patch_notes")
+        self.assertEqual(self.search_ids(), {"a1", "a2", "a3", "a4", "b0", "b1", "b2", "b3", "b4", "c0"})
+
+    @skipUnless(hasattr(os, "fork"), "needs fork")
+    def test_concurrent_processes(self):
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=_write_chunks, args=(self.root, tag, 40)) for tag in "ab"]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(len(self.search_ids()), 80)
+
+
+def _upsert_vectors(root, tag, count):
+    store = LocalVectorStore(root=root)
+    for i in range(count):
+        store.upsert([{"id": f"{tag}{i}", "values": [1.0, float(i)], "metadata": {}}], "items")
+
+
+class LocalVectorStoreWriteTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.root = Path(root)
+
+    def test_deferred_save_writes_once(self):
+        store = LocalVectorStore(root=self.root)
+        with store.deferred_save():
+            store.upsert([{"id": "a", "values": [1.0, 0.0]}, {"id": "b", "values": [0.0, 1.0]}], "items")
+            store.delete(ids=["a"], namespace="items")
+            self.assertFalse((self.root / "items" / "meta.json").exists())
+        self.assertEqual(LocalVectorStore(root=self.root).list_ids("", "items"), ["b"])
+
+    @skipUnless(hasattr(os, "fork"), "needs fork")
+    def test_concurrent_processes(self):
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=_upsert_vectors, args=(self.root, tag, 30)) for tag in "ab"]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(LocalVectorStore(root=self.root).count("items"), 60)
+
+
+class MatchesFilterTests(SimpleTestCase):
+    METADATA = {"namespace": "items", "cost": 3, "tags": ["ad", "tank"], "page": 0}
+
+    def test_operators(self):
+        for filter, expected in [
+            ({"namespace": "items"}, True),
+            ({"namespace": {"$ne": "items"}}, False),
+            ({"cost": {"$gte": 3, "$lt": 4}}, True),
+            ({"cost": {"$gt": 3}}, False),
+            ({"tags": "tank"}, True),
+            ({"tags": {"$in": ["ap", "ad"]}}, True),
+            ({"tags": {"$nin": ["ad"]}}, False),
+            ({"missing": {"$exists": False}}, True),
+            ({"missing": {"$gt": 1}}, False),
+            ({"page": {"$exists": True}}, True),
+            ({"cost": {"$gt": "3"}}, False),
+            ({"$or": [{"cost": 1}, {"tags": "ad"}]}, True),
+            ({"$and": [{"cost": 3}, {"namespace": "champions"}]}, False),
+        ]:
+            with self.subTest(filter=filter):
+                self.assertEqual(matches_filter(self.METADATA, filter), expected)
+
+    def test_unknown_operator(self):
+        with self.assertRaises(ValueError):
+            matches_filter(self.METADATA, {"cost": {"$regex": "3"}})
+
+
+class LocalVectorStoreTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.root = Path(root)
+        self.store = LocalVectorStore(root=self.root)
+        self.store.upsert([
+            {"id": "doc-1", "values": [1.0, 0.0], "metadata": {"cost": 1}},
+            {"id": "doc-2", "values": [0.8, 0.6], "metadata": {"cost": 2}},
+            {"id": "other", "values": [0.0, 1.0], "metadata": {"cost": 3}},
+        ], "items")
+
+    def query_ids(self, store=None, **kwargs):
+        return [match.id for match in (store or self.store).query([1.0, 0.0], namespace="items", **kwargs).matches]
+
+    def test_query_ranks_by_cosine(self):
+        self.assertEqual(self.query_ids(top_k=2), ["doc-1", "doc-2"])
+        self.assertEqual(self.query_ids(filter={"cost": {"$gte": 2}}), ["doc-2", "other"])
+        self.assertEqual(self.query_ids(store=LocalVectorStore(root=self.root)), ["doc-1", "doc-2", "other"])
+
+    def test_upsert_replaces_and_delete(self):
+        self.store.upsert([{"id": "other", "values": [1.0, 0.1], "metadata": {"cost": 5}}], "items")
+        self.assertEqual(self.query_ids(top_k=1), ["doc-1"])
+        self.store.delete(ids=["doc-1"], namespace="items")
+        self.store.delete(filter={"cost": 2}, namespace="items")
+        self.assertEqual(self.query_ids(), ["other"])
+        self.assertEqual(self.store.existing_ids(["doc-1", "other"], "items"), {"other"})
+
+    def test_list_ids_by_prefix(self):
+        self.assertEqual(sorted(self.store.list_ids("doc-", "items")), ["doc-1", "doc-2"])
+        self.assertEqual(self.store.list_ids("doc-", "champions"), [])
+        self.assertEqual(self.store.describe_index_stats()["total_vector_count"], 3)
+
+
+class HybridVectorStoreTests(SimpleTestCase):
+    def setUp(self):
+        roots = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+        for root in roots:
+            self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        # A local store stands in for Pinecone
+        self.remote = LocalVectorStore(root=Path(roots[0]))
+        self.remote.upsert([{"id": "old", "values": [1.0, 0.0]}], "items")
+        self.store = HybridVectorStore(self.remote, LocalVectorStore(root=Path(roots[1])), ["items"])
+
+    def query_ids(self):
+        return {match.id for match in self.store.query([1.0, 0.0], top_k=10, namespace="items").matches}
+
+    def test_partial_mirror_reads_remote(self):
+        self.store.upsert([{"id": "new", "values": [1.0, 0.1]}], "items")
+        self.assertEqual(self.store.local.count("items"), 1)
+        self.assertEqual(self.query_ids(), {"old", "new"})
+
+    def test_writes_are_mirrored_for_hot_namespaces(self):
+        self.store.backfill("items")
+        self.store.upsert([{"id": "new", "values": [1.0, 0.1]}], "items")
+        self.store.delete(ids=["old"], namespace="items")
+        self.store.upsert([{"id": "cold", "values": [1.0, 0.0]}], "traits")
+        self.assertEqual(self.store.local.list_ids("", "items"), ["new"])
+        self.assertEqual(self.remote.list_ids("", "items"), ["new"])
+        self.assertEqual(self.store.local.list_ids("", "traits"), [])
+
+    def test_backfill_switches_to_mirror(self):
+        self.assertEqual(self.store.backfill("items"), 1)
+        self.remote.delete(ids=["old"], namespace="items")
+        self.assertEqual(self.query_ids(), {"old"})
+
+
+class EntityMatchTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.index = LexicalIndex(root=Path(root), autosave=False)
+        self.index.add_documents([
+            {"id": "kaisa", "metadata": {"champion_name": "Kai'Sa", "text": "Kai'Sa carries with Guinsoo's Rageblade."}},
+            {"id": "kaisa-trait", "metadata": {"champion_name": "Kai'Sa", "text": "Kai'Sa trait bonus."}},
+            {"id": "class", "metadata": {"item_name": "Class", "text": "Class emblem."}},
+            {"id": "jinx", "metadata": {"champion_name": "金克丝", "text": "金克丝 后排输出"}},
+        ])
+
+    def test_word_boundaries(self):
+        docs, coverage = self.index.exact_match("kai sa")
+        self.assertEqual({doc_id for doc_id, _, _ in docs}, {"kaisa", "kaisa-trait"})
+        self.assertEqual(coverage, 1.0)
+        self.assertEqual(self.index.exact_match("classic comps"), ([], 0.0))
+
+    def test_ranked_by_bm25(self):
+        docs, _ = self.index.exact_match("Kai'Sa Rageblade")
+        self.assertEqual(docs[0][0], "kaisa")
+        self.assertGreater(docs[0][1], docs[1][1])
+
+    def test_cjk_substring(self):
+        docs, coverage = self.index.exact_match("金克丝出装")
+        self.assertEqual([doc_id for doc_id, _, _ in docs], ["jinx"])
+        self.assertAlmostEqual(coverage, 0.6)
+
+
+class ContextPackingTests(SimpleTestCase):
+    # Three 300-character chunks of one parent, each overlapping the next by 50
+    TEXT = "".join(f"w{i:03d} " for i in range(160))
+    CHUNKS = [TEXT[0:300].strip(), TEXT[250:550].strip(), TEXT[500:800].strip()]
+
+    def match(self, index, parent="doc"):
+        metadata = {"text": self.CHUNKS[index], "parent_id": parent, "chunk_index": index, "source": "guide.pdf"}
+        return QueryMatch(f"{parent}-{index}", 1.0, metadata)
+
+    def test_neighbours_merge_without_repeating_the_overlap(self):
+        packed = pack_context([self.match(0), self.match(1), self.match(2)])
+        self.assertEqual(packed["blocks"], [self.TEXT.strip()])
+        self.assertEqual(packed["chunk_ids"], ["doc-0", "doc-1", "doc-2"])
+
+    def test_bridging_chunk_joins_two_blocks(self):
+        packed = pack_context([self.match(2), self.match(0), self.match(1)])
+        self.assertEqual(packed["blocks"], [self.TEXT.strip()])
+        self.assertEqual(sorted(packed["chunk_ids"]), ["doc-0", "doc-1", "doc-2"])
+        self.assertEqual(packed["tokens"], estimate_tokens(self.TEXT.strip()))
+
+    def test_other_parents_stay_apart(self):
+        packed = pack_context([self.match(0), self.match(1, parent="other")])
+        self.assertEqual(packed["blocks"], [self.CHUNKS[0], self.CHUNKS[1]])
+
+
+class GenerateNoteStreamViewTests(SimpleTestCase):
+    def events(self, cached_result=None, stream=None):
+        cached = None
+        if cached_result is not None:
+            cached = mock.Mock(result=cached_result)
+            cached.successful.return_value = not isinstance(cached_result, Exception)
+        stream = stream or (lambda query: iter([("token", "fresh"), ("done", {"notes": "fresh"})]))
+        with mock.patch.object(views.note_cache, "lookup", return_value="task" if cached else None), \
+                mock.patch.object(views, "AsyncResult", return_value=cached), \
+                mock.patch.object(views, "stream_notes", side_effect=stream):
+            response = self.client.post(reverse("generate_note_stream"), {"params": {"query": "reroll comps"}},
+                                        content_type="application/json")
+            body = b"".join(response.streaming_content).decode()
+        return [block.split("\n")[0][len("event: "):] for block in body.split("\n\n") if block]
+
+    def test_successful_cached_notes(self):
+        self.assertEqual(self.events({"success": True, "notes": "cached"}), ["token", "done"])
+
+    def test_failed_or_cancelled_cache_streams_afresh(self):
+        for result in ({"success": False, "error": "No topics found"}, {"success": False, "cancelled": True},
+                       RuntimeError("worker lost")):
+            with self.subTest(result=result):
+                self.assertEqual(self.events(result), ["token", "done"])
+
+    def test_stream_error_event(self):
+        def failing(query):
+            raise RuntimeError("LLM down")
+            yield
+        self.assertEqual(self.events(stream=failing), ["error"])
+
+
+def _fake_section_llm(prompt, cancel_id=None):
+    topic = prompt.split("This section covers only: ")[1].split(".")[0]
+    return f"```markdown\n## {topic}\n```"
+
+
+class NoteTaskTests(SimpleTestCase):
+    TOPICS = {"namespace": "items", "topics": ["opening", "mid_game", "late_game"]}
+
+    def setUp(self):
+        caches["shared"].clear()
+
+    def generate(self, task_id, llm=_fake_section_llm):
+        note_cache.reserve("rageblade", task_id)
+        with mock.patch.object(tasks, "pick_topics", return_value=(self.TOPICS, "keyword")), \
+                mock.patch.object(tasks, "get_context", return_value=""), \
+                mock.patch.object(tasks, "request_OpenRouter", side_effect=llm):
+            return tasks.generate_notes_task.apply(args=["rageblade"], task_id=task_id).result
+
+    def test_sections_merged_in_topic_order(self):
+        result = self.generate("notes-ok")
+        self.assertEqual(result, {"success": True, "notes": "## opening\n\n## mid game\n\n## late game"})
+        self.assertEqual(get_progress("notes-ok")["stage"], "done")
+
+    def test_failed_topics(self):
+        def llm(prompt, cancel_id=None):
+            if "mid game" in prompt:
+                raise RuntimeError("timeout")
+            return _fake_section_llm(prompt)
+        result = self.generate("notes-partial", llm)
+        self.assertEqual(result["notes"], "## opening\n\n## late game")
+        self.assertEqual(result["failed_topics"], ["mid_game"])
+
+    def test_cancelled_mid_generation(self):
+        def llm(prompt, cancel_id=None):
+            if "mid game" in prompt:
+                request_cancel(cancel_id)
+            return _fake_section_llm(prompt)
+        self.assertEqual(self.generate("notes-cancelled", llm), tasks.CANCELLED_RESULT)
+        self.assertEqual(get_progress("notes-cancelled")["stage"], "cancelled")
+        self.assertIsNone(note_cache.lookup("rageblade"))
+
+    def test_merge_uses_header_order(self):
+        sections = [{"topic": "late_game", "notes": "late"}, {"topic": "opening", "error": "x"},
+                    {"topic": "opening", "notes": "early"}]
+        result = tasks.merge_notes_task.apply(args=[sections], kwargs={"query": "q"}, task_id="merge").result
+        self.assertEqual(result["notes"], "late\n\nearly")
+
+    def test_all_sections_failed(self):
+        result = tasks.merge_notes_task.apply(args=[[{"topic": "opening", "error": "timeout"}]], task_id="merge-failed").result
+        self.assertEqual(result, {"success": False, "error": "timeout"})
+
+
+class SemanticAnswerCacheTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("NoteMaker.answer_cache.get_kb_version", return_value=1)
+        self.kb_version = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = SemanticAnswerCache(threshold=0.95, max_entries=2, ttl=60)
+
+    def test_similar_query_hits(self):
+        self.cache.store([1.0, 0.0], "Build Rageblade", ["items.json"], ["c1"])
+        entry = self.cache.lookup([0.99, 0.05])
+        self.assertEqual(entry["answer"], "Build Rageblade")
+        self.assertEqual(entry["chunk_ids"], ["c1"])
+        self.assertIsNone(self.cache.lookup([0.0, 1.0]))
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 1, "entries": 1})
+
+    def test_kb_version_bump_clears(self):
+        self.cache.store([1.0, 0.0], "old", [], [])
+        self.kb_version.return_value = 2
+        self.assertIsNone(self.cache.lookup([1.0, 0.0]))
+
+    def test_expired_and_evicted_entries_miss(self):
+        self.cache.store([1.0, 0.0], "first", [], [])
+        self.cache.store([0.0, 1.0], "second", [], [])
+        self.cache.store([0.7, 0.7], "third", [], [])
+        # The ring buffer holds two entries, so the oldest one is gone
+        self.assertIsNone(self.cache.lookup([1.0, 0.0]))
+        with mock.patch("NoteMaker.answer_cache.time.time", return_value=time.time() + 120):
+            self.assertIsNone(self.cache.lookup([0.0, 1.0]))
+
+
+class NoteCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches["shared"].clear()
+        patcher = mock.patch.object(note_cache, "get_kb_version", return_value=1)
+        self.kb_version = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def finish(self, task_id, result):
+        note_cache.mark_done("Best reroll comps?", task_id, success=bool(result.get("success")))
+        return mock.patch.object(note_cache, "AsyncResult", return_value=mock.Mock(state="SUCCESS", result=result))
+
+    def test_running_generation_is_shared(self):
+        note_cache.reserve("Best reroll comps?", "notes-1")
+        self.assertEqual(note_cache.lookup("best  reroll comps"), "notes-1")
+        with mock.patch.object(note_cache.time, "time", return_value=time.time() + note_cache.NOTE_INFLIGHT_TIMEOUT + 1):
+            self.assertIsNone(note_cache.lookup("best reroll comps"))
+
+    def test_finished_generation_is_reused(self):
+        note_cache.reserve("Best reroll comps?", "notes-1")
+        with self.finish("notes-1", {"success": True, "notes": "..."}):
+            self.assertEqual(note_cache.lookup("Best reroll comps"), "notes-1")
+
+    def test_kb_version_bump_invalidates(self):
+        note_cache.reserve("Best reroll comps?", "notes-1")
+        with self.finish("notes-1", {"success": True, "notes": "..."}):
+            self.kb_version.return_value = 2
+            self.assertIsNone(note_cache.lookup("Best reroll comps"))
+
+    def test_failed_or_cancelled_generation_is_dropped(self):
+        note_cache.reserve("Best reroll comps?", "notes-1")
+        with self.finish("notes-1", {"success": False, "error": "No topics found"}):
+            self.assertIsNone(note_cache.lookup("Best reroll comps"))
+        note_cache.reserve("Best reroll comps?", "notes-2")
+        request_cancel("notes-2")
+        self.assertIsNone(note_cache.lookup("Best reroll comps"))
+
+    def test_stale_task_cannot_settle_a_newer_entry(self):
+        note_cache.reserve("Best reroll comps?", "notes-1")
+        note_cache.reserve("Best reroll comps?", "notes-2")
+        note_cache.mark_done("Best reroll comps?", "notes-1", success=False)
+        self.assertEqual(note_cache.lookup("Best reroll comps"), "notes-2")
+
+
+class CancellationTests(SimpleTestCase):
+    def setUp(self):
+        caches["shared"].clear()
+
+    def test_checkpoint(self):
+        checkpoint(None)
+        checkpoint("notes-1")
+        request_cancel("notes-1")
+        with self.assertRaises(TaskCancelled):
+            checkpoint("notes-1")
+
+    def test_consume_stream_closes_on_cancel(self):
+        closed = []
+
+        def tokens():
+            try:
+                yield "Hello"
+                request_cancel("notes-1")
+                yield " world"
+                yield " again"
+            finally:
+                closed.append(True)
+
+        with mock.patch.object(cancellation, "CANCEL_POLL_INTERVAL", 0):
+            with self.assertRaises(TaskCancelled):
+                consume_stream(tokens(), "notes-1")
+            self.assertEqual(consume_stream((token for token in "ab"), "notes-2"), "ab")
+        self.assertEqual(closed, [True])
+
+
+class CancelTaskViewTests(SimpleTestCase):
+    def setUp(self):
+        caches["shared"].clear()
+        patcher = mock.patch.object(views.app.control, "revoke")
+        self.revoke = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cancel(self, task_id, state="PENDING"):
+        result = mock.Mock(state=state)
+        result.ready.return_value = state in ("SUCCESS", "FAILURE")
+        with mock.patch.object(views, "AsyncResult", return_value=result):
+            return self.client.post(reverse("cancel_task"), {"task_id": task_id}, content_type="application/json")
+
+    def test_unknown_task(self):
+        response = self.cancel("nope")
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(is_cancelled("nope"))
+
+    def test_finished_task(self):
+        set_progress("notes-1", "done", 100)
+        self.assertEqual(self.cancel("notes-1", "SUCCESS").status_code, 409)
+        self.assertFalse(is_cancelled("notes-1"))
+
+    def test_queued_task_is_cancelled_at_once(self):
+        set_progress("notes-1", "queued", 0)
+        response = self.cancel("notes-1")
+        self.assertEqual((response.status_code, response.json()["state"]), (200, "CANCELLED"))
+        self.assertEqual(get_progress("notes-1")["stage"], "cancelled")
+        self.revoke.assert_called_once_with("notes-1")
+
+    def test_running_task_is_cancelling(self):
+        set_progress("notes-1", "generating_sections", 40)
+        response = self.cancel("notes-1", "PROGRESS")
+        self.assertEqual((response.status_code, response.json()["state"]), (202, "CANCELLING"))
+        self.assertTrue(is_cancelled("notes-1"))
+        # A second request reports the pending cancellation
+        self.assertEqual(self.cancel("notes-1", "PROGRESS").json()["state"], "CANCELLING")
+
+
+class _FakeInference:
+    """
+    Stands in for ``pc.inference``: the embedding of a text is [len(text), number
+    in it]; batches answer in reverse order of submission to shuffle completion.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def embed(self, model, inputs, parameters):
+        with self._lock:
+            self.calls.append(list(inputs))
+            delay = 0.05 / len(self.calls)
+        time.sleep(delay)
+        return [{"values": [float(len(text)), float(text.split()[-1])]} for text in inputs]
+
+
+class EmbeddingExecutorTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.store = EmbeddingStore(Path(root) / "embeddings.sqlite3")
+        self.inference = _FakeInference()
+        pool = ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(pool.shutdown)
+        self.executor = EmbeddingExecutor(mock.Mock(inference=self.inference), model="test-model",
+                                          bucket=TokenBucket(1e9, 1e9), pool=pool, store=self.store)
+        patcher = mock.patch("NoteMaker.embedding_executor.pack_batches",
+                             side_effect=lambda texts: pack_batches(texts, max_batch=2))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_input_order_and_dedup(self):
+        texts = [f"chunk {i % 5}" for i in range(8)]
+        progress = []
+        vectors = self.executor.embed(texts, on_progress=lambda done, total: progress.append((done, total)))
+        self.assertEqual(vectors, [[7.0, float(i % 5)] for i in range(8)])
+        # Five distinct texts in batches of two, each sent once
+        self.assertEqual(sorted(text for call in self.inference.calls for text in call), [f"chunk {i}" for i in range(5)])
+        self.assertEqual(len(self.inference.calls), 3)
+        self.assertEqual(progress[-1], (5, 5))
+
+    def test_store_hits_are_not_sent(self):
+        self.executor.embed(["chunk 1", "chunk 2"])
+        self.inference.calls.clear()
+        self.assertEqual(self.executor.embed(["chunk 2", "chunk 3", "chunk 1"]), [[7.0, 2.0], [7.0, 3.0], [7.0, 1.0]])
+        self.assertEqual(self.inference.calls, [["chunk 3"]])
+        self.assertEqual((self.executor.store_hits, self.executor.embedded), (2, 3))
+
+    def test_before_batch_aborts(self):
+        def stop():
+            raise TaskCancelled("stop")
+        with self.assertRaises(TaskCancelled):
+            self.executor.embed(["chunk 1", "chunk 2", "chunk 3"], before_batch=stop)
+        self.assertEqual(self.inference.calls, [])
+
+    def test_pack_batches_limits(self):
+        self.assertEqual(pack_batches(["a", "b", "c"], max_batch=2), [[0, 1], [2]])
+        self.assertEqual(pack_batches(["x" * 70, "y" * 70, "z"], max_tokens=30), [[0], [1, 2]])
+
+
+class ImageCacheTests(TestCase):
+    def age(self, query, seconds):
+        ImageSearchCache.objects.filter(query=query).update(created_at=timezone.now() - timedelta(seconds=seconds))
+
+    def test_empty_results_expire_early(self):
+        image_cache.store_images("Kai'Sa  Positioning", ["https://img/1.png"])
+        image_cache.store_images("rare query", [])
+        for query in ("kai'sa positioning", "rare query"):
+            self.age(query, image_cache.IMAGE_CACHE_EMPTY_TTL + 1)
+        self.assertEqual(image_cache.get_images("Kai'Sa Positioning"), ["https://img/1.png"])
+        self.assertIsNone(image_cache.get_images("rare query"))
+
+    def test_evicts_every_n_writes(self):
+        with mock.patch.object(image_cache, "IMAGE_CACHE_MAX_ENTRIES", 2), \
+                mock.patch.object(image_cache, "IMAGE_CACHE_EVICT_EVERY", 3), \
+                mock.patch.object(image_cache, "_writes", itertools.count(1)), \
+                mock.patch.object(image_cache, "evict", wraps=image_cache.evict) as evict:
+            for i in range(4):
+                image_cache.store_images(f"query {i}", [f"https://img/{i}.png"])
+        self.assertEqual(evict.call_count, 1)
+        self.assertEqual(sorted(ImageSearchCache.objects.values_list("query", flat=True)),
+                         ["query 1", "query 2", "query 3"])
+
+
+    def test_new_image_without_api_key(self):
+        with mock.patch.dict(os.environ, {"GOOGLE_API_KEY": ""}), \
+                mock.patch.object(myutils, "acached_search_images") as search:
+            self.assertEqual(asyncio.run(myutils.anew_image("kai'sa")), myutils.PLACEHOLDER_IMAGE)
+        search.assert_not_called()
+        self.assertFalse(ImageSearchCache.objects.exists())
+
+
+class ChunkIdTests(SimpleTestCase):
+    def test_stable_and_content_addressed(self):
+        doc_hash = text_hash("guide v1")
+        first = chunk_id(doc_hash, 0, "Build Rageblade on Kai'Sa.")
+        self.assertEqual(first, chunk_id(doc_hash, 0, "Build Rageblade on Kai'Sa."))
+        self.assertTrue(first.startswith(doc_prefix(doc_hash)) and first.isascii())
+        self.assertNotEqual(first, chunk_id(doc_hash, 1, "Build Rageblade on Kai'Sa."))
+        self.assertNotEqual(first, chunk_id(doc_hash, 0, "Build Shojin on Kai'Sa."))
+        self.assertFalse(first.startswith(doc_prefix(text_hash("guide v2"))))
+
+    def test_file_sha256(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        path = Path(root) / "guide.pdf"
+        path.write_bytes(b"%PDF-1.4")
+        self.assertEqual(file_sha256(path), hashlib.sha256(b"%PDF-1.4").hexdigest())
+
+
+class ProcessPdfTests(SimpleTestCase):
+    def setUp(self):
+        root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.path = root / "guide.pdf"
+        self.path.write_bytes(b"%PDF-1.4 tft guide")
+        self.store = LocalVectorStore(root=root / "vectors")
+        self.chunks = [PDFChunk(f"Section {i} of the reroll guide.", page=1, index=i) for i in range(3)]
+        for target, value in [("pc", object()), ("get_index", mock.Mock(return_value=self.store)),
+                              ("upsert_chunks", mock.Mock(side_effect=self.store.upsert))]:
+            patcher = mock.patch.object(ai_module, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def process(self):
+        embed = mock.Mock(side_effect=lambda texts, *args, **kwargs: [[1.0, float(len(t))] for t in texts])
+        with mock.patch.object(ai_module, "parse_pdf", return_value=ParsedPDF("", ["page"], self.chunks)) as parse_pdf, \
+                mock.patch.object(ai_module.embedding_executor, "embed", embed):
+            self.assertTrue(ai_module.process_pdf_to_vector_db(str(self.path)))
+        return parse_pdf.call_count, sum(len(call.args[0]) for call in embed.call_args_list)
+
+    def test_indexed_file_is_not_parsed_again(self):
+        self.assertEqual(self.process(), (1, 3))
+        self.assertEqual(self.process(), (0, 0))
+
+    def test_interrupted_file_embeds_only_missing_chunks(self):
+        self.process()
+        doc_hash = file_sha256(self.path)
+        self.store.delete(ids=[chunk_id(doc_hash, 2, self.chunks[2].text)])
+        self.assertEqual(self.process(), (1, 1))
+
+
+class ReindexTests(SimpleTestCase):
+    def setUp(self):
+        root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.manifest = IndexManifest(root / "manifest.sqlite3")
+        self.store = LocalVectorStore(root=root / "vectors")
+        self.lexical = LexicalIndex(root=root / "lexical")
+        for target, value in [("get_vector_store", self.store), ("get_lexical_index", self.lexical)]:
+            patcher = mock.patch.object(incremental_index, target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(incremental_index, "bump_kb_version")
+        self.bump = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def chunk(chunk_id, parent, text, **metadata):
+        return {"id": chunk_id, "values": [1.0, float(len(text))],
+                "metadata": {"text": text, "parent_id": parent, **metadata}}
+
+    def reindex(self, vectors, **kwargs):
+        return reindex(vectors, namespace="items", manifest=self.manifest, **kwargs)
+
+    def test_added_changed_removed(self):
+        diff = self.reindex([self.chunk("a0", "a", "Rageblade"), self.chunk("a1", "a", "Shojin"),
+                             self.chunk("b0", "b", "Bloodthirster")])
+        self.assertEqual((sorted(diff.added), diff.changed, diff.removed), (["a0", "a1", "b0"], [], []))
+
+        diff = self.reindex([self.chunk("a0", "a", "Rageblade"), self.chunk("a1", "a", "Shojin", tier="S"),
+                             self.chunk("a2", "a", "Deathcap")])
+        self.assertEqual((diff.added, diff.changed, diff.removed, diff.unchanged), (["a2"], ["a1"], ["b0"], 1))
+        self.assertEqual(sorted(self.store.list_ids("", "items")), ["a0", "a1", "a2"])
+        self.assertEqual([doc_id for doc_id, _, _ in self.lexical.search("bloodthirster", "items")], [])
+        self.assertEqual(self.bump.call_count, 2)
+
+    def test_parent_scope_leaves_other_parents(self):
+        self.reindex([self.chunk("a0", "a", "Rageblade"), self.chunk("b0", "b", "Bloodthirster")])
+        diff = self.reindex([self.chunk("a1", "a", "Shojin")], parent_ids=["a"])
+        self.assertEqual((diff.added, diff.removed), (["a1"], ["a0"]))
+        self.assertEqual(sorted(self.store.list_ids("", "items")), ["a1", "b0"])
+        self.assertEqual(sorted(self.manifest.entries("items")), ["a1", "b0"])
+
+    def test_unchanged_writes_nothing(self):
+        vectors = [self.chunk("a0", "a", "Rageblade")]
+        self.reindex(vectors)
+        diff = self.reindex(vectors)
+        self.assertFalse(diff.has_changes)
+        self.assertEqual(self.bump.call_count, 1)
+
+    def test_only_new_text_is_embedded(self):
+        self.reindex([self.chunk("a0", "a", "Rageblade")])
+        embedder = mock.Mock()
+        embedder.embed.return_value = [[0.0, 1.0]]
+        vectors = [self.chunk("a0", "a", "Rageblade"), {"id": "a1", "metadata": {"text": "Shojin", "parent_id": "a"}}]
+        self.reindex(vectors, embedder=embedder)
+        self.assertEqual(embedder.embed.call_args.args[:2], (["Shojin"], "passage"))
+        with self.assertRaises(ValueError):
+            self.reindex([{"id": "a2", "metadata": {"text": "Deathcap", "parent_id": "a"}}])
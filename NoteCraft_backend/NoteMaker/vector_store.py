@@ -0,0 +1,710 @@
+"""
+Vector store abstraction.
+
+All code that reads or writes vectors goes through a ``VectorStore`` instead of the
+Pinecone client. The interface mirrors the subset of ``pinecone.Index`` the project
+uses (upsert / query / delete / describe_index_stats, namespaces, metadata filters),
+so a store can be dropped in where an index used to be.
+
+Backends (``VECTOR_STORE_BACKEND``):
+- ``pinecone``: the hosted index (default).
+- ``local``: in-process float32 matrices persisted under ``local_data/vector_store``,
+  brute force for small namespaces and HNSW (hnswlib, optional) for large ones.
+- ``hybrid``: Pinecone for everything, with the namespaces in
+  ``LOCAL_VECTOR_NAMESPACES`` mirrored locally and served in-process once the
+  mirror has been backfilled (from Pinecone until then).
+
+This module must stay importable without Django so the offline scripts can use it.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+from .file_lock import FileLock, file_version
+from .kb_version import LOCAL_DATA_DIR
+
+INDEX_NAME = "teamfight-tactics-knowledges"
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone")
+LOCAL_VECTOR_STORE_DIR = Path(os.getenv("LOCAL_VECTOR_STORE_DIR", LOCAL_DATA_DIR / "vector_store"))
+LOCAL_VECTOR_NAMESPACES = [
+    ns.strip() for ns in os.getenv("LOCAL_VECTOR_NAMESPACES", "items,champions").split(",") if ns.strip()
+]
+# Written next to a hot namespace's local mirror once it holds a full copy (HybridVectorStore.backfill)
+MIRROR_SYNC_MARKER = "mirror_synced"
+# Namespaces at least this large are searched through an HNSW graph when hnswlib is installed
+HNSW_MIN_SIZE = int(os.getenv("HNSW_MIN_SIZE", "10000"))
+
+
+def to_ascii_id(original_id: str) -> str:
+    """
+    Pinecone ids must be ASCII; non-ASCII characters become unicode escapes
+    (e.g. \\u9b3c). Used by every writer so lexical and vector ids line up.
+    """
+    return original_id.encode('unicode_escape').decode('ascii')
+
+
+def clean_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Pinecone metadata only holds str, int, float, bool and list[str]: other
+    dicts/lists become JSON strings, numeric strings ("12", "45%", "#3",
+    "1,200") become numbers and None becomes "".
+    """
+    cleaned = metadata.copy()
+    for key, value in cleaned.items():
+        if isinstance(value, (dict, list)):
+            if not (isinstance(value, list) and all(isinstance(x, str) for x in value)):
+                cleaned[key] = json.dumps(value, ensure_ascii=False)
+        elif isinstance(value, str):
+            is_percent = '%' in value
+            clean_val = value.replace('%', '').replace('#', '').replace(',', '').strip()
+            try:
+                float_val = float(clean_val)
+            except ValueError:
+                continue
+            if is_percent:
+                float_val = float_val / 100.0
+            cleaned[key] = int(float_val) if float_val.is_integer() else round(float_val, 6)
+        elif value is None:
+            cleaned[key] = ""
+    return cleaned
+
+
+class QueryMatch:
+    __slots__ = ("id", "score", "metadata", "values", "namespace")
+
+    def __init__(self, id: str, score: float, metadata: Optional[Dict] = None,
+                 values: Optional[List[float]] = None, namespace: str = ""):
+        self.id = id
+        self.score = score
+        self.metadata = metadata
+        self.values = values
+        self.namespace = namespace
+
+    def __repr__(self):
+        return f"QueryMatch(id={self.id!r}, score={self.score:.4f})"
+
+
+class QueryResult:
+    def __init__(self, matches: List[QueryMatch], namespace: str = ""):
+        self.matches = matches
+        self.namespace = namespace
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    """
+    Evaluates a Pinecone-style metadata filter
+    ($eq, $ne, $gt, $gte, $lt, $lte, $in, $nin, $exists, $and, $or) against ``metadata``.
+    """
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, expected in condition.items():
+            if not _compare(op, value, expected, key in metadata):
+                return False
+    return True
+
+
+def _compare(op: str, value: Any, expected: Any, present: bool) -> bool:
+    # A list value matches $eq/$in when any element does, like Pinecone list[str] metadata
+    values = value if isinstance(value, list) else [value]
+    try:
+        if op == "$eq":
+            return expected in values
+        if op == "$ne":
+            return expected not in values
+        if op == "$in":
+            return any(v in expected for v in values)
+        if op == "$nin":
+            return all(v not in expected for v in values)
+        if op == "$exists":
+            return present == bool(expected)
+        if value is None:
+            return False
+        if op == "$gt":
+            return value > expected
+        if op == "$gte":
+            return value >= expected
+        if op == "$lt":
+            return value < expected
+        if op == "$lte":
+            return value <= expected
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+class VectorStore:
+    """
+    Base interface. Vectors are dicts of ``{"id", "values", "metadata"}``.
+    """
+
+    def upsert(self, vectors: List[Dict], namespace: str = "") -> int:
+        raise NotImplementedError
+
+    def query(self, vector: List[float], top_k: int = 5, namespace: str = "",
+              filter: Optional[Dict] = None, include_metadata: bool = True,
+              include_values: bool = False) -> QueryResult:
+        raise NotImplementedError
+
+    def delete(self, ids: Optional[List[str]] = None, filter: Optional[Dict] = None,
+               namespace: str = "", delete_all: bool = False) -> None:
+        raise NotImplementedError
+
+    def existing_ids(self, ids: List[str], namespace: str = "") -> Set[str]:
+        """
+        The subset of ``ids`` that is stored in the namespace.
+        """
+        raise NotImplementedError
+
+    def list_ids(self, prefix: str, namespace: str = "") -> List[str]:
+        """
+        Every stored id starting with ``prefix``.
+        """
+        raise NotImplementedError
+
+    def fetch(self, ids: List[str], namespace: str = "") -> List[Dict]:
+        """
+        The stored vectors (``{"id", "values", "metadata"}``) among ``ids``.
+        """
+        raise NotImplementedError
+
+    def list_namespaces(self) -> List[str]:
+        raise NotImplementedError
+
+    def describe_index_stats(self) -> Dict:
+        raise NotImplementedError
+
+    @contextmanager
+    def deferred_save(self):
+        """
+        Groups many writes into one persist step (no-op for remote stores).
+        """
+        yield self
+
+
+class PineconeVectorStore(VectorStore):
+    def __init__(self, index):
+        self.index = index
+
+    def upsert(self, vectors: List[Dict], namespace: str = "") -> int:
+        if not vectors:
+            return 0
+        self.index.upsert(vectors=vectors, namespace=namespace)
+        return len(vectors)
+
+    def query(self, vector, top_k=5, namespace="", filter=None, include_metadata=True, include_values=False):
+        kwargs = dict(vector=list(vector), top_k=top_k, namespace=namespace,
+                      include_metadata=include_metadata, include_values=include_values)
+        if filter:
+            kwargs["filter"] = filter
+        results = self.index.query(**kwargs)
+        matches = [
+            QueryMatch(m.id, m.score, m.metadata, m.values if include_values else None, namespace)
+            for m in (results.matches or [])
+        ]
+        return QueryResult(matches, namespace)
+
+    def delete(self, ids=None, filter=None, namespace="", delete_all=False):
+        # Serverless indexes reject delete-by-filter; callers that know the ids should pass them.
+        if delete_all:
+            self.index.delete(delete_all=True, namespace=namespace)
+        elif ids:
+            for i in range(0, len(ids), 1000):
+                self.index.delete(ids=ids[i:i + 1000], namespace=namespace)
+        elif filter:
+            self.index.delete(filter=filter, namespace=namespace)
+
+    def existing_ids(self, ids, namespace=""):
+        found = set()
+        # fetch sends the ids in the query string, keep the URL short
+        for i in range(0, len(ids), 200):
+            found.update(self.index.fetch(ids=ids[i:i + 200], namespace=namespace).vectors.keys())
+        return found
+
+    def list_ids(self, prefix, namespace=""):
+        # list() pages through the ids, one list per page (serverless indexes only)
+        return [i for page in self.index.list(prefix=prefix, namespace=namespace) for i in page]
+
+    def fetch(self, ids, namespace=""):
+        vectors = []
+        for i in range(0, len(ids), 200):
+            found = self.index.fetch(ids=ids[i:i + 200], namespace=namespace).vectors
+            vectors += [{"id": v.id, "values": list(v.values), "metadata": v.metadata or {}} for v in found.values()]
+        return vectors
+
+    def list_namespaces(self) -> List[str]:
+        return list(self.describe_index_stats().get("namespaces", {}).keys())
+
+    def describe_index_stats(self) -> Dict:
+        stats = self.index.describe_index_stats()
+        return stats.to_dict() if hasattr(stats, "to_dict") else dict(stats)
+
+
+class _LocalNamespace:
+    """
+    One namespace of the local store: a growable float32 matrix of unit vectors
+    plus ids and metadata. Deleted rows are tombstoned and compacted on save.
+    """
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.metadata: List[Dict] = []
+        self.row_of: Dict[str, int] = {}
+        self.matrix: Optional[np.ndarray] = None
+        self.alive = np.zeros(0, dtype=bool)
+        self.size = 0
+        self.hnsw = None
+        self.dirty = False
+
+    def _ensure_capacity(self, dim: int, needed: int) -> None:
+        if self.matrix is None:
+            capacity = max(64, needed)
+            self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+            self.alive = np.zeros(capacity, dtype=bool)
+            return
+        if self.matrix.shape[1] != dim:
+            raise ValueError(f"Dimension mismatch: namespace has {self.matrix.shape[1]}, got {dim}")
+        if needed > self.matrix.shape[0] or not self.matrix.flags.writeable:
+            capacity = max(needed, self.matrix.shape[0] * 2)
+            matrix = np.zeros((capacity, dim), dtype=np.float32)
+            matrix[:self.size] = self.matrix[:self.size]
+            alive = np.zeros(capacity, dtype=bool)
+            alive[:self.size] = self.alive[:self.size]
+            self.matrix, self.alive = matrix, alive
+
+    def upsert(self, vectors: List[Dict]) -> None:
+        if not vectors:
+            return
+        values = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+        norms = np.linalg.norm(values, axis=1, keepdims=True)
+        values = values / np.where(norms > 0, norms, 1.0)
+        new_ids = [v["id"] for v in vectors if v["id"] not in self.row_of]
+        self._ensure_capacity(values.shape[1], self.size + len(new_ids))
+        for vec, item in zip(values, vectors):
+            row = self.row_of.get(item["id"])
+            if row is None:
+                row = self.size
+                self.size += 1
+                self.ids.append(item["id"])
+                self.metadata.append(item.get("metadata") or {})
+                self.row_of[item["id"]] = row
+            else:
+                self.metadata[row] = item.get("metadata") or {}
+            self.matrix[row] = vec
+            self.alive[row] = True
+        self.dirty = True
+        self.hnsw = None
+
+    def delete_rows(self, rows: Iterable[int]) -> None:
+        for row in rows:
+            if self.alive[row]:
+                self.alive[row] = False
+                self.row_of.pop(self.ids[row], None)
+                if self.hnsw is not None:
+                    self.hnsw.mark_deleted(row)
+                self.dirty = True
+
+    def count(self) -> int:
+        return int(self.alive[:self.size].sum()) if self.size else 0
+
+    def _build_hnsw(self) -> None:
+        index = hnswlib.Index(space="ip", dim=self.matrix.shape[1])
+        index.init_index(max_elements=self.matrix.shape[0], ef_construction=200, M=16)
+        rows = np.nonzero(self.alive[:self.size])[0]
+        index.add_items(self.matrix[rows], rows)
+        index.set_ef(128)
+        self.hnsw = index
+
+    def search(self, query: np.ndarray, top_k: int, filter: Optional[Dict]):
+        if self.size == 0 or self.matrix is None:
+            return []
+        live = self.count()
+        if live == 0:
+            return []
+        if hnswlib is not None and not filter and live >= HNSW_MIN_SIZE:
+            if self.hnsw is None:
+                self._build_hnsw()
+            labels, distances = self.hnsw.knn_query(query, k=min(top_k, live))
+            # hnswlib "ip" distance is 1 - dot product
+            return [(int(r), float(1.0 - d)) for r, d in zip(labels[0], distances[0])]
+
+        scores = self.matrix[:self.size] @ query
+        scores = np.where(self.alive[:self.size], scores, -np.inf)
+        if filter:
+            # Walk rows best-first and stop once top_k rows pass the filter
+            hits = []
+            for row in np.argsort(-scores):
+                if scores[row] == -np.inf:
+                    break
+                if matches_filter(self.metadata[row], filter):
+                    hits.append((int(row), float(scores[row])))
+                    if len(hits) == top_k:
+                        break
+            return hits
+
+        k = min(top_k, live)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(r), float(scores[r])) for r in top]
+
+    def save(self, path: Path) -> None:
+        path.mkdir(parents=True, exist_ok=True)
+        rows = np.nonzero(self.alive[:self.size])[0]
+        matrix = self.matrix[rows] if self.matrix is not None else np.zeros((0, 0), dtype=np.float32)
+        tmp_vectors = path / "vectors.tmp.npy"
+        tmp_meta = path / "meta.tmp.json"
+        np.save(tmp_vectors, matrix)
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump({"ids": [self.ids[r] for r in rows],
+                       "metadata": [self.metadata[r] for r in rows]}, f, ensure_ascii=False)
+        os.replace(tmp_vectors, path / "vectors.npy")
+        os.replace(tmp_meta, path / "meta.json")
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: Path) -> "_LocalNamespace":
+        ns = cls()
+        vectors_path, meta_path = path / "vectors.npy", path / "meta.json"
+        if not vectors_path.exists() or not meta_path.exists():
+            return ns
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        # Memory-mapped read only; the first write copies it into RAM
+        matrix = np.load(vectors_path, mmap_mode="r")
+        ns.ids = meta["ids"]
+        ns.metadata = meta["metadata"]
+        ns.row_of = {id_: i for i, id_ in enumerate(ns.ids)}
+        ns.size = len(ns.ids)
+        if ns.size:
+            ns.matrix = matrix
+            ns.alive = np.ones(ns.size, dtype=bool)
+        return ns
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process store. Every namespace is kept as a float32 matrix and persisted to
+    ``<root>/<namespace>/{vectors.npy,meta.json}``; other processes pick up the new
+    files on their next query.
+
+    Every write reloads, modifies and rewrites the whole namespace under an
+    inter-process file lock (``<root>/<namespace>.lock``), so bulk writers must
+    wrap their batches in deferred_save(): the lock is then held and the files
+    written once, at the end.
+    """
+
+    def __init__(self, root: Path = LOCAL_VECTOR_STORE_DIR, autosave: bool = True):
+        self.root = Path(root)
+        self.autosave = autosave
+        self._namespaces: Dict[str, _LocalNamespace] = {}
+        self._loaded_version: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._lock = threading.RLock()
+        # One lock per namespace so fan-out queries over several namespaces run in parallel
+        self._namespace_locks: Dict[str, threading.RLock] = {}
+        # File locks kept until the end of deferred_save()
+        self._held: Dict[str, FileLock] = {}
+
+    def _dir(self, namespace: str) -> Path:
+        return self.root / (namespace or "__default__")
+
+    def _namespace_lock(self, namespace: str) -> threading.RLock:
+        with self._lock:
+            return self._namespace_locks.setdefault(namespace, threading.RLock())
+
+    def _get(self, namespace: str) -> _LocalNamespace:
+        path = self._dir(namespace)
+        # meta.json is replaced after vectors.npy, so its version covers both files
+        version = file_version(path / "meta.json")
+        ns = self._namespaces.get(namespace)
+        if ns is None or (not ns.dirty and version != self._loaded_version.get(namespace)):
+            ns = _LocalNamespace.load(path)
+            self._namespaces[namespace] = ns
+            self._loaded_version[namespace] = version
+        return ns
+
+    @contextmanager
+    def _writing(self, namespace: str):
+        """
+        Reload-modify-save of one namespace under its file lock, so concurrent
+        writers in other processes don't drop each other's vectors. Inside
+        deferred_save() the lock is kept until the final save.
+        """
+        with self._namespace_lock(namespace):
+            with self._lock:
+                lock = self._held.get(namespace)
+            if lock is None:
+                lock = FileLock(self.root / f"{self._dir(namespace).name}.lock")
+                lock.acquire()
+                if not self.autosave:
+                    with self._lock:
+                        self._held[namespace] = lock
+            try:
+                ns = self._get(namespace)
+                yield ns
+                if ns.dirty:
+                    self._persist(namespace)
+            finally:
+                with self._lock:
+                    held = self._held.get(namespace) is lock
+                if not held:
+                    lock.release()
+
+    def _persist(self, namespace: str) -> None:
+        if not self.autosave:
+            return
+        ns = self._namespaces[namespace]
+        ns.save(self._dir(namespace))
+        # Saving compacts tombstones, so reload to keep rows and files in sync
+        self._namespaces.pop(namespace)
+        self._get(namespace)
+
+    def upsert(self, vectors: List[Dict], namespace: str = "") -> int:
+        if not vectors:
+            return 0
+        with self._writing(namespace) as ns:
+            ns.upsert(vectors)
+        return len(vectors)
+
+    def query(self, vector, top_k=5, namespace="", filter=None, include_metadata=True, include_values=False):
+        query = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        with self._namespace_lock(namespace):
+            ns = self._get(namespace)
+            hits = ns.search(query, top_k, filter)
+            matches = [
+                QueryMatch(
+                    ns.ids[row],
+                    score,
+                    ns.metadata[row] if include_metadata else None,
+                    ns.matrix[row].tolist() if include_values else None,
+                    namespace,
+                )
+                for row, score in hits
+            ]
+        return QueryResult(matches, namespace)
+
+    def delete(self, ids=None, filter=None, namespace="", delete_all=False):
+        if not (delete_all or ids or filter):
+            return
+        with self._writing(namespace) as ns:
+            if delete_all:
+                rows = range(ns.size)
+            elif ids:
+                rows = [ns.row_of[i] for i in ids if i in ns.row_of]
+            else:
+                rows = [r for r in range(ns.size) if ns.alive[r] and matches_filter(ns.metadata[r], filter)]
+            ns.delete_rows(rows)
+
+    def existing_ids(self, ids, namespace=""):
+        with self._namespace_lock(namespace):
+            ns = self._get(namespace)
+            return {i for i in ids if i in ns.row_of and ns.alive[ns.row_of[i]]}
+
+    def list_ids(self, prefix, namespace=""):
+        with self._namespace_lock(namespace):
+            ns = self._get(namespace)
+            return [i for i, row in ns.row_of.items() if i.startswith(prefix) and ns.alive[row]]
+
+    def count(self, namespace: str = "") -> int:
+        with self._namespace_lock(namespace):
+            return self._get(namespace).count()
+
+    def fetch(self, ids, namespace=""):
+        with self._namespace_lock(namespace):
+            ns = self._get(namespace)
+            rows = [ns.row_of[i] for i in ids if i in ns.row_of and ns.alive[ns.row_of[i]]]
+            return [{"id": ns.ids[r], "values": ns.matrix[r].tolist(), "metadata": ns.metadata[r]} for r in rows]
+
+    def list_namespaces(self) -> List[str]:
+        names = set(self._namespaces)
+        if self.root.exists():
+            for path in self.root.iterdir():
+                if (path / "meta.json").exists():
+                    names.add("" if path.name == "__default__" else path.name)
+        return sorted(names)
+
+    def describe_index_stats(self) -> Dict:
+        namespaces = {}
+        for ns in self.list_namespaces():
+            with self._namespace_lock(ns):
+                namespaces[ns] = {"vector_count": self._get(ns).count()}
+        return {
+            "namespaces": namespaces,
+            "total_vector_count": sum(n["vector_count"] for n in namespaces.values()),
+        }
+
+    def save(self) -> None:
+        try:
+            for namespace, ns in list(self._namespaces.items()):
+                with self._namespace_lock(namespace):
+                    if ns.dirty:
+                        ns.save(self._dir(namespace))
+                        self._namespaces.pop(namespace)
+        finally:
+            with self._lock:
+                held, self._held = self._held, {}
+            for lock in held.values():
+                lock.release()
+
+    @contextmanager
+    def deferred_save(self):
+        autosave = self.autosave
+        self.autosave = False
+        try:
+            yield self
+        finally:
+            self.autosave = autosave
+            self.save()
+
+
+class HybridVectorStore(VectorStore):
+    """
+    Pinecone stays the source of truth; writes to hot namespaces are mirrored into
+    a local store. Reads of a hot namespace stay in the process only once its
+    mirror has been backfilled (``backfill``, see scripts/Chunk-Embed-Upsert/
+    MirrorNamespacesScript.py), which leaves a sync marker next to the mirror;
+    until then they go to Pinecone. Writes made with another backend bypass the
+    mirror, so backfill again after them.
+    """
+
+    def __init__(self, remote: VectorStore, local: LocalVectorStore, local_namespaces: Iterable[str]):
+        self.remote = remote
+        self.local = local
+        self.local_namespaces = set(local_namespaces)
+        self._synced: Set[str] = set()
+        self._warned_unsynced: Set[str] = set()
+
+    def _is_local(self, namespace: str) -> bool:
+        return namespace in self.local_namespaces
+
+    def _sync_marker(self, namespace: str) -> Path:
+        return self.local._dir(namespace) / MIRROR_SYNC_MARKER
+
+    def _serves_locally(self, namespace: str) -> bool:
+        if not self._is_local(namespace):
+            return False
+        if namespace in self._synced:
+            return True
+        if self._sync_marker(namespace).exists():
+            self._synced.add(namespace)
+            return True
+        if namespace not in self._warned_unsynced:
+            self._warned_unsynced.add(namespace)
+            print(f"Warning: local mirror of namespace {namespace!r} has not been backfilled, reading from Pinecone")
+        return False
+
+    def backfill(self, namespace: str, batch_size: int = 200) -> int:
+        """
+        Copies the whole namespace from Pinecone into the local mirror, then
+        records the sync marker so reads switch to the mirror. Returns the count.
+        """
+        ids = self.remote.list_ids("", namespace=namespace)
+        # Holding the mirror's file lock makes concurrent hybrid writes land after the copy
+        with self.local.deferred_save():
+            self.local.delete(delete_all=True, namespace=namespace)
+            for i in range(0, len(ids), batch_size):
+                self.local.upsert(self.remote.fetch(ids[i:i + batch_size], namespace=namespace), namespace=namespace)
+        marker = self._sync_marker(namespace)
+        marker.parent.mkdir(parents=True, exist_ok=True)
+        marker.write_text(str(len(ids)))
+        self._synced.add(namespace)
+        return len(ids)
+
+    def upsert(self, vectors, namespace=""):
+        count = self.remote.upsert(vectors, namespace=namespace)
+        if self._is_local(namespace):
+            self.local.upsert(vectors, namespace=namespace)
+        return count
+
+    def query(self, vector, top_k=5, namespace="", filter=None, include_metadata=True, include_values=False):
+        store = self.local if self._serves_locally(namespace) else self.remote
+        return store.query(vector, top_k=top_k, namespace=namespace, filter=filter,
+                           include_metadata=include_metadata, include_values=include_values)
+
+    def delete(self, ids=None, filter=None, namespace="", delete_all=False):
+        self.remote.delete(ids=ids, filter=filter, namespace=namespace, delete_all=delete_all)
+        if self._is_local(namespace):
+            self.local.delete(ids=ids, filter=filter, namespace=namespace, delete_all=delete_all)
+
+    def existing_ids(self, ids, namespace=""):
+        return self.remote.existing_ids(ids, namespace=namespace)
+
+    def list_ids(self, prefix, namespace=""):
+        return self.remote.list_ids(prefix, namespace=namespace)
+
+    def fetch(self, ids, namespace=""):
+        return self.remote.fetch(ids, namespace=namespace)
+
+    def list_namespaces(self):
+        return self.remote.list_namespaces()
+
+    def describe_index_stats(self):
+        return self.remote.describe_index_stats()
+
+    @contextmanager
+    def deferred_save(self):
+        with self.local.deferred_save():
+            yield self
+
+
+_store: Optional[VectorStore] = None
+_store_lock = threading.Lock()
+
+
+def _pinecone_store() -> PineconeVectorStore:
+    from pinecone import Pinecone
+    api_key = os.getenv("PINECONE_API_KEY")
+    if not api_key:
+        raise ValueError("Pinecone not initialized")
+    return PineconeVectorStore(Pinecone(api_key=api_key).Index(INDEX_NAME))
+
+
+def get_vector_store(backend: Optional[str] = None) -> VectorStore:
+    """
+    Returns the process-wide vector store for ``VECTOR_STORE_BACKEND``
+    (or a fresh one when ``backend`` is given explicitly).
+    """
+    global _store
+    if backend is None and _store is not None:
+        return _store
+
+    name = backend or VECTOR_STORE_BACKEND
+    if name == "local":
+        store: VectorStore = LocalVectorStore()
+    elif name == "hybrid":
+        store = HybridVectorStore(_pinecone_store(), LocalVectorStore(), LOCAL_VECTOR_NAMESPACES)
+    elif name == "pinecone":
+        store = _pinecone_store()
+    else:
+        raise ValueError(f"Unknown VECTOR_STORE_BACKEND: {name}")
+
+    if backend is None:
+        with _store_lock:
+            if _store is None:
+                _store = store
+            return _store
+    return store
@@ -1,20 +1,27 @@
 from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework.views import APIView
-from typing import Dict
-from .myutils import request_OpenRouter,google_search_image,get_context,topics_query,new_image
+from .myutils import request_OpenRouter,new_image
 from requests.exceptions import RequestException
 import requests
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from rest_framework import status, generics, permissions
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 import json
 from .tasks import generate_notes_task
 from celery.result import AsyncResult
+from celery.utils import uuid
 from NoteCraft_backend.celery import app
-from .ai_module import query_ai
+from .ai_module import query_ai, stream_query_ai
+from .note_stream import stream_notes
+from .llm_gateway import LLMGatewayError
+from .memory import get_history, schedule_summary_update
 from .models import Conversation, Message
+from .progress import get_progress, mark_cancelled, set_progress
+from .cancellation import is_cancelled, request_cancel
+from . import note_cache
 from .serializers import ConversationSerializer, MessageSerializer
 
 class HelloWorldView(APIView):
@@ -47,6 +54,35 @@ class MessageListView(generics.ListAPIView):
         conversation_id = self.kwargs['conversation_id']
         return Message.objects.filter(conversation_id=conversation_id, conversation__user=self.request.user).order_by('created_at')
 
+def get_or_create_conversation(user, query: str, conversation_id=None):
+    """
+    Returns the user's conversation, a new one titled after the query,
+    or None if ``conversation_id`` does not belong to the user.
+    """
+    if conversation_id:
+        try:
+            return Conversation.objects.get(id=conversation_id, user=user)
+        except Conversation.DoesNotExist:
+            return None
+    # Create new conversation with the first query as title (truncated)
+    title = query[:30] + "..." if len(query) > 30 else query
+    return Conversation.objects.create(user=user, title=title)
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets clients send ``Accept: text/event-stream``; plain Responses
+    (validation errors) are rendered as a single ``error`` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return sse_event("error", data).encode(self.charset)
+
 class AskAIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -57,34 +93,30 @@ class AskAIView(APIView):
         if not query:
             return Response({"error": "Query is required"}, status=400)
         
-        user = request.user
-        
-        # Handle Conversation
-        if conversation_id:
-            try:
-                conversation = Conversation.objects.get(id=conversation_id, user=user)
-            except Conversation.DoesNotExist:
-                return Response({"error": "Conversation not found"}, status=404)
-        else:
-            # Create new conversation with the first query as title (truncated)
-            title = query[:30] + "..." if len(query) > 30 else query
-            conversation = Conversation.objects.create(user=user, title=title)
+        conversation = get_or_create_conversation(request.user, query, conversation_id)
+        if conversation is None:
+            return Response({"error": "Conversation not found"}, status=404)
+
+        # Recent turns + rolling summary, taken before the new question is stored
+        history = get_history(conversation)
 
         # Save User Message
         Message.objects.create(conversation=conversation, role='user', content=query)
         
         try:
-            result = query_ai(query)
+            result = query_ai(query, history)
             
             ai_content = result.get('answer', '') if isinstance(result, dict) else str(result)
             
             # Save AI Message
             Message.objects.create(conversation=conversation, role='assistant', content=ai_content)
+            schedule_summary_update(conversation.id)
             
             response_data = {
                 "answer": ai_content,
                 "conversation_id": conversation.id,
-                "sources": result.get('sources', [])
+                "sources": result.get('sources', []),
+                "cached": result.get('cached', False)
             }
             return Response(response_data)
         except Exception as e:
@@ -95,6 +127,52 @@ class AskAIView(APIView):
                 "answer": "抱歉，我现在无法连接到大脑，请稍后再试。"
             }, status=500)
 
+class AskAIStreamView(APIView):
+    """
+    Same as AskAIView but answers as Server-Sent Events:
+    ``meta`` (conversation_id), ``sources``, many ``token`` events, then ``done``.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def post(self, request: Request):
+        query = request.data.get("query", "")
+        conversation_id = request.data.get("conversation_id")
+
+        if not query:
+            return Response({"error": "Query is required"}, status=400)
+
+        conversation = get_or_create_conversation(request.user, query, conversation_id)
+        if conversation is None:
+            return Response({"error": "Conversation not found"}, status=404)
+
+        history = get_history(conversation)
+        Message.objects.create(conversation=conversation, role='user', content=query)
+
+        def event_stream():
+            yield sse_event("meta", {"conversation_id": conversation.id})
+            try:
+                for event, data in stream_query_ai(query, history):
+                    if event == "done":
+                        # Persist the assistant message once the whole answer is known
+                        Message.objects.create(conversation=conversation, role='assistant', content=data["answer"])
+                        schedule_summary_update(conversation.id)
+                        data = {**data, "conversation_id": conversation.id}
+                    yield sse_event(event, data)
+            except Exception as e:
+                print(f"AI Stream Error: {e}")
+                yield sse_event("error", {
+                    "error": str(e),
+                    "conversation_id": conversation.id,
+                    "answer": "抱歉，我现在无法连接到大脑，请稍后再试。"
+                })
+
+        response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx-style proxies from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
 class GenerateNoteView(APIView):
     def post(self, request:Request) -> Response:
         params = request.data.get("params", {}) # type: ignore
@@ -102,19 +180,75 @@ class GenerateNoteView(APIView):
         if not query:
             return Response({"error": "query parameter is required"}, status=400)
 
-        prompt_1 = query + topics_query
+        # Same query on the same knowledge base: reuse the finished (or running) generation
+        task_id = note_cache.lookup(query)
+        if task_id:
+            return Response({"message": "Cached notes", "task_id": task_id, "cached": True})
+
+        task_id = uuid()
+        note_cache.reserve(query, task_id)
+        # Lets CancelTaskView tell a queued task from an unknown id
+        set_progress(task_id, "queued", 0)
+        generate_notes_task.apply_async(args=[query], task_id=task_id)
+        return Response({"message": "Note generation started", "task_id": task_id, "cached": False})
+
+class GenerateNoteStreamView(APIView):
+    """
+    Streaming variant of GenerateNoteView as Server-Sent Events: ``topics``,
+    markdown ``token`` events, ``image`` / ``image_resolved`` for the image
+    markers, then ``done`` with the complete notes.
+    """
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def post(self, request:Request):
+        params = request.data.get("params", {}) # type: ignore
+        query = params.get("query", "") # type: ignore
+        if not query:
+            return Response({"error": "query parameter is required"}, status=400)
+
+        # A finished generation of the same query on the same knowledge base is sent at once
+        task_id = note_cache.lookup(query)
+        cached = AsyncResult(task_id) if task_id else None
+
+        def event_stream():
+            try:
+                # Only a successful generation is reused; a failed, cancelled or still running one is streamed afresh
+                if cached is not None and cached.successful() and cached.result.get("success"):
+                    notes = cached.result["notes"]
+                    yield sse_event("token", notes)
+                    yield sse_event("done", {"notes": notes, "failed_topics": cached.result.get("failed_topics", []),
+                                             "cached": True})
+                    return
+                for event, data in stream_notes(query):
+                    if event == "done":
+                        data = {**data, "cached": False}
+                    yield sse_event(event, data)
+            except Exception as e:
+                print(f"Note Stream Error: {e}")
+                yield sse_event("error", {"error": str(e)})
 
-        task = generate_notes_task.delay(prompt_1)
-        return Response({"message": "Note generation started", "task_id": task.id})
+        response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
 class TaskStatusView(APIView):
     def get(self, request:Request, task_id):
         result = AsyncResult(task_id)
-        return Response({
+        response_data = {
             "task_id": task_id,
             "state": result.state,
             "result": result.result if result.ready() else None
-        })
+        }
+        # Stage, percent and partial output (topics, finished sections, images)
+        progress = get_progress(task_id)
+        if progress is not None:
+            if progress["stage"] == "cancelled":
+                response_data["state"] = "CANCELLED"
+            elif not result.ready() and progress["stage"] != "queued":
+                response_data["state"] = "CANCELLING" if is_cancelled(task_id) else "PROGRESS"
+            response_data["progress"] = progress
+        return Response(response_data)
 
 
 class ModifyTextView(APIView):
@@ -127,7 +261,7 @@ class ModifyTextView(APIView):
             end:int = response.find("```", start)
             new_text:str = response[start:end].strip()
             return Response({"message": "Text modified successfully","modifiedContent": new_text})
-        except (TypeError,RequestException) as e:
+        except (TypeError,RequestException,LLMGatewayError) as e:
             return Response({"message": "Error in response from OpenRouter","error": str(e)},status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 class ModifyImageView(APIView):
@@ -167,7 +301,36 @@ class ProxyImageView(APIView):
 # 修改
 
 class CancelTaskView(APIView):
+    """
+    Cooperative cancellation: the task and its sections stop at their next
+    checkpoint (between retrieval, LLM and image stages, or mid LLM stream).
+    The revoke only drops messages still queued; killing the worker process
+    would requeue the task because of acks_late.
+    """
     def post(self, request: Request):
         task_id = request.data.get("task_id")  # type: ignore
-        app.control.revoke(task_id, terminate=True)  
-        return Response({"error": "Missing task_id"}, status=400)
+        if not task_id:
+            return Response({"error": "Missing task_id"}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = AsyncResult(task_id)
+        progress = get_progress(task_id)
+        if progress is None and not result.ready():
+            # PENDING is also what celery reports for ids it has never seen
+            return Response({"task_id": task_id, "error": "Task not found"}, status=status.HTTP_404_NOT_FOUND)
+        progress = progress or {}
+        stage = progress.get("stage")
+        if stage == "cancelled" or (is_cancelled(task_id) and not result.ready()):
+            return Response({"task_id": task_id, "cancelled": True, "state": "CANCELLED" if stage == "cancelled" else "CANCELLING"})
+        if result.ready() or stage == "done":
+            return Response({"task_id": task_id, "cancelled": False, "state": result.state if result.ready() else "SUCCESS",
+                             "error": "Task already finished"}, status=status.HTTP_409_CONFLICT)
+
+        running = result.state in ("STARTED", "PROGRESS") or stage not in (None, "queued")
+        request_cancel(task_id)
+        app.control.revoke(task_id)
+        if not running:
+            # Still queued: the worker discards it, nothing will report back
+            mark_cancelled(task_id)
+            return Response({"task_id": task_id, "cancelled": True, "state": "CANCELLED"})
+        return Response({"task_id": task_id, "cancelled": True, "state": "CANCELLING",
+                         "progress": progress}, status=status.HTTP_202_ACCEPTED)
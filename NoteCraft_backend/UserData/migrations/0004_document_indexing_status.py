@@ -0,0 +1,45 @@
+# Generated by Django 5.1.7 on 2026-10-18 05:01
+
+from django.db import migrations, models
+
+
+def mark_existing_indexed(apps, schema_editor):
+    # Documents uploaded before this migration were indexed inside the upload request
+    Document = apps.get_model('UserData', 'Document')
+    Document.objects.update(indexing_status='indexed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('UserData', '0003_document_game_version_alter_document_first_page'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='indexed_chunks',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='indexing_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='indexing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('indexing', 'Indexing'), ('indexed', 'Indexed'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='indexing_task_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='first_page',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(mark_existing_indexed, migrations.RunPython.noop),
+    ]
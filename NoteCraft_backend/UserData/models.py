@@ -5,13 +5,26 @@ class User(AbstractUser):
     # Add any additional fields here if needed
     pass
 class Document(models.Model):
+    INDEXING_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('indexing', 'Indexing'),
+        ('indexed', 'Indexed'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+
     id = models.UUIDField(primary_key=True,default=uuid.uuid4,editable=False)
     topic = models.CharField(max_length=255)
     pdf_public_id = models.CharField(max_length=500)  
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='documents')
     uploaded_at = models.DateTimeField(auto_now_add=True)
-    first_page=models.TextField()
+    first_page=models.TextField(blank=True, default="")  # Rendered by the ingestion task
     game_version = models.CharField(max_length=50, blank=True, null=True)
+    indexing_status = models.CharField(max_length=20, choices=INDEXING_STATUS_CHOICES, default='pending')
+    indexing_task_id = models.CharField(max_length=255, blank=True, null=True)
+    indexing_error = models.TextField(blank=True, default="")
+    indexed_chunks = models.PositiveIntegerField(default=0)
+    content_hash = models.CharField(max_length=64, blank=True, default="", db_index=True)  # SHA-256 of the PDF
 
     def __str__(self):
         return self.topic
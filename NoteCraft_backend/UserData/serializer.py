@@ -10,8 +10,8 @@ User = get_user_model()
 class DocumentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Document
-        fields = ['id', 'topic', 'pdf_public_id', 'uploaded_by', 'uploaded_at']
-        read_only_fields = ['uploaded_by', 'uploaded_at']
+        fields = ['id', 'topic', 'pdf_public_id', 'uploaded_by', 'uploaded_at', 'indexing_status', 'indexing_task_id']
+        read_only_fields = ['uploaded_by', 'uploaded_at', 'indexing_status', 'indexing_task_id']
 
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
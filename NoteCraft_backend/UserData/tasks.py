@@ -0,0 +1,177 @@
+# tasks.py
+import os
+from pathlib import Path
+
+import requests
+from celery import shared_task
+from django.core.cache import caches
+
+from NoteMaker.ai_module import embedding_executor, pc
+from NoteMaker.cancellation import TaskCancelled, checkpoint
+from NoteMaker.chunk_ids import chunk_id, doc_prefix, file_sha256
+from NoteMaker.kb_version import LOCAL_DATA_DIR
+from NoteMaker.namespaces import UPLOAD_NAMESPACE
+from NoteMaker.pdf_parsing import parse_pdf
+from NoteMaker.progress import ProgressTask, mark_cancelled
+from NoteMaker.retrieval import delete_chunks_by_prefix, upsert_chunks
+from NoteMaker.vector_store import get_vector_store
+from .models import Document
+
+# Uploads are spooled here for the ingestion worker (the compose services share this directory)
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", LOCAL_DATA_DIR / "uploads"))
+INGEST_DOWNLOAD_TIMEOUT = int(os.getenv("INGEST_DOWNLOAD_TIMEOUT", "120"))
+# Deliveries of one ingestion before a file that keeps killing the worker is given up on
+INGEST_MAX_DELIVERIES = int(os.getenv("INGEST_MAX_DELIVERIES", "2"))
+DELIVERY_TTL = 24 * 3600
+
+delivery_cache = caches['shared']
+
+
+def upload_path(document_id) -> Path:
+    return UPLOAD_DIR / f"{document_id}.pdf"
+
+
+def count_delivery(task_id: str) -> int:
+    """
+    How many times this task id has started. acks_late + reject_on_worker_lost
+    requeue a task whose worker died (OOM, a crash in the PDF parser), which
+    for a poisonous file would otherwise repeat forever.
+    """
+    key = f"task_deliveries:{task_id}"
+    delivery_cache.add(key, 0, DELIVERY_TTL)
+    return delivery_cache.incr(key)
+
+
+def _fetch_pdf(document: Document) -> Path:
+    """
+    Local copy of the uploaded PDF; a worker on another host downloads the stored one.
+    """
+    path = upload_path(document.id)
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp")
+    with requests.get(document.pdf_public_id, stream=True, timeout=INGEST_DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        with open(tmp_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                f.write(chunk)
+    os.replace(tmp_path, path)
+    return path
+
+
+@shared_task(bind=True, base=ProgressTask)
+def ingest_document_task(self, document_id: str) -> dict:
+    """
+    Indexes an uploaded document once, into UPLOAD_NAMESPACE (AI chat fans out
+    over it too). A file whose SHA-256 matches an already indexed document is
+    not parsed or embedded again, and chunks whose content-addressed id is
+    already stored are skipped. Progress is reported through TaskStatusView and
+    the outcome in Document.indexing_status.
+    """
+    try:
+        document = Document.objects.get(id=document_id)
+    except Document.DoesNotExist:
+        upload_path(document_id).unlink(missing_ok=True)
+        return {"success": False, "error": "Document not found"}
+    documents = Document.objects.filter(id=document_id)
+    if count_delivery(self.request.id) > INGEST_MAX_DELIVERIES:
+        error = f"The worker was lost {INGEST_MAX_DELIVERIES} times indexing this file (out of memory or a parser crash)"
+        print(f"Giving up on {document.topic}: {error}")
+        documents.update(indexing_status='failed', indexing_error=error)
+        self.update_progress("failed", 100, error=error)
+        upload_path(document_id).unlink(missing_ok=True)
+        return {"success": False, "error": error}
+    documents.update(indexing_status='indexing', indexing_error="")
+
+    path = None
+    try:
+        self.update_progress("downloading", 0, document_id=document_id)
+        self.checkpoint()
+        path = _fetch_pdf(document)
+        doc_hash = file_sha256(path)
+        documents.update(content_hash=doc_hash)
+
+        duplicate = (Document.objects.filter(content_hash=doc_hash, indexing_status='indexed')
+                     .exclude(id=document_id).first())
+        if duplicate is not None:
+            # Same file already indexed: its chunks serve this document too
+            documents.update(first_page=duplicate.first_page, indexing_status='indexed',
+                             indexed_chunks=duplicate.indexed_chunks)
+            self.update_progress("done", 100, duplicate_of=str(duplicate.id))
+            print(f"{document.topic} is identical to {duplicate.topic}, already indexed")
+            return {"success": True, "document_id": document_id, "chunks": duplicate.indexed_chunks,
+                    "duplicate_of": str(duplicate.id)}
+
+        # One parse feeds the thumbnail and the chunks
+        self.update_progress("parsing", 5)
+        parsed = parse_pdf(str(path))
+        documents.update(first_page=parsed.thumbnail)
+        if not pc:
+            raise ValueError("Pinecone not initialized")
+        self.checkpoint()
+
+        chunks = parsed.chunks
+        ids = [chunk_id(doc_hash, chunk.index, chunk.text) for chunk in chunks]
+        # Left over from an interrupted run of the same file
+        stored = get_vector_store().existing_ids(ids, namespace=UPLOAD_NAMESPACE)
+        todo = [i for i, cid in enumerate(ids) if cid not in stored]
+
+        self.update_progress("embedding", 10, pages=len(parsed.pages), chunks_done=0, chunks_total=len(todo),
+                             chunks_skipped=len(ids) - len(todo))
+        cancel_id = self.progress_id()
+        embeddings = embedding_executor.embed(
+            [chunks[i].text for i in todo], "passage",
+            # Runs on the embedding threads, where the task request context isn't available
+            before_batch=lambda: checkpoint(cancel_id),
+            on_progress=lambda done, total: self.update_progress(
+                "embedding", 10 + 80 * done // total, chunks_done=done, chunks_total=total)
+        )
+        vectors = []
+        for i, embedding in zip(todo, embeddings):
+            vectors.append({
+                "id": ids[i],
+                "values": embedding,
+                "metadata": {
+                    "text": chunks[i].text,
+                    "source": document.topic,
+                    "page": chunks[i].page,
+                    "doc_id": str(document.id),
+                    "doc_hash": doc_hash,
+                    "parent_id": doc_hash,
+                    "chunk_index": i,
+                    "namespace": UPLOAD_NAMESPACE
+                }
+            })
+
+        self.checkpoint()
+        self.update_progress("upserting", 90)
+        if vectors:
+            # Also bumps the kb version, invalidating answers and notes built on the old index
+            upsert_chunks(vectors, namespace=UPLOAD_NAMESPACE)
+        previous_hash = document.content_hash
+        stale_error = ""
+        if previous_hash and previous_hash != doc_hash and not Document.objects.filter(content_hash=previous_hash).exists():
+            # The document's file changed since it was last indexed, drop the old chunks (by id,
+            # serverless Pinecone indexes can't delete by filter)
+            try:
+                delete_chunks_by_prefix(doc_prefix(previous_hash), UPLOAD_NAMESPACE)
+            except Exception as e:
+                print(f"Error removing the previous chunks of {document.topic}: {e}")
+                stale_error = f"Previous version still indexed: {e}"
+        documents.update(indexing_status='indexed', indexed_chunks=len(ids), indexing_error=stale_error)
+        self.update_progress("done", 100)
+        print(f"Successfully indexed {len(vectors)} chunks for {document.topic} ({len(ids) - len(vectors)} already stored)")
+        return {"success": True, "document_id": document_id, "chunks": len(ids), "embedded": len(vectors)}
+    except TaskCancelled:
+        documents.update(indexing_status='cancelled')
+        mark_cancelled(self.progress_id())
+        return {"success": False, "cancelled": True, "error": "Task cancelled"}
+    except Exception as e:
+        print(f"Error indexing document {document.topic}: {e}")
+        documents.update(indexing_status='failed', indexing_error=str(e))
+        self.update_progress("failed", 100, error=str(e))
+        return {"success": False, "error": str(e)}
+    finally:
+        if path is not None:
+            path.unlink(missing_ok=True)
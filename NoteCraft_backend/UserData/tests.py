@@ -1,3 +1,84 @@
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.core.cache import caches
 from django.test import TestCase
 
-# Create your tests here.
+from NoteMaker.chunk_ids import chunk_id, file_sha256
+from NoteMaker.pdf_parsing import ParsedPDF, PDFChunk
+from . import tasks
+from .models import Document, User
+
+PDF_BYTES = b"%PDF-1.4 tft guide"
+
+
+class IngestDocumentTaskTests(TestCase):
+    def setUp(self):
+        caches["shared"].clear()
+        upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, upload_dir, ignore_errors=True)
+        patcher = mock.patch.object(tasks, "UPLOAD_DIR", Path(upload_dir))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user("player", password="pw")
+
+    def upload(self, **fields) -> Document:
+        document = Document.objects.create(topic="Reroll guide", pdf_public_id="", uploaded_by=self.user, **fields)
+        path = tasks.upload_path(document.id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(PDF_BYTES)
+        return document
+
+    def ingest(self, document: Document) -> dict:
+        return tasks.ingest_document_task.apply(args=[str(document.id)]).result
+
+    def test_identical_file_is_not_parsed_again(self):
+        original = self.upload()
+        doc_hash = file_sha256(tasks.upload_path(original.id))
+        Document.objects.filter(id=original.id).update(content_hash=doc_hash, indexing_status="indexed",
+                                                       indexed_chunks=7, first_page="thumb")
+        document = self.upload()
+        with mock.patch.object(tasks, "parse_pdf") as parse_pdf:
+            result = self.ingest(document)
+        parse_pdf.assert_not_called()
+        self.assertEqual(result["duplicate_of"], str(original.id))
+        document.refresh_from_db()
+        self.assertEqual((document.indexing_status, document.indexed_chunks, document.first_page, document.content_hash),
+                         ("indexed", 7, "thumb", doc_hash))
+        self.assertFalse(tasks.upload_path(document.id).exists())
+
+    def test_stored_chunks_are_not_embedded_again(self):
+        document = self.upload()
+        doc_hash = file_sha256(tasks.upload_path(document.id))
+        chunks = [PDFChunk(f"Section {i} of the reroll guide.", page=1, index=i) for i in range(3)]
+        store = mock.Mock()
+        store.existing_ids.return_value = {chunk_id(doc_hash, 0, chunks[0].text)}
+        embed = mock.Mock(return_value=[[0.1, 0.2], [0.3, 0.4]])
+        with mock.patch.object(tasks, "parse_pdf", return_value=ParsedPDF("thumb", ["page"], chunks)), \
+                mock.patch.object(tasks, "pc", object()), \
+                mock.patch.object(tasks, "get_vector_store", return_value=store), \
+                mock.patch.object(tasks.embedding_executor, "embed", embed), \
+                mock.patch.object(tasks, "upsert_chunks") as upsert_chunks:
+            result = self.ingest(document)
+        self.assertEqual((result["chunks"], result["embedded"]), (3, 2))
+        self.assertEqual(embed.call_args.args[0], [chunks[1].text, chunks[2].text])
+        upserted = upsert_chunks.call_args.args[0]
+        self.assertEqual([v["id"] for v in upserted], [chunk_id(doc_hash, i, chunks[i].text) for i in (1, 2)])
+        document.refresh_from_db()
+        self.assertEqual((document.indexing_status, document.indexed_chunks), ("indexed", 3))
+
+    def test_redelivered_poison_file_gives_up(self):
+        document = self.upload()
+        with mock.patch.object(tasks, "parse_pdf", side_effect=MemoryError) as parse_pdf:
+            for _ in range(tasks.INGEST_MAX_DELIVERIES):
+                # Same task id each time, like a redelivery after the worker died
+                tasks.ingest_document_task.apply(args=[str(document.id)], task_id="ingest-1")
+                tasks.upload_path(document.id).write_bytes(PDF_BYTES)
+            result = tasks.ingest_document_task.apply(args=[str(document.id)], task_id="ingest-1").result
+        self.assertEqual(parse_pdf.call_count, tasks.INGEST_MAX_DELIVERIES)
+        self.assertFalse(result["success"])
+        document.refresh_from_db()
+        self.assertEqual(document.indexing_status, "failed")
+        self.assertFalse(tasks.upload_path(document.id).exists())
@@ -10,8 +10,6 @@ from django.core.cache import cache
 from rest_framework.request import Request
 import uuid
 from dotenv import load_dotenv
-import base64
-import requests
 from cloudinary.utils import cloudinary_url
 import os
 from rest_framework.permissions import IsAuthenticated
@@ -20,11 +18,14 @@ from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import TokenError,AuthenticationFailed
-import fitz
 from django.core.files.uploadedfile import InMemoryUploadedFile
-from NoteMaker.myutils import index, pc
-from NoteMaker.ai_module import process_pdf_to_vector_db
-import tempfile
+from django.db import transaction
+from celery.utils import uuid as celery_uuid
+from NoteMaker.cancellation import request_cancel
+from NoteMaker.progress import set_progress
+from NoteMaker.chunk_ids import doc_prefix
+from NoteMaker.retrieval import delete_chunks_by_prefix
+from .tasks import UPLOAD_NAMESPACE, ingest_document_task, upload_path
 
 load_dotenv()
 cloudinary.config(
@@ -36,28 +37,24 @@ cloudinary.config(
 config = cloudinary.config(secure=True)
 
 
-def get_first_page_as_base64(pdf:InMemoryUploadedFile)->str:
-    doc=fitz.open(stream=pdf.read(),filetype="pdf")
-    page=doc[0]
-    pix=page.get_pixmap().tobytes("png") # type: ignore
-    return base64.b64encode(pix).decode("utf-8")
-
 class DocumentUploadView(APIView):
     parser_classes = [MultiPartParser]
     permission_classes = [IsAuthenticated]
 
     def post(self, request:Request)->Response:
+        """
+        Stores the PDF and queues ingest_document_task; the thumbnail and the
+        indexing follow in the background (Document.indexing_status, TaskStatusView).
+        """
         if not request.FILES:
             return Response({"error":"No files found"},status=status.HTTP_400_BAD_REQUEST)
         name:str
         file:InMemoryUploadedFile
         for name, file in request.FILES.items(): # type: ignore
             print(name,file)
-            img=get_first_page_as_base64(file)
             try:
                 file.seek(0)
                 # Use the original filename's extension for the public_id to ensure correct Content-Type
-                import os
                 _, ext = os.path.splitext(file.name)
                 if not ext:
                     ext = ".pdf"
@@ -69,78 +66,31 @@ class DocumentUploadView(APIView):
                     folder="documents",
                     public_id=unique_public_id
                 )
+                task_id = celery_uuid()
                 document = Document.objects.create(
                     id=uuid.uuid4(),
                     topic=name,
                     pdf_public_id=upload_result['secure_url'],  
                     uploaded_by=request.user,
-                    first_page=img
+                    indexing_task_id=task_id
                 )
 
-                # Indexing Logic for Golden Spatula Knowledge Base
+                # Spool a local copy so the ingestion worker doesn't have to download it again
                 try:
-                    # 1. Ingest into ChromaDB (for AI Chat)
-                    file.seek(0)
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_pdf:
-                        temp_pdf.write(file.read())
-                        temp_pdf_path = temp_pdf.name
-                    
-                    process_pdf_to_vector_db(temp_pdf_path)
-                    os.remove(temp_pdf_path)
-
-                    # 2. Existing Pinecone Logic (Optional, keeping for compatibility)
+                    path = upload_path(document.id)
+                    path.parent.mkdir(parents=True, exist_ok=True)
                     file.seek(0)
-                    doc_pdf = fitz.open(stream=file.read(), filetype="pdf")
-                    text_content = ""
-                    for page in doc_pdf:
-                        text_content += page.get_text()
-                    
-                    # Chunking
-                    chunk_size = 1000
-                    chunks = [text_content[i:i+chunk_size] for i in range(0, len(text_content), chunk_size)]
-                    
-                    if pc: # Only if Pinecone is initialized
-                        vectors = []
-                        for i, chunk in enumerate(chunks):
-                            # ... existing embedding logic ...
-                            pass 
-                            # (I'm not modifying the complex pinecone logic deeply, just ensuring it doesn't break)
-                            # But wait, I need to match the exact string to replace.
-
-                    text_content = ""
-                    for page in doc_pdf:
-                        text_content += page.get_text()
-                    
-                    # Chunking
-                    chunk_size = 1000
-                    chunks = [text_content[i:i+chunk_size] for i in range(0, len(text_content), chunk_size)]
-                    
-                    vectors = []
-                    for i, chunk in enumerate(chunks):
-                        embedding = pc.inference.embed(
-                            model="llama-text-embed-v2",
-                            inputs=[chunk],
-                            parameters={"input_type": "passage"}
-                        )[0].values
-                        
-                        vectors.append({
-                            "id": f"{document.id}_{i}",
-                            "values": embedding,
-                            "metadata": {
-                                "text": chunk,
-                                "source": document.topic,
-                                "doc_id": str(document.id),
-                                "namespace": "patch_notes" # Default namespace for uploads
-                            }
-                        })
-                    
-                    if vectors:
-                        index.upsert(vectors=vectors, namespace="patch_notes")
-                        print(f"Successfully indexed {len(vectors)} chunks for {name}")
-                    
-                except Exception as e:
-                    print(f"Error indexing document {name}: {e}")
-
+                    with open(path, "wb") as spooled:
+                        for chunk in file.chunks():
+                            spooled.write(chunk)
+                except OSError as e:
+                    print(f"Could not spool {name}, the worker will download it: {e}")
+
+                # Registered before queuing so CancelTaskView knows the id
+                set_progress(task_id, "queued", 0)
+                transaction.on_commit(
+                    lambda: ingest_document_task.apply_async(args=[str(document.id)], task_id=task_id)
+                )
                 serializer= DocumentSerializer(document)
                 return Response(serializer.data,status=status.HTTP_201_CREATED)
             except Exception as e:
@@ -189,6 +139,7 @@ class ListDocumentView(APIView):
                 "first_page_base64": doc.first_page,
                 "uploaded_by": doc.uploaded_by.username,
                 "created_at": doc.uploaded_at.strftime("%Y-%m-%d %H:%M:%S"),
+                "indexing_status": doc.indexing_status,
             })
         
         return Response({"result":results},status=status.HTTP_200_OK)
@@ -205,8 +156,22 @@ class DeleteDocumentView(APIView):
         if document.uploaded_by != request.user:
             return Response({"error": "You are not authorized to delete this document"}, status=status.HTTP_403_FORBIDDEN)
 
-        # Optional: Delete from Cloudinary and Pinecone here if needed
-        # For now, just delete from DB
+        # Optional: Delete from Cloudinary here if needed
+        if document.indexing_status in ('pending', 'indexing') and document.indexing_task_id:
+            # Stop the ingestion, otherwise it would index a deleted document
+            request_cancel(document.indexing_task_id)
+        try:
+            if not document.content_hash:
+                # Indexed before content hashing, with ids "<document id>_<chunk index>"
+                delete_chunks_by_prefix(f"{document.id}_", UPLOAD_NAMESPACE)
+            elif not Document.objects.filter(content_hash=document.content_hash).exclude(id=document.id).exists():
+                # Identical uploads share their chunks, only the last one removes them
+                delete_chunks_by_prefix(doc_prefix(document.content_hash), UPLOAD_NAMESPACE)
+        except Exception as e:
+            # Keep the row so the delete can be retried, its chunks are still searchable
+            print(f"Error removing chunks of document {doc_id}: {e}")
+            return Response({"error": f"Could not remove the document from the knowledge base: {e}"},
+                            status=status.HTTP_502_BAD_GATEWAY)
         document.delete()
         return Response({"message": "Document deleted successfully"}, status=status.HTTP_200_OK)
 
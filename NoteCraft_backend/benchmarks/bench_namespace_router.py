@@ -0,0 +1,114 @@
+"""
+Accuracy and latency of the local namespace router (centroid + keyword fallback)
+against the topics_query LLM call it replaces, on a small labeled query set.
+
+Needs PINECONE_API_KEY (embeddings) and OPEN_ROUTER_API_KEY (LLM baseline).
+The LLM baseline can be skipped with --no-llm. Run it before lowering the
+ROUTER_MIN_SCORE / ROUTER_MIN_MARGIN defaults, which are kept strict until then.
+
+Usage (from NoteCraft_backend/):
+    python benchmarks/bench_namespace_router.py
+    ROUTER_MIN_MARGIN=0.05 python benchmarks/bench_namespace_router.py --no-llm
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "NoteCraft_backend.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from NoteMaker.myutils import request_OpenRouter, route_query, topics_query  # noqa: E402
+
+LABELED_QUERIES = [
+    ("卡莎出什么装备", "items"),
+    ("Best items for Jinx", "items"),
+    ("光明装备有哪些值得合成", "items"),
+    ("How do I build Guinsoo's Rageblade", "items"),
+    ("神器装备怎么选", "items"),
+    ("当前版本最强阵容", "compositions"),
+    ("Best reroll comps this patch", "compositions"),
+    ("九五阵容怎么玩", "compositions"),
+    ("fast 8 board for climbing", "compositions"),
+    ("前期过渡阵容推荐", "compositions"),
+    ("Which 5 cost champion is the strongest carry", "champions"),
+    ("阿狸的技能是什么", "champions"),
+    ("哪些一费卡适合前期", "champions"),
+    ("Tank units that hold the frontline", "champions"),
+    ("决斗大师羁绊几个最好", "traits"),
+    ("Trait breakpoints for Sorcerer", "traits"),
+    ("金铲铲转职怎么用", "traits"),
+    ("origins vs classes explained", "traits"),
+    ("棱彩海克斯选什么", "augments"),
+    ("Best gold augments for econ", "augments"),
+    ("海克斯强化怎么选择", "augments"),
+    ("Which silver augments are traps", "augments"),
+    ("什么时候该升人口", "game_mechanics"),
+    ("Rolling odds at level 8", "game_mechanics"),
+    ("连败运营技巧", "game_mechanics"),
+    ("How does interest work", "game_mechanics"),
+    ("伤害是怎么计算的", "game_mechanics"),
+    ("这个版本加强了哪些英雄", "patch_notes"),
+    ("What got nerfed in the latest patch", "patch_notes"),
+    ("最新补丁改动", "patch_notes"),
+    ("Balance changes to augments this patch", "patch_notes"),
+    ("版本更新后还能玩什么", "patch_notes"),
+]
+
+
+def llm_namespace(query: str) -> str:
+    response = request_OpenRouter(query + topics_query)
+    start = response.find("```json") + len("```json")
+    end = response.find("```", start)
+    return json.loads(response[start:end].strip())["namespace"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--no-llm", action="store_true", help="skip the LLM baseline")
+    args = parser.parse_args()
+
+    route_query("warm up")  # builds or loads the centroids
+
+    rows = []
+    for query, label in LABELED_QUERIES:
+        started = time.perf_counter()
+        decision = route_query(query)
+        router_ms = (time.perf_counter() - started) * 1000
+
+        llm, llm_ms = None, None
+        if not args.no_llm:
+            started = time.perf_counter()
+            try:
+                llm = llm_namespace(query)
+            except Exception as e:
+                print(f"LLM failed for {query!r}: {e}")
+            llm_ms = (time.perf_counter() - started) * 1000
+        rows.append((query, label, decision, router_ms, llm, llm_ms))
+        print(f"{label:<15} router={str(decision.namespace):<15} ({decision.method:<8} {router_ms:7.1f} ms)  "
+              f"llm={str(llm):<15} {query}")
+
+    total = len(rows)
+    confident = [r for r in rows if r[2].confident]
+    print()
+    print(f"router confident on   {len(confident)}/{total} queries "
+          f"({sum(r[2].method == 'keyword' for r in rows)} via keywords)")
+    if confident:
+        print(f"router accuracy       {sum(r[2].namespace == r[1] for r in confident) / len(confident):.1%} "
+              f"(confident only), median {statistics.median(r[3] for r in rows):.1f} ms")
+    if not args.no_llm:
+        print(f"LLM accuracy          {sum(r[4] == r[1] for r in rows) / total:.1%}, "
+              f"median {statistics.median(r[5] for r in rows):.0f} ms")
+        combined = sum((r[2].namespace if r[2].confident else r[4]) == r[1] for r in rows)
+        print(f"router + LLM fallback {combined / total:.1%}, LLM calls saved {len(confident)}/{total}")
+
+
+if __name__ == "__main__":
+    main()
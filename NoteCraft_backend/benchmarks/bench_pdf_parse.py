@@ -0,0 +1,137 @@
+"""
+CPU time and peak memory of parsing an uploaded PDF, the old way (fitz for the
+thumbnail, PyPDFLoader + splitter for the knowledge base, fitz again with the
+page text extracted twice for patch_notes) versus one pass of parse_pdf.
+
+Each variant runs in a fresh subprocess so the peak RSS of one doesn't hide the
+other's. Fully offline, the PDF is generated.
+
+Usage (from NoteCraft_backend/):
+    python benchmarks/bench_pdf_parse.py --pages 300
+    python benchmarks/bench_pdf_parse.py --pdf some_patch_notes.pdf
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+PARAGRAPH = (
+    "Patch 14.{page}: Kai'Sa's Icathian Rain now fires {n} missiles (was {m}). "
+    "Guinsoo's Rageblade attack speed per stack reduced. Prismatic augment Cybernetic Implants "
+    "grants +{n}0 health to holders of items. 阵容推荐：九五至尊，主C装备：无尽之刃、巨人杀手。 "
+)
+
+
+def make_pdf(path: Path, pages: int) -> None:
+    import fitz
+
+    pdf = fitz.open()
+    for number in range(pages):
+        page = pdf.new_page()
+        page.draw_rect(fitz.Rect(36, 36, 560, 90), color=(0.2, 0.3, 0.8), fill=(0.9, 0.9, 1.0))
+        text = " ".join(PARAGRAPH.format(page=number, n=number % 7 + 3, m=number % 7 + 2) for _ in range(12))
+        page.insert_textbox(fitz.Rect(36, 100, 560, 800), text, fontsize=9)
+    pdf.save(path)
+
+
+def legacy(path: str) -> int:
+    # What one upload used to do: four opens, two full text extractions of the same file
+    import base64
+
+    import fitz
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    data = Path(path).read_bytes()
+    doc = fitz.open(stream=data, filetype="pdf")
+    base64.b64encode(doc[0].get_pixmap().tobytes("png")).decode("utf-8")
+
+    documents = PyPDFLoader(path).load()
+    texts = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_documents(documents)
+
+    doc_pdf = fitz.open(stream=data, filetype="pdf")
+    text_content = ""
+    for page in doc_pdf:
+        text_content += page.get_text()
+    text_content = ""
+    for page in doc_pdf:
+        text_content += page.get_text()
+    chunks = [text_content[i:i+1000] for i in range(0, len(text_content), 1000)]
+    return len(texts) + len(chunks)
+
+
+def single_pass(path: str) -> int:
+    from NoteMaker.pdf_parsing import parse_pdf
+
+    parsed = parse_pdf(path)
+    # Both indexing paths consume the same chunks
+    return 2 * len(parsed.chunks)
+
+
+def measure(variant: str, path: str) -> None:
+    # Runs in the subprocess: import cost is excluded from both numbers
+    import fitz  # noqa: F401
+    import langchain_text_splitters  # noqa: F401
+    from langchain_community.document_loaders import PyPDFLoader  # noqa: F401
+    import NoteMaker.pdf_parsing  # noqa: F401
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    cpu, wall = time.process_time(), time.perf_counter()
+    chunks = {"legacy": legacy, "single": single_pass}[variant](path)
+    print(json.dumps({
+        "cpu_s": time.process_time() - cpu,
+        "wall_s": time.perf_counter() - wall,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "rss_growth_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss) / 1024,
+        "chunks": chunks,
+    }))
+
+
+def run(variant: str, path: str) -> dict:
+    output = subprocess.run([sys.executable, __file__, "--measure", variant, "--pdf", path],
+                            capture_output=True, text=True, check=True, cwd=BACKEND_DIR).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--pdf", help="use this PDF instead of a generated one")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--measure", choices=["legacy", "single"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.pdf)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.pdf
+        if not path:
+            path = str(Path(tmp) / "bench.pdf")
+            make_pdf(Path(path), args.pages)
+        print(f"{path}: {Path(path).stat().st_size / 1024:.0f} KiB")
+
+        results = {}
+        for variant in ("legacy", "single"):
+            runs = [run(variant, path) for _ in range(args.repeat)]
+            results[variant] = {key: min(r[key] for r in runs) for key in runs[0]}
+            r = results[variant]
+            print(f"{variant:<7} cpu {r['cpu_s']:6.2f} s  wall {r['wall_s']:6.2f} s  "
+                  f"peak RSS {r['peak_rss_mb']:6.1f} MiB (+{r['rss_growth_mb']:.1f} MiB while parsing)  "
+                  f"{r['chunks']} chunks produced")
+
+        old, new = results["legacy"], results["single"]
+        print(f"\nCPU saved {1 - new['cpu_s'] / old['cpu_s']:.0%}, "
+              f"parse memory saved {1 - new['rss_growth_mb'] / max(old['rss_growth_mb'], 1e-9):.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Query latency of the in-process LocalVectorStore, fully offline.
+
+Usage (from NoteCraft_backend/):
+    python benchmarks/bench_vector_store.py --sizes 1000 10000 50000 --dim 1024
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from NoteMaker.vector_store import LocalVectorStore, hnswlib  # noqa: E402
+
+
+def run(size: int, dim: int, queries: int, top_k: int) -> None:
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((size, dim), dtype=np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = LocalVectorStore(Path(tmp))
+        with store.deferred_save():
+            for start in range(0, size, 1000):
+                store.upsert([
+                    {"id": f"v{i}", "values": data[i], "metadata": {"bucket": i % 10}}
+                    for i in range(start, min(start + 1000, size))
+                ], namespace="bench")
+
+        probes = rng.standard_normal((queries, dim), dtype=np.float32)
+        store.query(probes[0], top_k=top_k, namespace="bench")  # warm up (load / build HNSW)
+
+        for label, flt in (("no filter", None), ("bucket filter", {"bucket": {"$in": [1, 2]}})):
+            start = time.perf_counter()
+            for probe in probes:
+                store.query(probe, top_k=top_k, namespace="bench", filter=flt)
+            elapsed = (time.perf_counter() - start) / queries * 1000
+            print(f"size={size:>7} dim={dim} {label:<14} {elapsed:8.3f} ms/query")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"hnswlib available: {hnswlib is not None}")
+    for size in args.sizes:
+        run(size, args.dim, args.queries, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Concurrent-request throughput of the sync views under WSGI (gunicorn) versus the
+async views under ASGI (uvicorn), against a fake DeepSeek endpoint with a fixed
+latency so the numbers don't depend on the real API.
+
+By default it benchmarks the text-rewrite endpoint (/modify_text/ vs
+/async/modify_text/) since it needs nothing but the LLM.
+
+Usage (from NoteCraft_backend/):
+    python benchmarks/bench_wsgi_vs_asgi.py --requests 400 --concurrency 200 --llm-delay 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_llm(port: int, delay: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(delay)
+            body = json.dumps({
+                "id": "bench", "object": "chat.completion", "created": 0, "model": "deepseek-chat",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "```text\nrewritten\n```"}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    ThreadingHTTPServer.daemon_threads = True
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def wait_for_port(port: int, timeout: float = 60) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+async def fire(url: str, total: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=600) as client:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, json={"text": "make this clearer"})
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "elapsed": elapsed,
+        "throughput": total / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "errors": errors,
+    }
+
+
+def run_server(cmd, port, env, url, args) -> dict:
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        asyncio.run(fire(url, min(args.concurrency, 20), min(args.concurrency, 20)))  # warm up
+        return asyncio.run(fire(url, args.requests, args.concurrency))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--llm-delay", type=float, default=2.0, help="fake LLM latency in seconds")
+    parser.add_argument("--wsgi-workers", type=int, default=4)
+    parser.add_argument("--wsgi-threads", type=int, default=1)
+    parser.add_argument("--asgi-workers", type=int, default=1)
+    args = parser.parse_args()
+
+    llm_port = free_port()
+    start_fake_llm(llm_port, args.llm_delay)
+
+    env = dict(os.environ)
+    env.update({
+        "LLM_BASE_URL": f"http://127.0.0.1:{llm_port}",
+        "OPEN_ROUTER_API_KEY": env.get("OPEN_ROUTER_API_KEY", "bench"),
+        "SECRET_KEY": env.get("SECRET_KEY", "bench"),
+        # Let the server model, not the gateway limit, decide the concurrency
+        "LLM_MAX_CONCURRENCY": str(args.concurrency * 2),
+        "LLM_POOL_SIZE": str(args.concurrency * 2),
+        "LLM_QUEUE_TIMEOUT": "600",
+    })
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, fake LLM latency {args.llm_delay}s")
+
+    port = free_port()
+    wsgi = run_server(
+        [sys.executable, "-m", "gunicorn", "NoteCraft_backend.wsgi:application",
+         "--bind", f"127.0.0.1:{port}", "--workers", str(args.wsgi_workers),
+         "--threads", str(args.wsgi_threads), "--timeout", "600"],
+        port, env, f"http://127.0.0.1:{port}/modify_text/", args)
+
+    port = free_port()
+    asgi = run_server(
+        [sys.executable, "-m", "uvicorn", "NoteCraft_backend.asgi:application",
+         "--host", "127.0.0.1", "--port", str(port), "--workers", str(args.asgi_workers),
+         "--log-level", "warning"],
+        port, env, f"http://127.0.0.1:{port}/async/modify_text/", args)
+
+    label_wsgi = f"WSGI gunicorn {args.wsgi_workers}w x {args.wsgi_threads}t"
+    label_asgi = f"ASGI uvicorn {args.asgi_workers}w"
+    for label, result in ((label_wsgi, wsgi), (label_asgi, asgi)):
+        print(f"{label:<28} {result['throughput']:8.1f} req/s  "
+              f"p50 {result['p50']:6.2f}s  p95 {result['p95']:6.2f}s  "
+              f"total {result['elapsed']:6.1f}s  errors {result['errors']}")
+
+
+if __name__ == "__main__":
+    main()
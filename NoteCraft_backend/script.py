@@ -2,6 +2,7 @@ from dotenv import load_dotenv
 import os
 from pinecone import Pinecone
 import time
+from NoteMaker.namespaces import NAMESPACES
 
 load_dotenv()
 
@@ -11,56 +12,8 @@ index_name = "notecraft"
 
 index = pc.Index(index_name)
 
-# Define Golden Spatula (TFT) Namespaces
-namespaces = {
-    "compositions": [
-        "meta_comps",
-        "reroll_comps",
-        "fast_8_comps",
-        "level_9_comps",
-        "early_game_boards"
-    ],
-    "items": [
-        "item_combinations",
-        "radiant_items",
-        "artifact_items",
-        "support_items",
-        "best_in_slot"
-    ],
-    "champions": [
-        "1_cost_units",
-        "2_cost_units",
-        "3_cost_units",
-        "4_cost_units",
-        "5_cost_units",
-        "hero_augments"
-    ],
-    "traits": [
-        "origin_traits",
-        "class_traits",
-        "trait_breakpoints",
-        "spatula_emblems"
-    ],
-    "augments": [
-        "silver_augments",
-        "gold_augments",
-        "prismatic_augments",
-        "hero_augments"
-    ],
-    "game_mechanics": [
-        "leveling_guide",
-        "economy_management",
-        "rolling_odds",
-        "pool_sizes",
-        "damage_calculation"
-    ],
-    "patch_notes": [
-        "buffs",
-        "nerfs",
-        "system_changes",
-        "reworks"
-    ]
-}
+# Define Golden Spatula (TFT) Namespaces (shared with the app, see NoteMaker/namespaces.py)
+namespaces = NAMESPACES
 
 def seed_initial_data():
     """
@@ -137,6 +137,13 @@ def main():
     # 4. 遍历处理
     for json_file in json_files:
         process_file(json_file)
+
+    # 5. 删除源文件已不存在的 Chunk 文件，增量索引才会把其中的 Chunk 视为已删除
+    expected = {f"{json_file.stem}_chunked.json" for json_file in json_files}
+    for stale_file in OUTPUT_DIR.glob("*_chunked.json"):
+        if stale_file.name not in expected:
+            stale_file.unlink()
+            print(f"已删除过期文件: {stale_file.name}")
         
     print("-" * 50)
     print("所有文件处理完成。")
@@ -1,6 +1,6 @@
 import json
-import time
 import os
+import sys
 from pathlib import Path
 from pinecone import Pinecone
 from dotenv import load_dotenv
@@ -14,6 +14,10 @@ load_dotenv(PROJECT_ROOT / ".env")
 # 从环境变量获取 API Key
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 
+# 复用后端的批量 Embedding 执行器与本地 Embedding 存储 (按 sha256(text) + 模型 + input_type 去重)
+sys.path.insert(0, str(PROJECT_ROOT / "NoteCraft_backend"))
+from NoteMaker.embedding_executor import EmbeddingExecutor
+
 # 使用的模型，必须是 Pinecone 支持的模型
 MODEL_NAME = "llama-text-embed-v2" 
 
@@ -23,7 +27,7 @@ INPUT_DIR = PROJECT_ROOT / "datas" / "ChunkedData"
 # 输出：Embedding 后的数据目录
 OUTPUT_DIR = PROJECT_ROOT / "datas" / "EmbeddedData"
 
-def process_file(pc, file_path):
+def process_file(executor, file_path):
     """
     处理单个 JSON 文件进行 Embedding
     """
@@ -42,37 +46,25 @@ def process_file(pc, file_path):
         print("  -> 数据为空，跳过。")
         return
 
-    # 批量处理 (为了提高效率和避免速率限制)
-    batch_size = 10  # 每次处理 10 条
-    
-    for i in range(0, total_items, batch_size):
-        batch_items = items[i : i + batch_size]
-        
-        # 提取当前批次的文本列表
-        texts_to_embed = [item['metadata']['text'] for item in batch_items]
-        
-        try:
-            # 调用 Pinecone Inference API
-            # input_type="passage" 表示我们要存储的是文档段落
-            embeddings = pc.inference.embed(
-                model=MODEL_NAME,
-                inputs=texts_to_embed,
-                parameters={"input_type": "passage"}
-            )
-            
-            # 将生成的向量填回对应的 item
-            for j, embedding_obj in enumerate(embeddings):
-                # embedding_obj['values'] 是向量数组
-                batch_items[j]['values'] = embedding_obj['values']
-                
-            print(f"  -> 进度: {min(i + batch_size, total_items)}/{total_items}")
-            
-            # 简单的速率限制保护，避免触发 API 限制
-            time.sleep(0.2) 
-
-        except Exception as e:
-            print(f"  -> 批次处理出错 (索引 {i} - {i+batch_size}): {e}")
-            # 可以在这里选择是否跳过或停止
+    # 已在本地 Embedding 存储中的文本不再调用 API；
+    # 其余文本按最大批次并发调用，并受令牌桶限速保护
+    texts_to_embed = [item['metadata']['text'] for item in items]
+    requests_before = executor.requests
+    hits_before = executor.store_hits
+    try:
+        embeddings = executor.embed(
+            texts_to_embed, "passage",
+            on_progress=lambda done, total: print(f"  -> 进度: {done}/{total} (新 Embedding)")
+        )
+    except Exception as e:
+        print(f"  -> Embedding 出错，已完成的批次已写入本地存储，重新运行即可续传: {e}")
+        return
+
+    # 将生成的向量填回对应的 item
+    for item, values in zip(items, embeddings):
+        item['values'] = values
+    print(f"  -> 命中本地存储 {executor.store_hits - hits_before} 条，"
+          f"调用 API {executor.requests - requests_before} 次")
 
     # 准备保存路径
     # 例如: opgg_tft_items_chunked.json -> opgg_tft_items_chunked_embedded.json
@@ -93,6 +85,7 @@ def main():
         return
         
     pc = Pinecone(api_key=PINECONE_API_KEY)
+    executor = EmbeddingExecutor(pc, model=MODEL_NAME)
     print(f"正在使用模型: {MODEL_NAME}")
 
     # 2. 检查输入目录
@@ -113,9 +106,10 @@ def main():
 
     # 4. 遍历处理
     for json_file in json_files:
-        process_file(pc, json_file)
+        process_file(executor, json_file)
         
     print("-" * 50)
+    print(f"本次共调用 Embedding API {executor.requests} 次，新生成 {executor.embedded} 条，命中本地存储 {executor.store_hits} 条。")
     print("所有文件处理完成。")
     print("现在你可以使用 UpsertItemsScript.py 将这些文件上传到 Pinecone。")
 
@@ -0,0 +1,90 @@
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+# --- 配置部分 ---
+# 优先计算路径以加载 .env
+SCRIPT_DIR = Path(__file__).parent
+PROJECT_ROOT = SCRIPT_DIR.parent.parent
+load_dotenv(PROJECT_ROOT / ".env")
+
+# 复用后端的增量索引 (清单: parent_id -> chunk id + 文本哈希)、批量 Embedding 执行器与 VectorStore
+sys.path.insert(0, str(PROJECT_ROOT / "NoteCraft_backend"))
+from NoteMaker.embedding_executor import EmbeddingExecutor
+from NoteMaker.incremental_index import INDEX_MANIFEST_PATH, reindex
+from NoteMaker.vector_store import INDEX_NAME, VECTOR_STORE_BACKEND, clean_metadata, to_ascii_id
+
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+if VECTOR_STORE_BACKEND != "local" and not PINECONE_API_KEY:
+    raise SystemExit("错误: 未在项目根目录的 .env 中找到 PINECONE_API_KEY，请添加后重试 (或设置 VECTOR_STORE_BACKEND=local)。")
+
+# 使用的模型，必须与 EmbedItemsScript.py 一致
+MODEL_NAME = "llama-text-embed-v2"
+
+# 输入目录 (Chunk 脚本生成的输出目录)，其内容视为默认 namespace 的完整数据
+INPUT_DIR = PROJECT_ROOT / "datas" / "ChunkedData"
+NAMESPACE = ""
+
+def load_vectors():
+    """
+    读取所有 Chunk 文件，构建与 UpsertItemsScript 相同的 ID 与元数据
+    """
+    vectors = {}
+    for file_path in sorted(INPUT_DIR.glob("*.json")):
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            # 读取失败时终止：否则该文件的 Chunk 会被当作已删除
+            raise SystemExit(f"错误: 读取文件失败 {file_path}: {e}")
+
+        items = data.get("vectors", [])
+        print(f"读取文件: {file_path.name} ({len(items)} 条)")
+        for item in items:
+            original_id = item['id']
+            cleaned_meta = clean_metadata(item.get('metadata', {}))
+            cleaned_meta['original_id'] = original_id
+            ascii_id = to_ascii_id(original_id)
+            vectors[ascii_id] = {"id": ascii_id, "metadata": cleaned_meta}
+    return list(vectors.values())
+
+def main():
+    # 1. 检查输入目录
+    if not INPUT_DIR.exists() or not list(INPUT_DIR.glob("*.json")):
+        print(f"错误: 输入目录不存在或为空 {INPUT_DIR}")
+        print("请先运行 ChunkedItemsScript.py 生成数据。")
+        return
+
+    # 2. 初始化 Embedding 执行器 (只有新增/修改的文本才会调用 API)
+    pc = None
+    if PINECONE_API_KEY:
+        from pinecone import Pinecone
+        pc = Pinecone(api_key=PINECONE_API_KEY)
+    executor = EmbeddingExecutor(pc, model=MODEL_NAME)
+
+    print(f"索引: {INDEX_NAME} (后端: {VECTOR_STORE_BACKEND})，清单: {INDEX_MANIFEST_PATH}")
+    vectors = load_vectors()
+    print(f"共 {len(vectors)} 个 Chunk，开始与清单比对...")
+    print("-" * 50)
+
+    # 3. 只对差异部分 Embedding + Upsert，并删除已不存在的 Chunk
+    start_time = time.time()
+    try:
+        diff = reindex(
+            vectors, namespace=NAMESPACE, embedder=executor,
+            on_progress=lambda done, total: print(f"  -> 进度: {done}/{total} (新 Embedding)")
+        )
+    except Exception as e:
+        print(f"增量索引失败 (清单未更新，重新运行即可，已生成的 Embedding 会命中本地存储): {e}")
+        sys.exit(1)
+
+    print("-" * 50)
+    print(f"新增 {len(diff.added)} 条，修改 {len(diff.changed)} 条，删除 {len(diff.removed)} 条，未变化 {diff.unchanged} 条。")
+    print(f"调用 Embedding API {executor.requests} 次，新生成 {executor.embedded} 条，命中本地存储 {executor.store_hits} 条。")
+    print(f"增量索引完成 (耗时 {time.time() - start_time:.2f}s)。")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import os
+import sys
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+# --- 配置部分 ---
+# 优先计算路径以加载 .env
+SCRIPT_DIR = Path(__file__).parent
+PROJECT_ROOT = SCRIPT_DIR.parent.parent
+load_dotenv(PROJECT_ROOT / ".env")
+
+# 复用后端的 HybridVectorStore：把 Pinecone 中的热点 namespace 完整复制到本地镜像
+sys.path.insert(0, str(PROJECT_ROOT / "NoteCraft_backend"))
+from NoteMaker.vector_store import INDEX_NAME, LOCAL_VECTOR_NAMESPACES, get_vector_store
+
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+if not PINECONE_API_KEY:
+    raise SystemExit("错误: 未在项目根目录的 .env 中找到 PINECONE_API_KEY，请添加后重试。")
+
+def main():
+    # 命令行参数可指定 namespace，默认同步 LOCAL_VECTOR_NAMESPACES 中的全部
+    namespaces = sys.argv[1:] or LOCAL_VECTOR_NAMESPACES
+    store = get_vector_store("hybrid")
+    print(f"索引: {INDEX_NAME}，待同步 namespace: {', '.join(namespaces)}")
+    print("-" * 50)
+
+    for namespace in namespaces:
+        if namespace not in store.local_namespaces:
+            print(f"跳过 {namespace}: 不在 LOCAL_VECTOR_NAMESPACES 中，查询不会走本地镜像。")
+            continue
+        start_time = time.time()
+        try:
+            count = store.backfill(namespace)
+        except Exception as e:
+            # 失败时不会写入同步标记，查询继续走 Pinecone
+            print(f"同步 {namespace} 失败 (查询仍走 Pinecone，重新运行即可): {e}")
+            continue
+        print(f"同步 {namespace} 完成: {count} 条向量 (耗时 {time.time() - start_time:.2f}s)，之后的查询走本地镜像。")
+
+    print("-" * 50)
+    print("注意: 使用其他后端 (VECTOR_STORE_BACKEND=pinecone) 写入后，需要重新运行本脚本。")
+
+if __name__ == "__main__":
+    main()
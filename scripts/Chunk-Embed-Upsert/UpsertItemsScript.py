@@ -1,8 +1,8 @@
 import json
 import time
 import os
+import sys
 from pathlib import Path
-from pinecone import Pinecone
 from dotenv import load_dotenv
 
 # --- 配置部分 ---
@@ -11,72 +11,23 @@ SCRIPT_DIR = Path(__file__).parent
 PROJECT_ROOT = SCRIPT_DIR.parent.parent
 load_dotenv(PROJECT_ROOT / ".env")
 
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-if not PINECONE_API_KEY:
-    raise SystemExit("错误: 未在项目根目录的 .env 中找到 PINECONE_API_KEY，请添加后重试。")
+# 复用后端的 VectorStore 抽象 (Pinecone / 本地 NumPy 索引)
+sys.path.insert(0, str(PROJECT_ROOT / "NoteCraft_backend"))
+from NoteMaker.vector_store import INDEX_NAME, VECTOR_STORE_BACKEND, clean_metadata, get_vector_store, to_ascii_id
+from NoteMaker.incremental_index import get_manifest
+from NoteMaker.lexical_index import get_lexical_index
+from NoteMaker.kb_version import bump_kb_version
 
-# 你的 Index 名称
-INDEX_NAME = "teamfight-tactics-knowledges"
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+if VECTOR_STORE_BACKEND != "local" and not PINECONE_API_KEY:
+    raise SystemExit("错误: 未在项目根目录的 .env 中找到 PINECONE_API_KEY，请添加后重试 (或设置 VECTOR_STORE_BACKEND=local)。")
 
 # 输入目录 (Embed 脚本生成的输出目录)
 INPUT_DIR = PROJECT_ROOT / "datas" / "EmbeddedData"
 
-def clean_metadata(metadata):
+def process_file(index, lexical_index, file_path):
     """
-    清洗元数据：
-    1. 将 dict 或 list (非纯字符串列表) 序列化为 JSON 字符串，以满足 Pinecone 要求。
-    2. 动态遍历所有字段，尝试将看起来像数字的字符串转换为 float 或 int。
-    3. 处理 None 值。
-    """
-    cleaned = metadata.copy()
-    
-    for key, value in cleaned.items():
-        # 1. 处理复杂类型 (dict, list) -> JSON String
-        # Pinecone 元数据只支持 str, int, float, bool, list[str]
-        if isinstance(value, (dict, list)):
-            # 如果是 list，检查是否为纯字符串列表 (Pinecone 支持 list[str])
-            if isinstance(value, list) and all(isinstance(x, str) for x in value):
-                pass # 允许 list[str]
-            else:
-                # 其他情况 (dict, 或包含非字符串的 list) 统统转为 JSON 字符串
-                cleaned[key] = json.dumps(value, ensure_ascii=False)
-
-        # 2. 处理字符串 (尝试转数字)
-        elif isinstance(value, str):
-            # 0. 检查特殊含义符号
-            is_percent = '%' in value
-            
-            # 1. 预处理：移除常见的非数字字符 (%, #, ,)
-            clean_val = value.replace('%', '').replace('#', '').replace(',', '').strip()
-            
-            # 2. 尝试转换
-            try:
-                # 优先尝试转为 float
-                float_val = float(clean_val)
-                
-                # 如果原值包含%，则数值除以 100
-                if is_percent:
-                    float_val = float_val / 100.0
-                
-                # 3. 优化：如果是整数，转为 int
-                if float_val.is_integer():
-                    cleaned[key] = int(float_val)
-                else:
-                    # 保留一定精度
-                    cleaned[key] = round(float_val, 6)
-            except ValueError:
-                # 转换失败保留原样
-                pass
-        
-        # 3. 额外安全检查：Pinecone 不支持 None/Null 值
-        elif value is None:
-            cleaned[key] = ""
-
-    return cleaned
-
-def process_file(index, file_path):
-    """
-    读取单个文件并上传数据到 Pinecone
+    读取单个文件并上传数据到向量库，同时写入本地 BM25 倒排索引
     """
     print(f"正在处理文件: {file_path.name}")
     try:
@@ -108,7 +59,7 @@ def process_file(index, file_path):
         original_id = item['id']
         # 将非 ASCII 字符转换为 Python 的 unicode escape 序列 (例如 \u9b3c)
         # 这样既满足 Pinecone 的 ASCII 要求，又保留了原始 ID 的信息
-        ascii_id = original_id.encode('unicode_escape').decode('ascii')
+        ascii_id = to_ascii_id(original_id)
         
         # 清洗元数据
         cleaned_meta = clean_metadata(item.get('metadata', {}))
@@ -128,6 +79,10 @@ def process_file(index, file_path):
         if len(vectors_to_upsert) >= batch_size or i == total_items - 1:
             try:
                 index.upsert(vectors=vectors_to_upsert)
+                # 倒排索引与向量使用相同的 ASCII ID 和清洗后的元数据，便于 RRF 融合
+                lexical_index.add_documents(vectors_to_upsert)
+                # 记录到增量索引清单，之后可用 IncrementalIndexScript.py 只同步变化部分
+                get_manifest().record(vectors_to_upsert)
                 print(f"  -> 已上传批次: {i - len(vectors_to_upsert) + 1} 到 {i} (共 {len(vectors_to_upsert)} 条)")
                 vectors_to_upsert = [] # 清空列表
                 time.sleep(0.2) # 稍微暂停，避免过于频繁请求
@@ -137,13 +92,11 @@ def process_file(index, file_path):
     print(f"  -> 文件 {file_path.name} 处理完成。\n")
 
 def main():
-    # 1. 初始化 Pinecone 客户端
-    pc = Pinecone(api_key=PINECONE_API_KEY)
-    
+    # 1. 初始化向量库 (由 VECTOR_STORE_BACKEND 决定后端)
     # 2. 连接到索引
-    print(f"正在连接到索引: {INDEX_NAME}...")
+    print(f"正在连接到索引: {INDEX_NAME} (后端: {VECTOR_STORE_BACKEND})...")
     try:
-        index = pc.Index(INDEX_NAME)
+        index = get_vector_store()
         # 简单检查索引状态
         stats = index.describe_index_stats()
         print(f"索引状态: {stats}")
@@ -167,9 +120,14 @@ def main():
     print(f"开始批量上传... 共找到 {len(json_files)} 个文件")
     print("-" * 50)
 
-    # 5. 遍历处理每个文件
-    for json_file in json_files:
-        process_file(index, json_file)
+    # 5. 遍历处理每个文件 (本地后端和倒排索引在结束时统一落盘)
+    lexical_index = get_lexical_index()
+    with index.deferred_save(), lexical_index.deferred_save():
+        for json_file in json_files:
+            process_file(index, lexical_index, json_file)
+
+    # 通知后端缓存知识库已变化
+    bump_kb_version()
 
     print("-" * 50)
     print("所有数据上传完成！")
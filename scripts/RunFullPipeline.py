@@ -1,4 +1,5 @@
-﻿import subprocess
+﻿import argparse
+import subprocess
 import sys
 import time
 from pathlib import Path
@@ -14,6 +15,8 @@ SUB_SCRIPT_DIR = CURRENT_DIR / "Chunk-Embed-Upsert"
 SCRIPT_CHUNK = SUB_SCRIPT_DIR / "ChunkedItemsScript.py"
 SCRIPT_EMBED = SUB_SCRIPT_DIR / "EmbedItemsScript.py"
 SCRIPT_UPSERT = SUB_SCRIPT_DIR / "UpsertItemsScript.py"
+# 增量模式: 只对新增/修改的 Chunk Embedding + Upsert，并删除已不存在的 Chunk
+SCRIPT_INCREMENTAL = SUB_SCRIPT_DIR / "IncrementalIndexScript.py"
 
 def run_step(script_path, step_name):
     """
@@ -56,12 +59,23 @@ def run_step(script_path, step_name):
         sys.exit(1)
 
 def main():
-    print(f"启动全量数据处理流水线...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--incremental", action="store_true", help="只同步与上次索引相比变化的 Chunk")
+    args = parser.parse_args()
+
+    print(f"启动{'增量' if args.incremental else '全量'}数据处理流水线...")
     print(f"工作目录: {CURRENT_DIR}")
     
     # 1. Chunking (切分)
     # 将 OriginData -> ChunkedData
     run_step(SCRIPT_CHUNK, "1. 数据切分 (Chunking)")
+
+    if args.incremental:
+        # 2. 与索引清单比对，Embedding + Upsert 差异部分，删除过期向量
+        run_step(SCRIPT_INCREMENTAL, "2. 增量索引 (Diff + Embed + Upsert)")
+        print("\n" + "#"*60)
+        print(" 增量同步完成，向量库已与 ChunkedData 保持一致。")
+        return
     
     # 2. Embedding (向量化)
     # 将 ChunkedData -> EmbeddedData (调用 Pinecone Inference)